@@ -0,0 +1,25 @@
+"""
+Standalone benchmarks for the vending machine API.
+
+Each module is run as ``python -m benchmarks.<name>`` from the project root.
+They work against a scratch SQLite database, never the project's db.sqlite3.
+"""
+import os
+import tempfile
+
+
+def setup(db_name=None):
+    """Configure Django against a freshly migrated scratch database."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vending_machine_api.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from django.conf import settings
+    path = db_name or os.path.join(tempfile.mkdtemp(prefix='vending-bench-'), 'db.sqlite3')
+    settings.DATABASES['default']['NAME'] = path
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return path
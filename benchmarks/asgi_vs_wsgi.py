@@ -0,0 +1,202 @@
+"""
+Requests/sec and latency of the WSGI and ASGI applications.
+
+The applications are driven in-process, without a server or sockets, so
+the numbers compare Django's two request paths rather than uvicorn with
+gunicorn:
+
+- wsgi: the sync DRF views, with `--concurrency` worker threads,
+- asgi-sync: the same sync views through the ASGI handler,
+- asgi: the async-native views under /api/async/, with `--concurrency`
+  requests in flight on one event loop.
+
+    python -m benchmarks.asgi_vs_wsgi --scenario detail --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from . import setup
+
+SCENARIOS = {
+    # name: (method, sync path, async path, body)
+    'list': ('GET', '/api/products/?page_size=20', '/api/async/products/?page_size=20', None),
+    'detail': ('GET', '/api/products/{pk}/', '/api/async/products/{pk}/', None),
+    'user': ('GET', '/api/users/{user}/', '/api/async/users/{user}/', None),
+    'deposit': ('POST', '/api/users/deposit/', '/api/async/users/deposit/', {'deposit': 5}),
+}
+
+
+def seed(products):
+    from products.models import Product
+    from users.authentication import UserClaimsRefreshToken
+    from users.models import CustomUser
+
+    seller = CustomUser.objects.create(username='seller', role='seller')
+    buyer = CustomUser.objects.create(username='buyer', role='buyer')
+    Product.objects.bulk_create(
+        Product(productName=f'Product {i}', amountAvailable=100, cost=5, sellerId=seller)
+        for i in range(products)
+    )
+    token = str(UserClaimsRefreshToken.for_user(buyer).access_token)
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    return buyer.id, token, product_ids
+
+
+def split(path):
+    path, _, query = path.partition('?')
+    return path, query
+
+
+def wsgi_request(app, method, path, token, body):
+    path, query = split(path)
+    payload = json.dumps(body).encode() if body is not None else b''
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': BytesIO(payload),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': BytesIO(),
+    }
+    if token:
+        environ['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    statuses = []
+    chunks = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(chunks)
+    finally:
+        chunks.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_request(app, method, path, token, body):
+    path, query = split(path)
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'authorization', f'Bearer {token}'.encode()),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    received = False
+    statuses = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        # Never disconnect; Django cancels this wait once it has responded
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    await app(scope, receive, send)
+    return statuses[0]
+
+
+def report(mode, latencies, elapsed, errors):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return {
+        'mode': mode,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': p99 * 1000,
+        'errors': errors,
+    }
+
+
+def run_wsgi(requests, concurrency, make_request):
+    from vending_machine_api.wsgi import application
+
+    def timed(args):
+        started = time.perf_counter()
+        code = wsgi_request(application, *args)
+        return time.perf_counter() - started, code >= 400
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, [make_request(True) for _ in range(requests)]))
+    elapsed = time.perf_counter() - started
+    return report('wsgi', [r[0] for r in results], elapsed, sum(r[1] for r in results))
+
+
+def run_asgi(mode, requests, concurrency, make_request):
+    from django.core.asgi import get_asgi_application
+    application = get_asgi_application()
+    native = mode == 'asgi'
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(args):
+            async with semaphore:
+                started = time.perf_counter()
+                code = await asgi_request(application, *args)
+                return time.perf_counter() - started, code >= 400
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(timed(make_request(not native)) for _ in range(requests)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(main())
+    return report(mode, [r[0] for r in results], elapsed, sum(r[1] for r in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS, default='detail')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--products', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+    user_id, token, product_ids = seed(args.products)
+    method, sync_path, async_path, body = SCENARIOS[args.scenario]
+
+    def make_request(sync):
+        path = sync_path if sync else async_path
+        return method, path.format(pk=random.choice(product_ids), user=user_id), token, body
+
+    results = [
+        run_wsgi(args.requests, args.concurrency, make_request),
+        run_asgi('asgi-sync', args.requests, args.concurrency, make_request),
+        run_asgi('asgi', args.requests, args.concurrency, make_request),
+    ]
+    for result in results:
+        print(
+            f"{result['mode']:>10}: {result['requests_per_sec']:8.1f} req/s  "
+            f"p50={result['p50_ms']:7.2f}ms  p99={result['p99_ms']:7.2f}ms  errors={result['errors']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
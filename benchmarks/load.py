@@ -0,0 +1,233 @@
+"""
+Weighted load against the real URL routes, with per-call latency and
+query counts.
+
+Requests go through the WSGI application in-process (see asgi_vs_wsgi),
+from `--concurrency` threads, each call picked by weight from the mix:
+
+- login: POST /api/users/login/ as a random seeded buyer,
+- list: GET /api/products/?page_size=20,
+- detail: GET /api/products/<id>/ for a random product,
+- deposit: POST /api/users/deposit/ with a random coin,
+- buy: POST /api/users/buy/ for one unit of a random product.
+
+Data comes from `manage.py seed_data`, either into a scratch database or
+an existing one passed with `--db`. Results are printed and written as
+JSON, keyed by the current git commit, so runs can be compared with
+`--baseline`.
+
+    python -m benchmarks.load --mix login=1,list=5,detail=10,deposit=2,buy=2
+    python -m benchmarks.load --db /tmp/seeded.sqlite3 --baseline results/load-abc1234.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from . import setup
+from .asgi_vs_wsgi import wsgi_request
+
+DEFAULT_MIX = 'login=1,list=5,detail=10,deposit=2,buy=2'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'unknown call {name!r}; choose from {", ".join(SCENARIOS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def login(data, rng):
+    buyer = rng.choice(data['buyers'])
+    return 'POST', '/api/users/login/', None, {'username': buyer['username'], 'password': data['password']}
+
+
+def product_list(data, rng):
+    return 'GET', '/api/products/?page_size=20', rng.choice(data['buyers'])['token'], None
+
+
+def product_detail(data, rng):
+    product_id = rng.randint(*data['products'])
+    return 'GET', f'/api/products/{product_id}/', rng.choice(data['buyers'])['token'], None
+
+
+def deposit(data, rng):
+    from machines.models import COINS
+    return 'POST', '/api/users/deposit/', rng.choice(data['buyers'])['token'], {'deposit': rng.choice(COINS)}
+
+
+def buy(data, rng):
+    product_id = rng.randint(*data['products'])
+    return 'POST', '/api/users/buy/', rng.choice(data['buyers'])['token'], {'productId': product_id, 'amount': 1}
+
+
+SCENARIOS = {
+    'login': login,
+    'list': product_list,
+    'detail': product_detail,
+    'deposit': deposit,
+    'buy': buy,
+}
+
+
+def load_data(sample, password):
+    """Pick `sample` seeded buyers and issue each an access token."""
+    from django.db.models import Max, Min
+    from products.models import Product
+    from users.authentication import UserClaimsRefreshToken
+    from users.models import CustomUser
+
+    bounds = CustomUser.objects.filter(role='buyer').aggregate(low=Min('pk'), high=Max('pk'))
+    products = Product.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None or products['low'] is None:
+        raise SystemExit('No buyers or products to load; run manage.py seed_data first.')
+    # Random ids rather than ORDER BY RANDOM(), which scans every row
+    rng = random.Random(0)
+    ids = {rng.randint(bounds['low'], bounds['high']) for _ in range(sample * 2)}
+    buyers = [
+        {'username': user.username, 'token': str(UserClaimsRefreshToken.for_user(user).access_token)}
+        for user in CustomUser.objects.filter(pk__in=ids, role='buyer')[:sample]
+    ]
+    return {'buyers': buyers, 'products': (products['low'], products['high']), 'password': password}
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarise(samples, elapsed):
+    latencies = sorted(sample['latency'] for sample in samples)
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'requests_per_sec': len(samples) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries_per_request': sum(sample['queries'] for sample in samples) / len(samples),
+        'statuses': statuses,
+        'errors': sum(1 for sample in samples if sample['status'] >= 500),
+    }
+
+
+def run(data, mix, requests, concurrency):
+    from django.db import connection
+    from vending_machine_api.wsgi import application
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    local = threading.local()
+
+    def count_queries(execute, sql, params, many, context):
+        local.queries += 1
+        return execute(sql, params, many, context)
+
+    def call(seed):
+        rng = random.Random(seed)
+        name = rng.choices(names, weights)[0]
+        method, path, token, body = SCENARIOS[name](data, rng)
+        local.queries = 0
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            code = wsgi_request(application, method, path, token, body)
+        return {'call': name, 'latency': time.perf_counter() - started, 'status': code, 'queries': local.queries}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    by_call = {}
+    for sample in samples:
+        by_call.setdefault(sample['call'], []).append(sample)
+    return {
+        'total': summarise(samples, elapsed),
+        'calls': {name: summarise(by_call[name], elapsed) for name in names if name in by_call},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_results(results, baseline=None):
+    rows = [('total', results['total'])] + list(results['calls'].items())
+    for name, result in rows:
+        line = (
+            f"{name:>8}: {result['requests_per_sec']:8.1f} req/s  p50={result['p50_ms']:7.2f}ms  "
+            f"p95={result['p95_ms']:7.2f}ms  p99={result['p99_ms']:7.2f}ms  "
+            f"queries={result['queries_per_request']:5.2f}  errors={result['errors']}"
+        )
+        previous = baseline and (baseline['total'] if name == 'total' else baseline['calls'].get(name))
+        if previous:
+            line += (
+                f"  ({result['requests_per_sec'] / previous['requests_per_sec'] - 1:+.0%} req/s, "
+                f"{result['p95_ms'] / previous['p95_ms'] - 1:+.0%} p95)"
+            )
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help=f'call=weight,... (default: {DEFAULT_MIX})')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--db', help='an existing seeded SQLite database; seeds a scratch one if omitted')
+    parser.add_argument('--buyers', type=int, default=10000, help='buyers to seed into a scratch database')
+    parser.add_argument('--products', type=int, default=10000, help='products to seed into a scratch database')
+    parser.add_argument('--sample', type=int, default=200, help='buyers the load is spread over')
+    parser.add_argument('--password', default='password123', help='password the buyers were seeded with')
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/load-<commit>.json)')
+    parser.add_argument('--baseline', help='earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    setup(args.db)
+    # Refused purchases are part of the mix; don't log every 4xx
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    if not args.db:
+        from django.core.management import call_command
+        call_command(
+            'seed_data', buyers=args.buyers, sellers=max(1, args.buyers // 100), products=args.products,
+            password=args.password, stdout=open(os.devnull, 'w'),
+        )
+    data = load_data(args.sample, args.password)
+    results = run(data, args.mix, args.requests, args.concurrency)
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        **results,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'results', f'load-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {output}')
+
+
+if __name__ == '__main__':
+    main()
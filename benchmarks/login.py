@@ -0,0 +1,91 @@
+"""
+Logins per second against the number of password hashing threads.
+
+Drives the sync /api/users/login/ through the WSGI application with
+`--concurrency` threads, then /api/async/users/login/ through the ASGI
+application with `--concurrency` logins in flight and each pool size in
+`--workers`. Every login checks a real PBKDF2 hash at the configured
+PASSWORD_HASHER_ITERATIONS, so expect the async rate to grow with the pool
+up to the number of cores, and no further.
+
+    python -m benchmarks.login --workers 1,2,4,8 --logins 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import random
+from unittest.mock import patch
+
+from . import setup
+from .asgi_vs_wsgi import asgi_request, report, run_wsgi
+
+PASSWORD = 'benchmark-password'
+
+
+def seed(users):
+    from django.contrib.auth.hashers import make_password
+    from users.models import CustomUser
+
+    # One hash shared by every user: checking it costs the same, seeding doesn't
+    encoded = make_password(PASSWORD)
+    CustomUser.objects.bulk_create(
+        CustomUser(username=f'buyer{i}', password=encoded, role='buyer') for i in range(users)
+    )
+    return [f'buyer{i}' for i in range(users)]
+
+
+def run_async(workers, logins, concurrency, make_request):
+    from django.core.asgi import get_asgi_application
+    from users.passwords import HashingPool
+    application = get_asgi_application()
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(args):
+            async with semaphore:
+                started = loop.time()
+                code = await asgi_request(application, *args)
+                return loop.time() - started, code >= 400
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await asyncio.gather(*(timed(make_request('/api/async/users/login/')) for _ in range(logins)))
+        return results, loop.time() - started
+
+    with patch('users.passwords._pool', HashingPool(workers, concurrency)):
+        results, elapsed = asyncio.run(main())
+    return report(f'async x{workers}', [r[0] for r in results], elapsed, sum(r[1] for r in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4,8', help='Comma separated hashing pool sizes (default: 1,2,4,8).')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    # The write cap would refuse part of the storm
+    settings.MAX_CONCURRENT_WRITES = args.concurrency
+    usernames = seed(args.users)
+
+    def make_request(path):
+        return 'POST', path, '', {'username': random.choice(usernames), 'password': PASSWORD}
+
+    from django.contrib.auth.hashers import get_hasher
+    print(f'{os.cpu_count()} cores, {get_hasher().algorithm} with {get_hasher().iterations} iterations')
+    results = [run_wsgi(args.logins, args.concurrency, lambda sync: make_request('/api/users/login/'))]
+    for workers in (int(n) for n in args.workers.split(',')):
+        results.append(run_async(workers, args.logins, args.concurrency, make_request))
+    for result in results:
+        print(
+            f"{result['mode']:>10}: {result['requests_per_sec']:8.1f} logins/s  "
+            f"p50={result['p50_ms']:8.2f}ms  p99={result['p99_ms']:8.2f}ms  errors={result['errors']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Concurrent buyers hammering one product.
+
+Compares three ways of running a purchase:
+
+- racy: the original BuyView body (read, check in Python, save()),
+- locking: the same inside transaction.atomic() with select_for_update(),
+- guarded: users.purchase.purchase() (conditional UPDATEs).
+
+Stock is deliberately smaller than demand, so the report shows both
+throughput and how many units were sold that the stock never covered.
+
+    python -m benchmarks.purchase_contention --threads 8 --buys 200
+"""
+import argparse
+import threading
+import time
+
+from . import setup
+
+
+def racy_purchase(buyer_id, product_id, amount):
+    from products.models import Product
+    from users.models import CustomUser
+
+    product = Product.objects.get(pk=product_id)
+    buyer = CustomUser.objects.get(pk=buyer_id)
+    if amount > product.amountAvailable or buyer.deposit < product.cost * amount:
+        return False
+    buyer.deposit -= product.cost * amount
+    buyer.save()
+    product.amountAvailable -= amount
+    product.save()
+    return True
+
+
+def locking_purchase(buyer_id, product_id, amount):
+    from django.db import transaction
+    from products.models import Product
+    from users.models import CustomUser
+
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        buyer = CustomUser.objects.select_for_update().get(pk=buyer_id)
+        if amount > product.amountAvailable or buyer.deposit < product.cost * amount:
+            return False
+        buyer.deposit -= product.cost * amount
+        buyer.save()
+        product.amountAvailable -= amount
+        product.save()
+    return True
+
+
+def guarded_purchase(buyer_id, product_id, amount):
+    from users.purchase import purchase, PurchaseError
+
+    try:
+        purchase(buyer_id, product_id, amount)
+    except PurchaseError:
+        return False
+    return True
+
+
+STRATEGIES = {
+    'racy': racy_purchase,
+    'locking': locking_purchase,
+    'guarded': guarded_purchase,
+}
+
+
+def run(strategy, threads, buys):
+    from django.db import OperationalError, connection
+    from products.models import Product
+    from users.models import CustomUser
+
+    Product.objects.all().delete()
+    CustomUser.objects.all().delete()
+    seller = CustomUser.objects.create(username='seller', role='seller')
+    stock = threads * buys // 2
+    product = Product.objects.create(productName='Cola', amountAvailable=stock, cost=1, sellerId=seller)
+    buyers = [
+        CustomUser.objects.create(username=f'buyer{i}', deposit=buys)
+        for i in range(threads)
+    ]
+
+    buy = STRATEGIES[strategy]
+    sold = [0] * threads
+    retries = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index, buyer_id):
+        barrier.wait()
+        try:
+            for _ in range(buys):
+                while True:
+                    try:
+                        if buy(buyer_id, product.id, 1):
+                            sold[index] += 1
+                        break
+                    except OperationalError:
+                        # SQLite lock upgrade failures surface immediately
+                        retries[index] += 1
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(i, b.id)) for i, b in enumerate(buyers)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    product.refresh_from_db()
+    units_sold = sum(sold)
+    return {
+        'strategy': strategy,
+        'ops_per_sec': threads * buys / elapsed,
+        'units_sold': units_sold,
+        'stock_taken': stock - product.amountAvailable,
+        'oversold': units_sold - (stock - product.amountAvailable),
+        'retries': sum(retries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--buys', type=int, default=200, help='purchases attempted per thread')
+    parser.add_argument('--strategy', choices=STRATEGIES, action='append')
+    args = parser.parse_args()
+
+    setup()
+    for strategy in args.strategy or STRATEGIES:
+        result = run(strategy, args.threads, args.buys)
+        print(
+            f"{result['strategy']:>8}: {result['ops_per_sec']:8.1f} ops/s  "
+            f"sold={result['units_sold']} taken={result['stock_taken']} "
+            f"oversold={result['oversold']} retries={result['retries']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Latency of products.search.search_products() on a large catalog.
+
+Seeds `--products` products with seed_data, then times each query in
+`--queries` `--repeat` times. With `--fallback` the substring matching
+used on backends without the FTS index is timed instead.
+
+    python -m benchmarks.search --products 300000
+"""
+import argparse
+import os
+import statistics
+import time
+from unittest.mock import patch
+
+from . import setup
+
+QUERIES = ['bench product 123', 'product 4567', 'bench 99', 'product', 'prod', 'be', 'nothing here']
+
+
+def run(queries, repeat, limit):
+    from products.search import search_products
+
+    for query in queries:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            found = search_products(query, limit)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(
+            f'{query!r:>22}: p50={statistics.median(timings) * 1e6:8.1f}us  '
+            f'p99={timings[int(len(timings) * 0.99)] * 1e6:8.1f}us  results={len(found)}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=300000)
+    parser.add_argument('--queries', nargs='+', default=QUERIES)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--fallback', action='store_true', help='time the substring fallback instead')
+    args = parser.parse_args()
+
+    setup()
+    from django.core.management import call_command
+    call_command(
+        'seed_data', buyers=0, sellers=100, products=args.products, stdout=open(os.devnull, 'w'),
+    )
+    if args.fallback:
+        with patch('products.search.has_search_index', return_value=False):
+            run(args.queries, args.repeat, args.limit)
+    else:
+        run(args.queries, args.repeat, args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Rows per second serialized into JSON for a list of products, through
+ProductSerializer and model instances, or through the values_list() fast
+path, each rendered with DRF's JSONRenderer and with FastJSONRenderer.
+
+    python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import os
+import time
+
+from . import setup
+
+
+def best_rate(rows, repeat, serialize):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        serialize()
+        best = min(best, time.perf_counter() - started)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from django.core.management import call_command
+    call_command('seed_data', buyers=0, sellers=100, products=args.rows, stdout=open(os.devnull, 'w'))
+
+    from rest_framework.renderers import JSONRenderer
+    from products.models import Product
+    from products.serializers import ProductSerializer
+    from products.stock import with_stock
+    from vending_machine_api.renderers import FastJSONRenderer
+
+    products = with_stock(Product.objects.order_by('id'))
+    representation = ProductSerializer.values_representation()
+
+    def instances():
+        return ProductSerializer(list(products), many=True).data
+
+    def values():
+        return [representation.to_dict(row) for row in representation.values(products)]
+
+    cases = [
+        ('serializer + JSONRenderer', lambda: JSONRenderer().render(instances())),
+        ('serializer + FastJSONRenderer', lambda: FastJSONRenderer().render(instances())),
+        ('values + JSONRenderer', lambda: JSONRenderer().render(values())),
+        ('values + FastJSONRenderer', lambda: FastJSONRenderer().render(values())),
+        ('serialize only (serializer)', instances),
+        ('serialize only (values)', values),
+    ]
+    for name, serialize in cases:
+        rate = best_rate(args.rows, args.repeat, serialize)
+        print(f'{name:>30}: {rate:10.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
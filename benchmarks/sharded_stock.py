@@ -0,0 +1,89 @@
+"""
+Stock decrements/sec on one hot product, by number of stock shards.
+
+Each thread takes one unit at a time with products.stock.take_stock() in
+its own transaction, against a product sharded with
+products.stock.shard_stock(); 0 shards is the plain amountAvailable
+counter. SQLite serialises every writer on the database lock, so on
+SQLite the numbers mostly show the cost of the shard bookkeeping; the
+contention sharding removes is row-level, as on PostgreSQL or MySQL.
+
+    python -m benchmarks.sharded_stock --threads 8 --takes 200 --shards 0 4 16
+"""
+import argparse
+import threading
+import time
+
+from . import setup
+
+
+def run(shards, threads, takes):
+    from django.db import OperationalError, connection, transaction
+    from products.models import Product
+    from products.stock import shard_stock, take_stock, with_stock
+    from users.models import CustomUser
+
+    Product.objects.all().delete()
+    seller, _ = CustomUser.objects.get_or_create(username='seller', role='seller')
+    stock = threads * takes
+    product = Product.objects.create(productName='Cola', amountAvailable=stock, cost=1, sellerId=seller)
+    if shards:
+        shard_stock(product.id, shards)
+
+    taken = [0] * threads
+    retries = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        barrier.wait()
+        try:
+            for _ in range(takes):
+                while True:
+                    try:
+                        with transaction.atomic():
+                            if take_stock(product.id, 1):
+                                taken[index] += 1
+                        break
+                    except OperationalError:
+                        # SQLite lock upgrade failures surface immediately
+                        retries[index] += 1
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    left = with_stock(Product.objects.all()).get(pk=product.id).stock
+    return {
+        'shards': shards,
+        'ops_per_sec': threads * takes / elapsed,
+        'taken': sum(taken),
+        'lost': stock - left - sum(taken),
+        'retries': sum(retries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--takes', type=int, default=200, help='units taken per thread')
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    setup()
+    for shards in args.shards:
+        result = run(shards, args.threads, args.takes)
+        print(
+            f"{result['shards']:>3} shards: {result['ops_per_sec']:8.1f} ops/s  "
+            f"taken={result['taken']} lost={result['lost']} retries={result['retries']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+from django.contrib import admin
+
+# Register your models here.
+from .models import Job
+
+admin.site.register(Job)
@@ -0,0 +1,78 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from jobs.queue import claim, prune, requeue_expired, run_job
+
+# Seconds between looking for expired leases and old finished jobs
+MAINTENANCE_INTERVAL = 60
+
+
+def execute(job):
+    # Pool threads and processes are long lived, so close connections that
+    # are broken or past CONN_MAX_AGE, as Django does around each request
+    close_old_connections()
+    try:
+        return run_job(job)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs on a pool of threads or processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Jobs run at once (default: 4).')
+        parser.add_argument(
+            '--pool', choices=['thread', 'process'], default='thread',
+            help='Run jobs on threads, or on processes for CPU bound tasks (default: thread).',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls when idle (default: 1).')
+        parser.add_argument(
+            '--lease', type=int, default=300,
+            help='Seconds after which a running job is presumed lost and queued again (default: 300).',
+        )
+        parser.add_argument(
+            '--keep-done', type=int, default=24 * 60 * 60,
+            help='Seconds finished jobs are kept before being deleted (default: 86400).',
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once no jobs are ready.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if options['pool'] == 'process':
+            # Children must open their own connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(workers, initializer=django.setup)
+        else:
+            pool = ThreadPoolExecutor(workers, thread_name_prefix='job')
+
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        running = set()
+        ran = 0
+        next_maintenance = 0
+        try:
+            while not stopping:
+                if time.monotonic() >= next_maintenance:
+                    requeue_expired(options['lease'])
+                    prune(options['keep_done'])
+                    next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+                jobs = claim(workers - len(running)) if len(running) < workers else []
+                running.update(pool.submit(execute, job) for job in jobs)
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                finished, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                ran += len(finished)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Let running jobs finish; unclaimed ones stay queued
+            ran += len(wait(running).done)
+            pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs.'))
@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils import timezone
+
+# Job statuses
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+# Failed max_attempts times; kept until someone looks at last_error
+DEAD = 'dead'
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (DEAD, 'Dead')]
+
+    # Registered task name, see jobs.queue.task
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Not run before this; pushed back after each failed attempt
+    run_at = models.DateTimeField(default=timezone.now)
+    # Token of the worker claim running the job, and when it was taken
+    claim = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Ready jobs, and expired leases and old finished jobs
+            models.Index(fields=['status', 'run_at', 'id'], name='job_ready_idx'),
+            models.Index(fields=['status', 'claimed_at'], name='job_claimed_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -0,0 +1,140 @@
+"""
+A durable job queue kept in the project database.
+
+enqueue() is a single INSERT, so it can run inside the transaction of the
+work that needs the job: the job exists exactly when that work commits.
+The run_jobs command claims ready jobs in batches and runs them on a
+thread or process pool. A job's task and its completion commit together,
+so a task that succeeded is never run again. A failing task is retried
+with exponential backoff up to its max_attempts, then left dead with its
+last traceback.
+"""
+import random
+import traceback
+import uuid
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+from .models import Job, QUEUED, RUNNING, DONE, DEAD
+
+# Seconds before the first retry; doubled for every further attempt
+BACKOFF = 5
+MAX_BACKOFF = 60 * 60
+
+# Tasks by name, registered with @task in each app's tasks.py
+TASKS = {}
+
+
+def task(name, max_attempts=5):
+    """Register a function as the task `name`, called with the job's payload as keyword arguments."""
+    def register(func):
+        func.task_name = name
+        func.max_attempts = max_attempts
+        TASKS[name] = func
+        return func
+    return register
+
+
+def get_task(name):
+    if name not in TASKS:
+        autodiscover_modules('tasks')
+    return TASKS[name]
+
+
+def enqueue(task, delay=0, **payload):
+    """
+    Queue a run of `task`, a registered task or its name, with `payload`,
+    which must be JSON serializable. Inside a transaction the job is only
+    queued if the transaction commits.
+    """
+    if isinstance(task, str):
+        name, max_attempts = task, Job._meta.get_field('max_attempts').default
+    else:
+        name, max_attempts = task.task_name, task.max_attempts
+    return Job.objects.create(
+        name=name, payload=payload, max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def claim(limit):
+    """Mark up to `limit` ready jobs as running, oldest first, and return them."""
+    now = timezone.now()
+    ids = list(
+        Job.objects.filter(status=QUEUED, run_at__lte=now).order_by('run_at', 'id').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Guarded on the status, so jobs another worker took in the meantime
+    # are left to it
+    Job.objects.filter(pk__in=ids, status=QUEUED).update(
+        status=RUNNING, claim=token, claimed_at=now, attempts=F('attempts') + 1,
+    )
+    return list(Job.objects.filter(pk__in=ids, claim=token).order_by('run_at', 'id'))
+
+
+class LostClaim(Exception):
+    pass
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns its new status."""
+    try:
+        with transaction.atomic():
+            get_task(job.name)(**job.payload)
+            # In the task's transaction, so the work and its completion
+            # commit together
+            if not Job.objects.filter(pk=job.pk, claim=job.claim).update(status=DONE, finished=timezone.now()):
+                # The lease ran out and the job was requeued; roll back
+                raise LostClaim
+        return DONE
+    except LostClaim:
+        return QUEUED
+    except Exception:
+        if job.attempts >= job.max_attempts:
+            status, run_at, finished = DEAD, job.run_at, timezone.now()
+        else:
+            status, run_at, finished = QUEUED, timezone.now() + timedelta(seconds=backoff(job.attempts)), None
+        Job.objects.filter(pk=job.pk, claim=job.claim).update(
+            status=status, run_at=run_at, finished=finished, last_error=traceback.format_exc(),
+        )
+        return status
+
+
+def backoff(attempts):
+    """Seconds to wait after the `attempts`th failed attempt, with jitter."""
+    delay = min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1)
+
+
+def requeue_expired(lease):
+    """
+    Put back jobs claimed more than `lease` seconds ago, whose worker must
+    have died. Jobs that already used up their attempts are dead instead.
+    """
+    expired = Job.objects.filter(status=RUNNING, claimed_at__lt=timezone.now() - timedelta(seconds=lease))
+    dead = expired.filter(attempts__gte=F('max_attempts')).update(
+        status=DEAD, finished=timezone.now(), last_error='Lease expired while running.',
+    )
+    return expired.update(status=QUEUED, claim='') + dead
+
+
+def prune(keep):
+    """Delete jobs that finished more than `keep` seconds ago."""
+    # claimed_at is indexed and close enough to when a done job finished
+    return Job.objects.filter(status=DONE, claimed_at__lt=timezone.now() - timedelta(seconds=keep)).delete()[0]
+
+
+def run_pending(limit=100):
+    """Run ready jobs one at a time in this thread until none are left; returns how many ran."""
+    ran = 0
+    while True:
+        jobs = claim(limit)
+        if not jobs:
+            return ran
+        for job in jobs:
+            run_job(job)
+        ran += len(jobs)
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from .models import Job, QUEUED, RUNNING, DONE, DEAD
+from .queue import claim, enqueue, requeue_expired, run_job, run_pending, task
+
+calls = []
+
+
+@task('jobs.tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task('jobs.tests.fail', max_attempts=2)
+def fail():
+    raise ValueError('always fails')
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_are_queued_with_their_transaction(self):
+        with transaction.atomic():
+            enqueue(record, value=1)
+        try:
+            with transaction.atomic():
+                enqueue(record, value=2)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.objects.get().status, DONE)
+
+    def test_enqueue_is_one_insert(self):
+        with self.assertNumQueries(1):
+            enqueue(record, value=1)
+
+    def test_failures_back_off_then_die(self):
+        job = enqueue(fail)
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('ValueError: always fails', job.last_error)
+        # Not ready again until the backoff has passed
+        self.assertEqual(run_pending(), 0)
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (DEAD, 2))
+
+    def test_expired_leases_are_requeued(self):
+        enqueue(record, value=1)
+        job = claim(10)[0]
+        self.assertEqual(job.status, RUNNING)
+        Job.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - timedelta(seconds=600))
+        self.assertEqual(requeue_expired(300), 1)
+        # The first worker comes back: its completion is rolled back and
+        # the job runs again
+        self.assertEqual(run_job(job), QUEUED)
+        job.refresh_from_db()
+        self.assertEqual(job.status, QUEUED)
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (DONE, 2))
+
+
+class RunJobsCommandTestCase(TransactionTestCase):
+    def test_thread_pool_drains_the_queue(self):
+        calls.clear()
+        for value in range(20):
+            enqueue(record, value=value)
+        out = StringIO()
+        # One worker: the in-memory test database has no busy timeout
+        call_command('run_jobs', workers=1, once=True, stdout=out)
+        self.assertIn('Ran 20 jobs.', out.getvalue())
+        self.assertEqual(sorted(calls), list(range(20)))
+        self.assertEqual(Job.objects.filter(status=DONE).count(), 20)
@@ -0,0 +1,8 @@
+from django.contrib import admin
+
+# Register your models here.
+from .models import CoinInventory, Machine, MachineStock
+
+admin.site.register(Machine)
+admin.site.register(CoinInventory)
+admin.site.register(MachineStock)
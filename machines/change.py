@@ -0,0 +1,163 @@
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from .models import COINS, CoinInventory
+from .partitions import machine_db
+
+# Every coin is a multiple of this, so the change table has one slot per step
+UNIT = 5
+
+DEFAULT_CHANGE_TABLE_MAX_AMOUNT = 10000
+
+
+class ChangeTable:
+    """
+    Fewest-coin change for every amount payable from a bounded inventory.
+
+    The table is a bounded knapsack over the coins in `counts`, solved once
+    for every multiple of UNIT up to `max_amount`, so looking up change is
+    O(1). Adding coins extends the table incrementally; each coin count is
+    split into power-of-two bundles that are folded in as 0/1 items.
+    """
+
+    def __init__(self, counts, max_amount):
+        self.max_amount = max_amount - max_amount % UNIT
+        self.counts = dict.fromkeys(COINS, 0)
+        size = self.max_amount // UNIT + 1
+        # solutions[i] is the coin counts, in COINS order, paying i * UNIT
+        self.solutions = [None] * size
+        self.solutions[0] = (0,) * len(COINS)
+        self.coins_used = [float('inf')] * size
+        self.coins_used[0] = 0
+        # best[i] is the largest payable slot at or below slot i
+        self.best = [0] * size
+        for coin in COINS:
+            self._add(coin, counts.get(coin, 0))
+        self._update_best()
+
+    def _add(self, coin, count):
+        self.counts[coin] += count
+        bundle = 1
+        while count > 0:
+            take = min(bundle, count)
+            self._add_bundle(COINS.index(coin), coin * take // UNIT, take)
+            count -= take
+            bundle *= 2
+
+    def _add_bundle(self, index, step, take):
+        solutions, coins_used = self.solutions, self.coins_used
+        for slot in range(len(solutions) - 1, step - 1, -1):
+            previous = solutions[slot - step]
+            if previous is not None and coins_used[slot - step] + take < coins_used[slot]:
+                solution = list(previous)
+                solution[index] += take
+                solutions[slot] = tuple(solution)
+                coins_used[slot] = coins_used[slot - step] + take
+
+    def _update_best(self):
+        best = 0
+        for slot, solution in enumerate(self.solutions):
+            if solution is not None:
+                best = slot
+            self.best[slot] = best
+
+    def add_coins(self, counts):
+        """Fold extra coins, given as {coin: count}, into the table."""
+        for coin, count in counts.items():
+            if count > 0:
+                self._add(coin, count)
+        self._update_best()
+
+    def lookup(self, amount):
+        """Return {coin: count} for the most change up to `amount` the coins can pay."""
+        slot = self.best[min(int(amount), self.max_amount) // UNIT]
+        return dict(zip(COINS, self.solutions[slot]))
+
+
+def fits(change, counts):
+    return all(counts.get(coin, 0) >= count for coin, count in change.items())
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_change_table(machine_id, counts):
+    """
+    Return the machine's change table, brought up to date with `counts`.
+
+    A table may have been built from more coins than the machine holds now,
+    since coins paid out are not taken back out of it; callers check that
+    a lookup still fits(). Coins added since it was built are folded in.
+    """
+    with _tables_lock:
+        table = _tables.get(machine_id)
+        if table is None:
+            max_amount = getattr(settings, 'CHANGE_TABLE_MAX_AMOUNT', DEFAULT_CHANGE_TABLE_MAX_AMOUNT)
+            table = _tables[machine_id] = ChangeTable(counts, max_amount)
+        else:
+            added = {coin: count - table.counts[coin] for coin, count in counts.items() if count > table.counts[coin]}
+            if added:
+                table.add_coins(added)
+        return table
+
+
+def rebuild_change_table(machine_id, counts):
+    """Replace the machine's change table with one built from exactly `counts`."""
+    max_amount = getattr(settings, 'CHANGE_TABLE_MAX_AMOUNT', DEFAULT_CHANGE_TABLE_MAX_AMOUNT)
+    table = ChangeTable(counts, max_amount)
+    with _tables_lock:
+        _tables[machine_id] = table
+    return table
+
+
+class _CoinsTaken(Exception):
+    pass
+
+
+def coin_inventory(machine_id):
+    """The machine's CoinInventory rows, on the machine's database."""
+    return CoinInventory.objects.using(machine_db(machine_id)).filter(machineId=machine_id)
+
+
+def dispense_change(machine_id, amount):
+    """
+    Take the fewest coins worth at most `amount` out of the machine.
+
+    Must run inside the caller's transaction on the machine's database. Coins are removed with
+    guarded UPDATEs (`count >= n`), so the machine never promises coins it
+    does not have; anything it cannot pay stays with the caller. Returns
+    {coin: count}.
+    """
+    for _ in range(3):
+        counts = dict(coin_inventory(machine_id).values_list('coin', 'count'))
+        change = get_change_table(machine_id, counts).lookup(amount)
+        if not fits(change, counts):
+            # Coins the table relied on have been paid out since it was built
+            change = rebuild_change_table(machine_id, counts).lookup(amount)
+        try:
+            with transaction.atomic(using=machine_db(machine_id)):
+                for coin, count in change.items():
+                    if count and not coin_inventory(machine_id).filter(
+                        coin=coin, count__gte=count
+                    ).update(count=F('count') - count):
+                        raise _CoinsTaken()
+        except _CoinsTaken:
+            # A concurrent purchase emptied a coin slot; read it again
+            continue
+        return change
+    return dict.fromkeys(COINS, 0)
+
+
+def add_coin(machine_id, coin, count=1):
+    """Put coins into the machine, e.g. when a buyer deposits them."""
+    inventory = coin_inventory(machine_id)
+    if not inventory.filter(coin=coin).update(count=F('count') + count):
+        inventory.get_or_create(machineId=machine_id, coin=coin)
+        inventory.filter(coin=coin).update(count=F('count') + count)
+
+
+def format_change(change):
+    """Render {coin: count} the way the buy endpoints report change."""
+    return [{f'{coin} cent coins': change[coin]} for coin in COINS if change.get(coin)]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.2 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoinInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('machineId', models.PositiveIntegerField(default=1)),
+                ('coin', models.PositiveIntegerField(choices=[(100, '100 cents'), (50, '50 cents'), (20, '20 cents'), (10, '10 cents'), (5, '5 cents')])),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='coininventory',
+            constraint=models.UniqueConstraint(fields=('machineId', 'coin'), name='unique_machine_coin'),
+        ),
+    ]
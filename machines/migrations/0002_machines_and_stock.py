@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-18 20:08
+
+from django.db import migrations, models
+
+
+def create_default_machine(apps, schema_editor):
+    # The machine this deployment served until now, which keeps its coins
+    # and the products' stock
+    Machine = apps.get_model('machines', 'Machine')
+    Machine.objects.using(schema_editor.connection.alias).get_or_create(pk=1, defaults={'name': 'Default machine'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Machine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('location', models.CharField(blank=True, max_length=200)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MachineStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('machineId', models.PositiveIntegerField()),
+                ('productId', models.PositiveIntegerField()),
+                ('amount', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='machinestock',
+            constraint=models.UniqueConstraint(fields=('machineId', 'productId'), name='unique_machine_product'),
+        ),
+        migrations.RunPython(create_default_machine, migrations.RunPython.noop),
+    ]
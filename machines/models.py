@@ -0,0 +1,50 @@
+from django.db import models
+
+# Coins the machine accepts and pays out, in cents, largest first
+COINS = [100, 50, 20, 10, 5]
+
+# The machine served by the endpoints not scoped to a machine. Its stock is
+# the products' own amountAvailable (see machines.stock)
+DEFAULT_MACHINE_ID = 1
+
+
+class Machine(models.Model):
+    name = models.CharField(max_length=100)
+    location = models.CharField(max_length=200, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+# CoinInventory and MachineStock make up a machine's partition, which can
+# live in its own database (see machines.partitions). They refer to
+# machines and products by plain ids, since foreign keys cannot cross
+# databases.
+
+class CoinInventory(models.Model):
+    machineId = models.PositiveIntegerField(default=DEFAULT_MACHINE_ID)
+    coin = models.PositiveIntegerField(choices=[(coin, f'{coin} cents') for coin in COINS])
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['machineId', 'coin'], name='unique_machine_coin'),
+        ]
+
+    def __str__(self):
+        return f'{self.count} x {self.coin} cents'
+
+
+class MachineStock(models.Model):
+    machineId = models.PositiveIntegerField()
+    productId = models.PositiveIntegerField()
+    amount = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Also the index a machine's product list is paged through
+        constraints = [
+            models.UniqueConstraint(fields=['machineId', 'productId'], name='unique_machine_product'),
+        ]
+
+    def __str__(self):
+        return f'{self.amount} x product {self.productId} in machine {self.machineId}'
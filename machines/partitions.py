@@ -0,0 +1,51 @@
+"""
+Where each machine's rows live.
+
+A machine's partition is its coin inventory and its stock, the
+CoinInventory and MachineStock rows with its machineId. A sale at one
+machine only touches its own partition, besides the buyer's deposit and
+the order, so machines never contend on each other's rows. To spread the
+fleet over several databases, settings.MACHINE_DATABASES maps machine ids
+to database aliases; machines not listed stay in 'default'. The machines
+themselves, the catalog, users and orders always live in 'default'.
+
+A sale at a machine in another database runs in a transaction on each
+database. The machine's commits first, so a failure in between can only
+leave stock and coins taken without payment, never a buyer charged for
+nothing.
+"""
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+# Models stored per machine, and the only ones migrated to partition databases
+PARTITIONED_MODELS = {'coininventory', 'machinestock'}
+
+
+def machine_db(machine_id):
+    """The database alias holding the machine's partition."""
+    return getattr(settings, 'MACHINE_DATABASES', {}).get(machine_id, DEFAULT_DB_ALIAS)
+
+
+def partition_aliases():
+    """Every database alias holding machine partitions."""
+    return {DEFAULT_DB_ALIAS, *getattr(settings, 'MACHINE_DATABASES', {}).values()}
+
+
+def atomic(machine_id):
+    """
+    A transaction on the machine's database, when it is not 'default'.
+    Enter it inside the transaction on 'default', so it commits first.
+    """
+    using = machine_db(machine_id)
+    if using == DEFAULT_DB_ALIAS:
+        return nullcontext()
+    return transaction.atomic(using=using)
+
+
+class MachinePartitionRouter:
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in partition_aliases():
+            return None
+        # Partition databases only get the partitioned tables
+        return app_label == 'machines' and model_name in PARTITIONED_MODELS
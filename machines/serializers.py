@@ -0,0 +1,8 @@
+from vending_machine_api.serializers import DynamicFieldsModelSerializer
+from .models import Machine
+
+
+class MachineSerializer(DynamicFieldsModelSerializer):
+    class Meta:
+        model = Machine
+        fields = ['id', 'name', 'location']
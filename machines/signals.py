@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from products.models import Product
+from .stock import forget_product
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # MachineStock has no foreign key to cascade from
+    forget_product(instance.pk)
@@ -0,0 +1,57 @@
+"""
+Stock per machine.
+
+The default machine's stock is the products' own amountAvailable and stock
+shards (see products.stock), as before there was more than one machine, so
+the endpoints not scoped to a machine are unchanged. Every other machine
+keeps a MachineStock row for each product it holds, in its partition.
+"""
+from django.db.models import F
+from products.stock import take_stock, with_stock
+from .models import DEFAULT_MACHINE_ID, MachineStock
+from .partitions import machine_db, partition_aliases
+
+
+def machine_stock(machine_id):
+    """The machine's MachineStock rows, on the machine's database."""
+    return MachineStock.objects.using(machine_db(machine_id)).filter(machineId=machine_id)
+
+
+def take_machine_stock(machine_id, product_id, amount):
+    """
+    Remove `amount` units of a product from the machine with a guarded
+    UPDATE; returns whether it held enough. Must run inside a transaction
+    on the machine's database, rolled back on failure.
+    """
+    if machine_id == DEFAULT_MACHINE_ID:
+        return take_stock(product_id, amount)
+    return bool(
+        machine_stock(machine_id).filter(productId=product_id, amount__gte=amount).update(amount=F('amount') - amount)
+    )
+
+
+def values_with_stock(machine_id, queryset, *fields):
+    """
+    values_list(*fields, 'stock') rows of a Product queryset, with the
+    machine's stock. Products the machine does not hold are left out.
+    """
+    if machine_id == DEFAULT_MACHINE_ID:
+        return list(with_stock(queryset).values_list(*fields, 'stock'))
+    rows = list(queryset.values_list('id', *fields))
+    stock = dict(machine_stock(machine_id).filter(productId__in=[row[0] for row in rows]).values_list('productId', 'amount'))
+    return [(*row[1:], stock[row[0]]) for row in rows if row[0] in stock]
+
+
+def set_machine_stock(machine_id, product_id, amount):
+    """Set how many units of a product a machine other than the default holds."""
+    stock = machine_stock(machine_id)
+    if not stock.filter(productId=product_id).update(amount=amount):
+        _, created = stock.get_or_create(machineId=machine_id, productId=product_id, defaults={'amount': amount})
+        if not created:
+            stock.filter(productId=product_id).update(amount=amount)
+
+
+def forget_product(product_id):
+    """Drop a deleted product from every machine."""
+    for alias in partition_aliases():
+        MachineStock.objects.using(alias).filter(productId=product_id).delete()
@@ -0,0 +1,168 @@
+import random
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from orders.models import Order
+from products.models import Product
+from users.models import CustomUser
+from .change import ChangeTable, add_coin, dispense_change
+from .models import COINS, DEFAULT_MACHINE_ID, CoinInventory, Machine, MachineStock
+from .partitions import MachinePartitionRouter, machine_db
+
+
+class ChangeTableTestCase(TestCase):
+    def test_uses_bounded_coins_where_greedy_fails(self):
+        # Greedy would take the 50 and then be stuck without a 10
+        table = ChangeTable({50: 1, 20: 3}, 1000)
+        self.assertEqual(table.lookup(60), {100: 0, 50: 0, 20: 3, 10: 0, 5: 0})
+
+    def test_fewest_coins(self):
+        table = ChangeTable({100: 2, 50: 2, 20: 5, 10: 5, 5: 5}, 1000)
+        self.assertEqual(table.lookup(185), {100: 1, 50: 1, 20: 1, 10: 1, 5: 1})
+
+    def test_never_pays_more_than_asked_or_held(self):
+        table = ChangeTable({10: 2}, 1000)
+        self.assertEqual(table.lookup(15), {100: 0, 50: 0, 20: 0, 10: 1, 5: 0})
+        self.assertEqual(table.lookup(500), {100: 0, 50: 0, 20: 0, 10: 2, 5: 0})
+
+    def test_incremental_add_matches_full_build(self):
+        rng = random.Random(7)
+        counts = {coin: rng.randint(0, 6) for coin in COINS}
+        extra = {coin: rng.randint(0, 6) for coin in COINS}
+        table = ChangeTable(counts, 2000)
+        table.add_coins(extra)
+        full = ChangeTable({coin: counts[coin] + extra[coin] for coin in COINS}, 2000)
+        for amount in range(0, 2001, 5):
+            self.assertEqual(sum(table.lookup(amount).values()), sum(full.lookup(amount).values()))
+            self.assertEqual(
+                sum(c * n for c, n in table.lookup(amount).items()),
+                sum(c * n for c, n in full.lookup(amount).items()),
+            )
+
+
+class DispenseChangeTestCase(TestCase):
+    def setUp(self):
+        add_coin(1, 20, 3)
+        add_coin(1, 50, 1)
+
+    def counts(self):
+        return dict(CoinInventory.objects.values_list('coin', 'count'))
+
+    def test_dispense_takes_coins_out_of_the_machine(self):
+        self.assertEqual(dispense_change(1, 60)[20], 3)
+        self.assertEqual(self.counts(), {20: 0, 50: 1})
+
+    def test_table_is_rebuilt_once_coins_run_out(self):
+        self.assertEqual(dispense_change(1, 40)[20], 2)
+        # One 20 left: 60 can no longer be paid exactly, 50 + nothing can
+        change = dispense_change(1, 60)
+        self.assertEqual(sum(c * n for c, n in change.items()), 50)
+        self.assertEqual(self.counts(), {20: 1, 50: 0})
+
+
+class MachineStockTestCase(TestCase):
+    def setUp(self):
+        self.machine = Machine.objects.create(name='Lobby')
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', role='buyer')
+        self.product = Product.objects.create(productName='Cola', amountAvailable=10, cost=15, sellerId=self.seller)
+        self.client = APIClient()
+
+    def login(self, username):
+        response = self.client.post('/api/users/login/', {'username': username, 'password': 'password123'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access_token"]}')
+
+    def stock(self, amount):
+        self.login('seller')
+        response = self.client.put(
+            f'/api/machines/{self.machine.id}/products/{self.product.id}/stock/', {'amountAvailable': amount}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['amountAvailable'], amount)
+
+    def test_machines_have_their_own_stock(self):
+        self.stock(4)
+        response = self.client.get(f'/api/machines/{self.machine.id}/products/')
+        self.assertEqual([(p['id'], p['amountAvailable']) for p in response.data['results']], [(self.product.id, 4)])
+        # The default machine's stock is the product's own
+        response = self.client.get(f'/api/machines/{DEFAULT_MACHINE_ID}/products/{self.product.id}/')
+        self.assertEqual(response.data['amountAvailable'], 10)
+        other = Product.objects.create(productName='Water', amountAvailable=5, cost=10, sellerId=self.seller)
+        response = self.client.get(f'/api/machines/{self.machine.id}/products/{other.id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_buying_only_touches_the_machines_partition(self):
+        self.stock(4)
+        self.login('buyer')
+        self.client.post(f'/api/machines/{self.machine.id}/deposit/', {'deposit': 50}, format='json')
+        response = self.client.post(f'/api/machines/{self.machine.id}/buy/', {'productId': self.product.id, 'amount': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # The machine only holds the buyer's 50 cent coin
+        self.assertEqual(response.data['change'], [])
+        self.assertEqual(response.data['remaining_deposit'], 5)
+        self.assertEqual(MachineStock.objects.get(machineId=self.machine.id).amount, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.amountAvailable, 10)
+        self.assertEqual(CoinInventory.objects.get(machineId=self.machine.id).count, 1)
+        self.assertFalse(CoinInventory.objects.filter(machineId=DEFAULT_MACHINE_ID).exists())
+        self.assertEqual(Order.objects.get().machineId, self.machine.id)
+        response = self.client.post(f'/api/machines/{self.machine.id}/buy/', {'productId': self.product.id, 'amount': 2}, format='json')
+        self.assertEqual(response.data, {'error': 'Insufficient stock.'})
+
+    def test_deposits_are_paid_out_only_by_the_machine_holding_them(self):
+        other = Machine.objects.create(name='Canteen')
+        self.stock(4)
+        MachineStock.objects.create(machineId=other.id, productId=self.product.id, amount=4)
+        add_coin(other.id, 5, 10)
+        self.login('buyer')
+        response = self.client.post(f'/api/machines/{self.machine.id}/deposit/', {'deposit': 50}, format='json')
+        self.assertEqual(response.data['depositMachineId'], self.machine.id)
+        response = self.client.post(f'/api/machines/{other.id}/deposit/', {'deposit': 20}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['machineId'], self.machine.id)
+        response = self.client.post(f'/api/machines/{other.id}/reset-deposit/')
+        self.assertEqual(response.status_code, 409)
+
+        # The other machine's coins don't pay change for a deposit they never took
+        response = self.client.post(f'/api/machines/{other.id}/buy/', {'productId': self.product.id, 'amount': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['change'], [])
+        self.assertEqual(response.data['remaining_deposit'], 35)
+        self.assertEqual(CoinInventory.objects.get(machineId=other.id).count, 10)
+        self.assertEqual(CoinInventory.objects.filter(machineId=self.machine.id).count(), 1)
+
+        # Refunded at the holding machine, after which any machine can take a deposit
+        add_coin(self.machine.id, 5, 7)
+        response = self.client.post(f'/api/machines/{self.machine.id}/reset-deposit/')
+        self.assertEqual(response.data['change'], [{'5 cent coins': 7}])
+        self.assertEqual(response.data['deposit'], 0)
+        response = self.client.post(f'/api/machines/{other.id}/deposit/', {'deposit': 20}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['depositMachineId'], other.id)
+
+    def test_unknown_machines_are_not_found(self):
+        self.login('buyer')
+        response = self.client.post('/api/machines/999/buy/', {'productId': self.product.id, 'amount': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/api/machines/999/products/').status_code, 404)
+
+    def test_only_the_seller_stocks_a_product(self):
+        self.login('buyer')
+        response = self.client.put(
+            f'/api/machines/{self.machine.id}/products/{self.product.id}/stock/', {'amountAvailable': 4}, format='json',
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_deleted_products_leave_every_machine(self):
+        self.stock(4)
+        self.product.delete()
+        self.assertFalse(MachineStock.objects.exists())
+
+    @override_settings(MACHINE_DATABASES={2: 'machines1'})
+    def test_partitions_can_be_routed_to_other_databases(self):
+        self.assertEqual(machine_db(2), 'machines1')
+        self.assertEqual(machine_db(3), 'default')
+        router = MachinePartitionRouter()
+        self.assertTrue(router.allow_migrate('machines1', 'machines', 'machinestock'))
+        self.assertFalse(router.allow_migrate('machines1', 'machines', 'machine'))
+        self.assertFalse(router.allow_migrate('machines1', 'products', 'product'))
+        self.assertIsNone(router.allow_migrate('default', 'products', 'product'))
@@ -0,0 +1,14 @@
+from django.urls import path
+from users.views import DepositView, BuyView, CheckoutView, ResetDeposit
+from .views import MachineList, MachineProductList, MachineProductDetail, MachineProductStock
+
+urlpatterns = [
+    path('', MachineList.as_view(), name='machine-list'),
+    path('<int:machine_id>/products/', MachineProductList.as_view(), name='machine-product-list'),
+    path('<int:machine_id>/products/<int:pk>/', MachineProductDetail.as_view(), name='machine-product-detail'),
+    path('<int:machine_id>/products/<int:pk>/stock/', MachineProductStock.as_view(), name='machine-product-stock'),
+    path('<int:machine_id>/deposit/', DepositView.as_view(), name='machine-deposit'),
+    path('<int:machine_id>/buy/', BuyView.as_view(), name='machine-buy'),
+    path('<int:machine_id>/checkout/', CheckoutView.as_view(), name='machine-checkout'),
+    path('<int:machine_id>/reset-deposit/', ResetDeposit.as_view(), name='machine-reset-deposit'),
+]
@@ -0,0 +1,138 @@
+from functools import wraps
+from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from products.cache import get_product
+from products.catalog import catalog_changed, catalog_etag
+from products.events import STOCK, publish_on_commit
+from products.models import Product
+from products.serializers import ProductSerializer
+from products.stock import with_stock
+from vending_machine_api.pagination import IdCursorPagination, LIST_PARAMETERS
+from vending_machine_api.routers import read_from_replica
+from .models import DEFAULT_MACHINE_ID, Machine
+from .serializers import MachineSerializer
+from .stock import machine_stock, set_machine_stock
+
+
+def for_machine(view_method):
+    """
+    Pass an APIView method the machine_id from its URL, or the default
+    machine on unscoped routes, answering 404 for a machine that does not
+    exist.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, machine_id=DEFAULT_MACHINE_ID, **kwargs):
+        if machine_id != DEFAULT_MACHINE_ID and not Machine.objects.filter(pk=machine_id).exists():
+            return Response({'error': 'Machine does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+        return view_method(self, request, *args, machine_id=machine_id, **kwargs)
+
+    return wrapper
+
+
+class MachineList(APIView):
+    @swagger_auto_schema(
+        manual_parameters=LIST_PARAMETERS,
+        responses={200: "machines list"},
+        operation_description="Get the machines, one page at a time"
+    )
+    @read_from_replica
+    def get(self, request):
+        fields = MachineSerializer.get_requested_fields(request)
+        return IdCursorPagination().paginate(Machine.objects.all(), request, self, MachineSerializer, fields)
+
+
+class MachineProductList(APIView):
+    @swagger_auto_schema(
+        manual_parameters=LIST_PARAMETERS,
+        responses={200: "products list with the machine's stock"},
+        operation_description="Get the products a machine holds, with its stock as amountAvailable, one page at a time"
+    )
+    @method_decorator(condition(etag_func=catalog_etag))
+    @for_machine
+    def get(self, request, machine_id):
+        fields = ProductSerializer.get_requested_fields(request)
+        if machine_id == DEFAULT_MACHINE_ID:
+            return IdCursorPagination().paginate(with_stock(Product.objects.all()), request, self, ProductSerializer, fields)
+        # Paged through the machine's stock in its partition, then the
+        # page's products are read from the catalog
+        rows, next_link, previous_link = IdCursorPagination('productId').page(machine_stock(machine_id), request, 'amount')
+        products = Product.objects.all()
+        if fields is not None:
+            products = products.only(*fields)
+        found = products.in_bulk([product_id for _, product_id, _ in rows])
+        page = []
+        for amount, product_id, _ in rows:
+            # Products deleted since are skipped
+            if product_id in found:
+                found[product_id].stock = amount
+                page.append(found[product_id])
+        results = ProductSerializer(page, many=True, fields=fields).data
+        return Response({'next': next_link, 'previous': previous_link, 'results': results})
+
+
+class MachineProductDetail(APIView):
+    @swagger_auto_schema(
+        responses={200: "Product details with the machine's stock"},
+        operation_description="Get a product held by a machine, with its stock as amountAvailable"
+    )
+    @method_decorator(condition(etag_func=catalog_etag))
+    @for_machine
+    def get(self, request, machine_id, pk):
+        try:
+            product = get_product(pk) if machine_id == DEFAULT_MACHINE_ID else Product.objects.get(pk=pk)
+        except Product.DoesNotExist:
+            raise Http404
+        if machine_id != DEFAULT_MACHINE_ID:
+            amount = machine_stock(machine_id).filter(productId=pk).values_list('amount', flat=True).first()
+            if amount is None:
+                raise Http404
+            product.stock = amount
+        return Response(ProductSerializer(product).data)
+
+
+class MachineProductStock(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['amountAvailable'],
+            properties={
+                'amountAvailable': openapi.Schema(type=openapi.TYPE_INTEGER, description='Units in the machine'),
+            },
+        ),
+        responses={200: "Product details with the machine's stock"},
+        operation_description="Set how many units of a product a machine holds",
+        security= [{'Bearer': []}]
+    )
+    @for_machine
+    def put(self, request, machine_id, pk):
+        try:
+            product = Product.objects.get(pk=pk)
+        except Product.DoesNotExist:
+            raise Http404
+        if request.user.id != product.sellerId_id:
+            return Response({'error': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+
+        amount = request.data.get('amountAvailable')
+        if not isinstance(amount, int) or isinstance(amount, bool) or amount < 0:
+            return Response({'error': 'amountAvailable must be a non-negative integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if machine_id == DEFAULT_MACHINE_ID:
+            # The default machine's stock is the product's own
+            serializer = ProductSerializer(product, data={'amountAvailable': amount}, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data)
+        set_machine_stock(machine_id, pk, amount)
+        catalog_changed()
+        publish_on_commit(STOCK, {'id': pk, 'machineId': machine_id, 'amountAvailable': amount})
+        product.stock = amount
+        return Response(ProductSerializer(product).data)
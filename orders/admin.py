@@ -0,0 +1,9 @@
+from django.contrib import admin
+
+# Register your models here.
+from .models import Order, OrderLine, SellerDailySales, ProductDailySales
+
+admin.site.register(Order)
+admin.site.register(OrderLine)
+admin.site.register(SellerDailySales)
+admin.site.register(ProductDailySales)
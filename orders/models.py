@@ -0,0 +1,67 @@
+from django.db import models
+from machines.models import DEFAULT_MACHINE_ID
+from products.models import Product
+from users.models import CustomUser
+
+
+class Order(models.Model):
+    buyer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders')
+    machineId = models.PositiveIntegerField(default=DEFAULT_MACHINE_ID)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['buyer', 'created'], name='order_buyer_idx'),
+        ]
+
+    def __str__(self):
+        return f'Order {self.pk}'
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    # History outlives the product, so there is no foreign key constraint
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    # The product's name and cost when it was bought
+    productName = models.CharField(max_length=100)
+    amount = models.PositiveIntegerField()
+    cost = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f'{self.amount} x {self.productName}'
+
+
+class SellerDailySales(models.Model):
+    """One seller's sales on one day, kept up to date by each purchase."""
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'day'], name='unique_seller_day'),
+        ]
+
+
+class ProductDailySales(models.Model):
+    """One product's sales on one day, kept up to date by each purchase."""
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    # The product's name at its latest sale that day
+    productName = models.CharField(max_length=100)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='unique_product_day'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'day'], name='product_sales_seller_idx'),
+        ]
@@ -0,0 +1,95 @@
+from django.db.models import F
+from django.utils import timezone
+from jobs.queue import enqueue
+from .models import Order, OrderLine, ProductDailySales, SellerDailySales
+
+# Background task that adds an order to the rollups, see orders.tasks
+UPDATE_SALES_ROLLUPS = 'orders.update_sales_rollups'
+
+
+def record_order(buyer_id, machine_id, lines, total_cost):
+    """
+    Write an Order for a checkout's PurchaseLines and queue the job that
+    adds it to the daily sales rollups.
+
+    Must run inside the purchase transaction, so the job is queued exactly
+    when the order is written. The rollups catch up as soon as a run_jobs
+    worker picks the job up.
+    """
+    order = Order.objects.create(buyer_id=buyer_id, machineId=machine_id, total_cost=total_cost)
+    OrderLine.objects.bulk_create(
+        OrderLine(
+            order=order, product_id=line.product_id, seller_id=line.seller_id,
+            productName=line.product_name, amount=line.amount, cost=line.cost,
+        )
+        for line in lines
+    )
+    enqueue(UPDATE_SALES_ROLLUPS, order_id=order.pk)
+    return order
+
+
+def add_to_rollups(order):
+    """
+    Add an order's lines to the daily sales rollups. Rollup rows are updated
+    in product then seller id order, the same order for every order.
+    """
+    day = timezone.localdate(order.created)
+    sellers = {}
+    for line in order.lines.order_by('product_id'):
+        total = line.cost * line.amount
+        _add(
+            ProductDailySales, {'product_id': line.product_id, 'day': day},
+            {'seller_id': line.seller_id, 'productName': line.productName},
+            orders=1, units=line.amount, revenue=total,
+        )
+        units, revenue = sellers.get(line.seller_id, (0, 0))
+        sellers[line.seller_id] = (units + line.amount, revenue + total)
+    for seller_id in sorted(sellers):
+        units, revenue = sellers[seller_id]
+        _add(SellerDailySales, {'seller_id': seller_id, 'day': day}, {}, orders=1, units=units, revenue=revenue)
+
+
+def _add(model, key, fields, **increments):
+    """Add `increments` to the rollup row identified by `key`, creating it if needed."""
+    updates = {name: F(name) + value for name, value in increments.items()}
+    if not model.objects.filter(**key).update(**updates, **fields):
+        row, _ = model.objects.get_or_create(**key, defaults=fields)
+        model.objects.filter(pk=row.pk).update(**updates)
+
+
+def seller_sales(seller_id, start, end):
+    """
+    Return a seller's sales from `start` to `end` inclusive, per day and per
+    product, read from the rollups alone: O(days x products sold), however
+    many orders there were.
+    """
+    days = list(
+        SellerDailySales.objects.filter(seller_id=seller_id, day__range=(start, end))
+        .order_by('day')
+        .values('day', 'orders', 'units', 'revenue')
+    )
+    products = {}
+    rows = (
+        ProductDailySales.objects.filter(seller_id=seller_id, day__range=(start, end))
+        .order_by('day')
+        .values_list('product_id', 'productName', 'orders', 'units', 'revenue')
+    )
+    for product_id, name, orders, units, revenue in rows:
+        product = products.setdefault(product_id, {'productId': product_id, 'orders': 0, 'units': 0, 'revenue': 0})
+        # Rows come oldest first, so the latest name wins
+        product['productName'] = name
+        product['orders'] += orders
+        product['units'] += units
+        product['revenue'] += revenue
+    return {
+        'start': start,
+        'end': end,
+        'totals': {
+            'orders': sum(day['orders'] for day in days),
+            'units': sum(day['units'] for day in days),
+            'revenue': sum((day['revenue'] for day in days), start=0),
+        },
+        'days': days,
+        'products': sorted(products.values(), key=lambda product: (-product['revenue'], product['productId'])),
+    }
+
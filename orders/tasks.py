@@ -0,0 +1,8 @@
+from jobs.queue import task
+from .models import Order
+from .sales import UPDATE_SALES_ROLLUPS, add_to_rollups
+
+
+@task(UPDATE_SALES_ROLLUPS)
+def update_sales_rollups(order_id):
+    add_to_rollups(Order.objects.get(pk=order_id))
@@ -0,0 +1,108 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from jobs.models import Job
+from jobs.queue import run_pending
+from machines.change import add_coin
+from machines.models import COINS, DEFAULT_MACHINE_ID
+from products.models import Product
+from users import ledger
+from users.models import CustomUser
+from users.purchase import checkout, purchase, PurchaseError
+from .models import Order, OrderLine, ProductDailySales, SellerDailySales
+
+
+class OrderRecordingTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.other = CustomUser.objects.create_user(username='other', password='password123', role='seller')
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123')
+        ledger.credit(self.buyer.id, 500, ledger.DEPOSIT)
+        self.cola = Product.objects.create(productName='Cola', amountAvailable=10, cost=5, sellerId=self.seller)
+        self.chips = Product.objects.create(productName='Chips', amountAvailable=10, cost=20, sellerId=self.other)
+        for coin in COINS:
+            add_coin(DEFAULT_MACHINE_ID, coin, 10)
+
+    def test_purchase_writes_an_order(self):
+        result = purchase(self.buyer.id, self.cola.id, 3)
+        order = Order.objects.get(pk=result.order_id)
+        self.assertEqual(order.buyer_id, self.buyer.id)
+        self.assertEqual(order.total_cost, 15)
+        line = order.lines.get()
+        self.assertEqual((line.product_id, line.seller_id, line.productName, line.amount, line.cost), (self.cola.id, self.seller.id, 'Cola', 3, 5))
+
+    def test_rollups_are_incremental(self):
+        checkout(self.buyer.id, [(self.cola.id, 2), (self.chips.id, 1)])
+        # The rest of the deposit was paid out as change
+        ledger.credit(self.buyer.id, 5, ledger.DEPOSIT)
+        checkout(self.buyer.id, [(self.cola.id, 1)])
+        # The rollups are updated by a background job per order
+        self.assertFalse(SellerDailySales.objects.exists())
+        self.assertEqual(run_pending(), 2)
+        today = timezone.localdate()
+        seller = SellerDailySales.objects.get(seller=self.seller, day=today)
+        self.assertEqual((seller.orders, seller.units, seller.revenue), (2, 3, 15))
+        other = SellerDailySales.objects.get(seller=self.other, day=today)
+        self.assertEqual((other.orders, other.units, other.revenue), (1, 1, 20))
+        cola = ProductDailySales.objects.get(product=self.cola, day=today)
+        self.assertEqual((cola.seller_id, cola.orders, cola.units, cola.revenue), (self.seller.id, 2, 3, 15))
+
+    def test_failed_purchase_records_nothing(self):
+        with self.assertRaises(PurchaseError):
+            checkout(self.buyer.id, [(self.cola.id, 1), (self.chips.id, 11)])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(SellerDailySales.objects.exists())
+        self.assertFalse(ProductDailySales.objects.exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_history_outlives_the_product(self):
+        cola_id = self.cola.id
+        purchase(self.buyer.id, cola_id, 1)
+        self.cola.delete()
+        run_pending()
+        self.assertEqual(OrderLine.objects.get().productName, 'Cola')
+        self.assertEqual(ProductDailySales.objects.get().product_id, cola_id)
+
+
+class SellerSalesTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123')
+        self.cola = Product.objects.create(productName='Cola', amountAvailable=10, cost=5, sellerId=self.seller)
+        self.chips = Product.objects.create(productName='Chips', amountAvailable=10, cost=20, sellerId=self.seller)
+        self.today = timezone.localdate()
+        for days_ago, product, units in [(0, self.cola, 2), (0, self.chips, 1), (3, self.cola, 4), (40, self.chips, 9)]:
+            day = self.today - timedelta(days=days_ago)
+            revenue = product.cost * units
+            ProductDailySales.objects.create(product=product, seller=self.seller, day=day, productName=product.productName, orders=1, units=units, revenue=revenue)
+            row, _ = SellerDailySales.objects.get_or_create(seller=self.seller, day=day)
+            SellerDailySales.objects.filter(pk=row.pk).update(orders=row.orders + 1, units=row.units + units, revenue=row.revenue + revenue)
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def test_default_range_is_the_last_30_days(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/orders/sales/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'orders': 3, 'units': 7, 'revenue': Decimal('50.00')})
+        self.assertEqual([day['day'] for day in response.data['days']], [self.today - timedelta(days=3), self.today])
+        self.assertEqual(
+            [(product['productName'], product['units'], product['revenue']) for product in response.data['products']],
+            [('Cola', 6, Decimal('30.00')), ('Chips', 1, Decimal('20.00'))],
+        )
+
+    def test_explicit_range(self):
+        start = self.today - timedelta(days=60)
+        response = self.client.get(f'/api/orders/sales/?start={start}&end={self.today - timedelta(days=10)}')
+        self.assertEqual(response.data['totals']['units'], 9)
+
+    def test_bad_ranges(self):
+        self.assertEqual(self.client.get(f'/api/orders/sales/?start={self.today}&end={self.today - timedelta(days=1)}').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/orders/sales/?start={self.today - timedelta(days=400)}').status_code, 400)
+        self.assertEqual(self.client.get('/api/orders/sales/?start=yesterday').status_code, 400)
+
+    def test_only_sellers_have_sales(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get('/api/orders/sales/').status_code, 403)
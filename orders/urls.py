@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import SellerSales
+
+urlpatterns = [
+    path('sales/', SellerSales.as_view(), name='seller-sales'),
+]
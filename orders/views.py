@@ -0,0 +1,48 @@
+from datetime import timedelta
+from django.utils import timezone
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .sales import seller_sales
+
+# Longest range a sales report covers
+MAX_REPORT_DAYS = 366
+
+
+class SalesRangeSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        end = data.get('end') or timezone.localdate()
+        start = data.get('start') or end - timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError({'start': 'Must not be after end.'})
+        if (end - start).days >= MAX_REPORT_DAYS:
+            raise serializers.ValidationError({'start': f'A report covers at most {MAX_REPORT_DAYS} days.'})
+        return {'start': start, 'end': end}
+
+
+class SellerSales(APIView):
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('start', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE, description='First day (default: 29 days before end)'),
+            openapi.Parameter('end', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE, description='Last day (default: today)'),
+        ],
+        responses={200: "Sales totals, per day and per product"},
+        operation_description="Get the seller's sales",
+        security=[{'Bearer': []}]
+    )
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return Response({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if request.user.role != 'seller':
+            return Response({'error': 'Only users with a "seller" role have sales.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = SalesRangeSerializer(data=request.GET)
+        serializer.is_valid(raise_exception=True)
+        report = seller_sales(request.user.id, serializer.validated_data['start'], serializer.validated_data['end'])
+        return Response(report)
@@ -0,0 +1,8 @@
+from django.urls import path
+from .async_views import product_list, product_detail, product_events
+
+urlpatterns = [
+    path('', product_list, name='async-product-list'),
+    path('<int:pk>/', product_detail, name='async-product-detail'),
+    path('events/', product_events, name='async-product-events'),
+]
@@ -0,0 +1,68 @@
+# Async-native catalog reads, served under /api/async/products/ by the ASGI app
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.request import Request
+from vending_machine_api.asyncapi import acondition, api_view, json_response
+from vending_machine_api.pagination import IdCursorPagination
+from vending_machine_api.renderers import FastJSONRenderer
+from .cache import aget_product
+from .catalog import acatalog_etag
+from .events import broadcaster
+from .filters import filter_products
+from .models import Product
+from .serializers import ProductSerializer
+from .stock import with_stock
+
+
+@api_view
+@require_safe
+@acondition(acatalog_etag)
+async def product_list(request):
+    request = Request(request)
+    fields = ProductSerializer.get_requested_fields(request)
+    products, ordering = filter_products(with_stock(Product.objects.all()), request.GET)
+    data = await IdCursorPagination(ordering).apaginate(products, request, ProductSerializer, fields)
+    return json_response(data)
+
+
+@api_view
+@require_safe
+@acondition(acatalog_etag)
+async def product_detail(request, pk):
+    try:
+        product = await aget_product(pk)
+    except Product.DoesNotExist:
+        raise Http404
+    return json_response(ProductSerializer(product).data)
+
+
+@require_safe
+async def product_events(request):
+    """
+    Stream product changes as Server-Sent Events. Only served by the ASGI
+    application: under WSGI the endless stream would hold a worker thread.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('Event streams are only served by the ASGI application.', status=501)
+    try:
+        last_id = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        last_id = None
+    response = StreamingHttpResponse(_event_stream(last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _event_stream(last_id):
+    renderer = FastJSONRenderer()
+    # Ask clients to reconnect after 3 seconds if the stream drops
+    yield 'retry: 3000\n\n'
+    async for event in broadcaster.stream(last_id):
+        if event is None:
+            yield ': keep-alive\n\n'
+            continue
+        event_id, kind, data = event
+        yield f'id: {event_id}\nevent: {kind}\ndata: {renderer.render(data).decode()}\n\n'
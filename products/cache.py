@@ -0,0 +1,225 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .models import Product
+from .stock import with_stock
+
+DEFAULT_PRODUCT_CACHE = {
+    'BACKEND': 'products.cache.LocalProductCache',
+    'OPTIONS': {},
+}
+
+
+class LocalProductCache:
+    """
+    Bounded in-process LRU cache with a per-entry TTL.
+
+    Entries are dropped least recently used first once `max_entries` is
+    reached, and treated as misses once they are `timeout` seconds old or
+    were stored under another version of the product.
+    """
+
+    def __init__(self, max_entries=10000, timeout=30):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, pk, version):
+        with self._lock:
+            entry = self._entries.get(pk)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != version:
+                if entry is not None:
+                    del self._entries[pk]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(pk)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, pk, version, product):
+        with self._lock:
+            self._entries[pk] = (time.monotonic() + self.timeout, version, product)
+            self._entries.move_to_end(pk)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Entries are in memory, so the async views can call these directly
+    async def aget(self, pk, version):
+        return self.get(pk, version)
+
+    async def aset(self, pk, version, product):
+        self.set(pk, version, product)
+
+    def delete(self, pk):
+        with self._lock:
+            self._entries.pop(pk, None)
+
+    def stats(self):
+        return {
+            'backend': 'local',
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class DjangoProductCache:
+    """
+    Product cache stored in one of Django's CACHES aliases.
+
+    Eviction is up to the cache backend, so only hits and misses are
+    counted here, per process.
+    """
+
+    def __init__(self, alias='default', timeout=30, key_prefix='products:product'):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, pk):
+        return f'{self.key_prefix}:{pk}'
+
+    def _product(self, entry, version):
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def get(self, pk, version):
+        return self._product(self.cache.get(self._key(pk)), version)
+
+    def set(self, pk, version, product):
+        self.cache.set(self._key(pk), (version, product), self.timeout)
+
+    async def aget(self, pk, version):
+        return self._product(await self.cache.aget(self._key(pk)), version)
+
+    async def aset(self, pk, version, product):
+        await self.cache.aset(self._key(pk), (version, product), self.timeout)
+
+    def delete(self, pk):
+        self.cache.delete(self._key(pk))
+
+    def stats(self):
+        return {
+            'backend': 'django',
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': None,
+        }
+
+
+_product_cache = None
+_product_cache_lock = threading.Lock()
+
+
+def get_product_cache():
+    """Return the process-wide product cache configured by settings.PRODUCT_CACHE."""
+    global _product_cache
+    if _product_cache is None:
+        with _product_cache_lock:
+            if _product_cache is None:
+                config = getattr(settings, 'PRODUCT_CACHE', DEFAULT_PRODUCT_CACHE)
+                _product_cache = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _product_cache
+
+
+PRODUCT_VERSION_KEY = 'products:product-version:{}'
+
+
+def get_product_version(pk):
+    """
+    Return the version token of a product's cache entries.
+
+    Like the catalog version, it lives in Django's cache, so that a write in
+    one worker retires the entries of every worker sharing the backend. A
+    missing token just starts a new version. Tokens only have to outlive
+    the entries tagged with them, so they expire with the entries.
+    """
+    key = PRODUCT_VERSION_KEY.format(pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, get_product_cache().timeout)
+        version = cache.get(key)
+    return version
+
+
+async def aget_product_version(pk):
+    """Async counterpart of get_product_version()."""
+    key = PRODUCT_VERSION_KEY.format(pk)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, get_product_cache().timeout)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_product_version(pk):
+    cache.set(PRODUCT_VERSION_KEY.format(pk), uuid.uuid4().hex, get_product_cache().timeout)
+
+
+def get_product(pk):
+    """
+    Product.objects.get(pk=pk) through the product cache.
+
+    Entries are tagged with the product's version as it was before the read,
+    and ignored once invalidate_product() moves it on, so a worker never
+    serves a product another worker has since changed (given a shared
+    CACHES backend). Writes to other products leave the entry alone. Callers
+    get their own copy and may modify it freely. Raises Product.DoesNotExist.
+    """
+    product_cache = get_product_cache()
+    version = get_product_version(pk)
+    product = product_cache.get(pk, version)
+    if product is None:
+        product = with_stock(Product.objects.all()).get(pk=pk)
+        product_cache.set(pk, version, product)
+    return copy.copy(product)
+
+
+def invalidate_product(pk):
+    """
+    Drop a product from the cache now, and once the current transaction
+    commits drop it again and bump its version, so neither a read racing
+    the write nor another worker can serve the old row.
+    """
+    product_cache = get_product_cache()
+    product_cache.delete(pk)
+
+    def invalidate():
+        bump_product_version(pk)
+        product_cache.delete(pk)
+
+    transaction.on_commit(invalidate)
+
+
+async def aget_product(pk):
+    """
+    Async counterpart of get_product(). The version and the entry are read
+    through the async cache APIs, so a shared cache backend is never
+    waited on in the event loop.
+    """
+    product_cache = get_product_cache()
+    version = await aget_product_version(pk)
+    product = await product_cache.aget(pk, version)
+    if product is None:
+        product = await with_stock(Product.objects.all()).aget(pk=pk)
+        await product_cache.aset(pk, version, product)
+    return copy.copy(product)
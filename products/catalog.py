@@ -0,0 +1,62 @@
+import hashlib
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOG_VERSION_KEY = 'products:catalog-version'
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version token.
+
+    The version lives in Django's cache, so multi-worker deployments need a
+    shared CACHES backend. A missing key (first use, eviction or restart)
+    just starts a new version, which can never match an ETag handed out
+    before.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version():
+    """Async counterpart of get_catalog_version()."""
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def catalog_changed():
+    """
+    Bump the catalog version once the current transaction commits.
+
+    Bumping only after commit means a reader can never pair the new
+    version with data that was not yet visible to it.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+def _representation_digest(request):
+    representation = f"{request.get_full_path()}\n{request.META.get('HTTP_ACCEPT', '')}"
+    return hashlib.sha1(representation.encode()).hexdigest()[:16]
+
+
+def catalog_etag(request, *args, **kwargs):
+    """ETag for a catalog read, used with django.views.decorators.http.condition."""
+    # The version is read before the view queries, so a concurrent write can
+    # at worst label fresh data with an old version, never the reverse.
+    return f'{get_catalog_version()}-{_representation_digest(request)}'
+
+
+async def acatalog_etag(request, *args, **kwargs):
+    """Async counterpart of catalog_etag(), used with vending_machine_api.asyncapi.acondition."""
+    return f'{await aget_catalog_version()}-{_representation_digest(request)}'
@@ -0,0 +1,129 @@
+"""
+Catalog change events, streamed to clients as Server-Sent Events.
+
+Committed product writes and purchases publish an event to the process-wide
+broadcaster. It keeps the latest BUFFER_SIZE events in memory and wakes the
+streams waiting on each event loop, which then read the new events from the
+buffer. Subscribers therefore cost no database queries, and a reconnecting
+client picks up where it left off by sending the id of the last event it
+saw. A client too far behind, or reconnecting after a restart, gets a
+`reload` event telling it to fetch the catalog again.
+
+Events are per process: only writes made by this process are seen, so
+serve the stream from the process that takes the writes, or from a single
+ASGI worker.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from django.db import transaction
+
+BUFFER_SIZE = 1000
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT = 15
+
+PRODUCT_CREATED = 'product.created'
+PRODUCT_UPDATED = 'product.updated'
+PRODUCT_DELETED = 'product.deleted'
+STOCK = 'stock'
+RELOAD = 'reload'
+
+
+class Broadcaster:
+    def __init__(self, size=BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._lock = threading.Lock()
+        # Ids start from the boot time in microseconds, so they keep
+        # increasing across restarts and an old Last-Event-ID is detected
+        self.last_id = self._floor = time.time_ns() // 1000
+        # One wake-up event per event loop with subscribers, and their count
+        self._wakeups = {}
+        self._subscribers = {}
+
+    def publish(self, kind, data):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0][0]
+            self.last_id += 1
+            self._events.append((self.last_id, kind, data))
+            loops = list(self._wakeups)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._wake, loop)
+            except RuntimeError:
+                # The loop was closed under its subscribers
+                with self._lock:
+                    self._wakeups.pop(loop, None)
+                    self._subscribers.pop(loop, None)
+
+    def since(self, last_id):
+        """Events after `last_id`, oldest first; None if some are no longer buffered."""
+        with self._lock:
+            if last_id < self._floor or last_id > self.last_id:
+                return None
+            events = []
+            for event in reversed(self._events):
+                if event[0] <= last_id:
+                    break
+                events.append(event)
+        events.reverse()
+        return events
+
+    def _wake(self, loop):
+        with self._lock:
+            wakeup = self._wakeups.get(loop)
+            if wakeup is not None:
+                self._wakeups[loop] = asyncio.Event()
+        if wakeup is not None:
+            wakeup.set()
+
+    async def stream(self, last_id=None):
+        """
+        Yield (id, kind, data) events after `last_id` as they are published,
+        or None when HEARTBEAT seconds pass without one.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers[loop] = self._subscribers.get(loop, 0) + 1
+            self._wakeups.setdefault(loop, asyncio.Event())
+            if last_id is None:
+                last_id = self.last_id
+        try:
+            while True:
+                # Taken before reading, so a publish in between still wakes us
+                with self._lock:
+                    wakeup = self._wakeups.setdefault(loop, asyncio.Event())
+                events = self.since(last_id)
+                if events is None:
+                    last_id = self.last_id
+                    events = [(last_id, RELOAD, {})]
+                for event in events:
+                    last_id = event[0]
+                    yield event
+                if not events:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            with self._lock:
+                # publish() may have forgotten the loop already
+                remaining = self._subscribers.get(loop, 0) - 1
+                if remaining > 0:
+                    self._subscribers[loop] = remaining
+                else:
+                    self._subscribers.pop(loop, None)
+                    self._wakeups.pop(loop, None)
+
+
+broadcaster = Broadcaster()
+
+
+def publish_on_commit(kind, data):
+    """
+    Publish an event once the current transaction commits. `data` can be a
+    function, called at commit, that returns the data.
+    """
+    transaction.on_commit(lambda: broadcaster.publish(kind, data() if callable(data) else data))
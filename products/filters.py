@@ -0,0 +1,65 @@
+import sys
+from django.db.models import Exists, OuterRef, Q
+from drf_yasg import openapi
+from rest_framework import serializers
+from .models import ProductStockShard
+
+# ?ordering= values; each is backed by a (field, id) index
+ORDERINGS = ['id', '-id', 'cost', '-cost', 'productName', '-productName']
+
+FILTER_PARAMETERS = [
+    openapi.Parameter('sellerId', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Only this seller's products"),
+    openapi.Parameter('min_cost', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description='Lowest cost, inclusive'),
+    openapi.Parameter('max_cost', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description='Highest cost, inclusive'),
+    openapi.Parameter('in_stock', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, description='Only products with (true) or without (false) stock'),
+    openapi.Parameter('name', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='productName prefix, case sensitive'),
+    openapi.Parameter('ordering', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=ORDERINGS, description='Sort order (default id)'),
+]
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    sellerId = serializers.IntegerField(required=False)
+    min_cost = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_cost = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    in_stock = serializers.BooleanField(required=False, allow_null=True, default=None)
+    name = serializers.CharField(required=False, trim_whitespace=False)
+    ordering = serializers.ChoiceField(choices=ORDERINGS, default='id')
+
+
+def _prefix_range(prefix):
+    """
+    productName >= prefix AND productName < prefix with its last character
+    bumped: a range an index on productName can scan, unlike LIKE 'prefix%'.
+    """
+    bounds = Q(productName__gte=prefix)
+    if ord(prefix[-1]) < sys.maxunicode:
+        bounds &= Q(productName__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    return bounds
+
+
+def filter_products(queryset, params):
+    """
+    Apply the catalog query parameters to a Product queryset.
+
+    Returns the filtered queryset and the requested ordering. Raises
+    ValidationError for malformed parameters.
+    """
+    serializer = ProductFilterSerializer(data=params)
+    serializer.is_valid(raise_exception=True)
+    filters = serializer.validated_data
+
+    if 'sellerId' in filters:
+        queryset = queryset.filter(sellerId=filters['sellerId'])
+    if 'min_cost' in filters:
+        queryset = queryset.filter(cost__gte=filters['min_cost'])
+    if 'max_cost' in filters:
+        queryset = queryset.filter(cost__lte=filters['max_cost'])
+    if filters.get('name'):
+        queryset = queryset.filter(_prefix_range(filters['name']))
+    if filters['in_stock'] is not None:
+        # Sharded products keep their stock in the shards (see products.stock)
+        in_stock = Q(amountAvailable__gt=0) | Q(
+            Exists(ProductStockShard.objects.filter(product=OuterRef('pk'), amount__gt=0)), stockShards__gt=0,
+        )
+        queryset = queryset.filter(in_stock if filters['in_stock'] else ~in_stock)
+    return queryset, filters['ordering']
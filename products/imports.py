@@ -0,0 +1,107 @@
+"""
+Bulk product import from CSV or NDJSON uploads.
+
+Rows are read from the request stream one line at a time, validated with
+ProductSerializer and inserted batch by batch, so memory use depends on
+the batch size rather than the upload size.
+"""
+import codecs
+import csv
+import json
+from itertools import islice
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from .catalog import catalog_changed
+from .events import RELOAD, publish_on_commit
+from .models import Product
+from .serializers import ProductSerializer
+
+IMPORT_FIELDS = ['productName', 'amountAvailable', 'cost']
+
+BATCH_SIZE = 500
+
+# Errors beyond this many are counted but not reported row by row
+MAX_REPORTED_ERRORS = 1000
+
+
+def _parse_error(message):
+    return ValidationError({'non_field_errors': [message]})
+
+
+def csv_rows(stream):
+    """
+    Yield (line number, row) from a CSV stream with a header row.
+
+    Rows can span lines, so reading stops at the first line that isn't
+    UTF-8 or can't be parsed; that line is yielded as an error.
+    """
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except UnicodeDecodeError:
+        yield reader.line_num + 1, _parse_error('Not valid UTF-8; the rest of the body was not imported.')
+    except csv.Error as e:
+        yield reader.line_num + 1, _parse_error(f'CSV parse error - {e}; the rest of the body was not imported.')
+
+
+def ndjson_rows(stream):
+    """Yield (line number, row) from a stream of one JSON object per line."""
+    for line_num, line in enumerate(stream, start=1):
+        try:
+            line = line.decode('utf-8-sig' if line_num == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            yield line_num, _parse_error('Not valid UTF-8.')
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_num, _parse_error(f'JSON parse error - {e}')
+            continue
+        if not isinstance(row, dict):
+            row = _parse_error('Expected a JSON object.')
+        yield line_num, row
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def import_products(rows, seller_id, batch_size=BATCH_SIZE):
+    """
+    Create products from (line number, row) pairs on behalf of a seller.
+
+    Each row is validated as a ProductSerializer create would be, apart from
+    sellerId, which is always `seller_id`. Valid rows are inserted with one
+    bulk_create per batch, in its own transaction, and invalid ones are
+    reported by line number. Returns the report.
+    """
+    serializer = ProductSerializer(fields=IMPORT_FIELDS)
+    report = {'created': 0, 'failed': 0, 'errors': []}
+
+    for batch in _batches(rows, batch_size):
+        products = []
+        for line_num, row in batch:
+            try:
+                if isinstance(row, ValidationError):
+                    raise row
+                products.append(Product(sellerId_id=seller_id, **serializer.run_validation(row)))
+            except ValidationError as e:
+                report['failed'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'line': line_num, 'errors': e.detail})
+        if products:
+            with transaction.atomic():
+                Product.objects.bulk_create(products)
+                # bulk_create bypasses the Product signals; streams are told
+                # to fetch the catalog again rather than sent every product
+                catalog_changed()
+                publish_on_commit(RELOAD, {})
+            report['created'] += len(products)
+
+    report['errors_truncated'] = report['failed'] > len(report['errors'])
+    return report
@@ -0,0 +1,85 @@
+import random
+import time
+from itertools import chain, islice, repeat
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from machines.change import add_coin
+from machines.models import COINS, DEFAULT_MACHINE_ID
+from products.models import Product
+from users.models import CustomUser
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Generate buyers, sellers and products in bulk for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=100000)
+        parser.add_argument('--sellers', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per INSERT (default: 10000).')
+        parser.add_argument('--prefix', default='bench', help='Username prefix (default: bench).')
+        parser.add_argument(
+            '--password', default='password123',
+            help='Password for every generated user; it is hashed once (default: password123).',
+        )
+        parser.add_argument('--coins', type=int, default=1000, help='Coins of each value to put in the machine.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable data.')
+
+    def handle(self, *args, **options):
+        if options['products'] and not options['sellers']:
+            raise CommandError('Products need at least one seller.')
+        rng = random.Random(options['seed'])
+        size = options['chunk_size']
+        prefix = options['prefix']
+        password = make_password(options['password'])
+        started = time.perf_counter()
+
+        # Carry on numbering after an earlier run with the same prefix
+        offset = CustomUser.objects.filter(username__startswith=f'{prefix}-').count()
+        users = (
+            CustomUser(
+                username=f'{prefix}-{role}-{offset + i}', password=password, role=role,
+                deposit=rng.randrange(0, 1000, 5) if role == 'buyer' else 0,
+            )
+            for i, role in enumerate(chain(repeat('seller', options['sellers']), repeat('buyer', options['buyers'])))
+        )
+        count = 0
+        for chunk in chunked(users, size):
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(chunk)
+            count += len(chunk)
+            self.stdout.write(f'{count} users', ending='\r')
+
+        # Not every backend returns primary keys from bulk_create
+        seller_ids = list(
+            CustomUser.objects.filter(username__startswith=f'{prefix}-seller-').values_list('pk', flat=True)
+        )
+
+        products = (
+            Product(
+                productName=f'{prefix} product {i}', amountAvailable=rng.randrange(1000),
+                cost=rng.randrange(5, 500, 5), sellerId_id=rng.choice(seller_ids),
+            )
+            for i in range(options['products'])
+        )
+        count = 0
+        for chunk in chunked(products, size):
+            with transaction.atomic():
+                Product.objects.bulk_create(chunk)
+            count += len(chunk)
+            self.stdout.write(f'{count} products', ending='\r')
+
+        for coin in COINS:
+            add_coin(DEFAULT_MACHINE_ID, coin, options['coins'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {options["sellers"]} sellers, {options["buyers"]} buyers and '
+            f'{options["products"]} products in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.models import Product
+from products.stock import shard_stock
+
+
+class Command(BaseCommand):
+    help = 'Spread a product\'s stock over several counters so concurrent buyers contend less.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument(
+            '--shards', type=int, default=8,
+            help='Number of stock shards, or 0 to go back to a single counter (default: 8).',
+        )
+
+    def handle(self, *args, **options):
+        if options['shards'] < 0:
+            raise CommandError('--shards must be 0 or more.')
+        try:
+            product = shard_stock(options['product_id'], options['shards'])
+        except Product.DoesNotExist:
+            raise CommandError(f'Product {options["product_id"]} does not exist.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Product {product.pk} now has {product.stockShards} stock shards.'
+        ))
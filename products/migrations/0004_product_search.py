@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# The SQL is frozen here as it was when the index was added; products.search
+# keeps its own copy for the post_migrate repair.
+
+CREATE_SEARCH_INDEX = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5(
+        productName, content='products_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts(rowid, productName) VALUES (new.id, new.productName);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, productName) VALUES ('delete', old.id, old.productName);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_update AFTER UPDATE OF productName ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, productName) VALUES ('delete', old.id, old.productName);
+        INSERT INTO products_product_fts(rowid, productName) VALUES (new.id, new.productName);
+    END
+    """,
+    "INSERT INTO products_product_fts(products_product_fts) VALUES ('rebuild')",
+]
+
+DROP_SEARCH_INDEX = [
+    'DROP TRIGGER IF EXISTS products_product_fts_update',
+    'DROP TRIGGER IF EXISTS products_product_fts_delete',
+    'DROP TRIGGER IF EXISTS products_product_fts_insert',
+    'DROP TABLE IF EXISTS products_product_fts',
+]
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """RunSQL that only runs on SQLite; other backends search without an index."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_catalog_indexes'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(CREATE_SEARCH_INDEX, DROP_SEARCH_INDEX),
+    ]
@@ -5,7 +5,33 @@ class Product(models.Model):
     productName = models.CharField(max_length=100)
     amountAvailable = models.IntegerField(default=0)
     cost = models.DecimalField(max_digits=10, decimal_places=2)
-    sellerId = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    # Indexed by product_seller_idx below, which also orders by id
+    sellerId = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_index=False)
+    # When non-zero the stock lives in this many ProductStockShard rows, so
+    # concurrent buyers update different rows (see products.stock)
+    stockShards = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        # One index per catalog sort, alone and behind the sellerId filter,
+        # each ending in id for the keyset cursor (see products.filters)
+        indexes = [
+            models.Index(fields=['cost', 'id'], name='product_cost_idx'),
+            models.Index(fields=['productName', 'id'], name='product_name_idx'),
+            models.Index(fields=['sellerId', 'id'], name='product_seller_idx'),
+            models.Index(fields=['sellerId', 'cost', 'id'], name='product_seller_cost_idx'),
+            models.Index(fields=['sellerId', 'productName', 'id'], name='product_seller_name_idx'),
+        ]
 
     def __str__(self):
         return self.productName
+
+
+class ProductStockShard(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    amount = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='unique_product_shard'),
+        ]
@@ -0,0 +1,148 @@
+"""
+Full-text search over Product.productName.
+
+On SQLite the names are indexed in an FTS5 table kept in sync by triggers.
+The CANDIDATES best matches by FTS5's bm25 rank, which favours short names,
+are read and then sorted here by how many words match exactly, then by name
+length, so a prefix match does not outrank an exact one. Other backends fall
+back to matching every search term as a case-insensitive substring, reading
+the CANDIDATES shortest names and ranking them the same way.
+"""
+import re
+import unicodedata
+from django.db import connections
+from django.db.models.functions import Length
+from .models import Product
+
+FTS_TABLE = 'products_product_fts'
+
+CREATE_FTS_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        productName, content='products_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )
+"""
+
+# Triggers rather than signals, so bulk_create() and queryset updates are
+# indexed too
+CREATE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, productName) VALUES (new.id, new.productName);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, productName) VALUES ('delete', old.id, old.productName);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF productName ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, productName) VALUES ('delete', old.id, old.productName);
+        INSERT INTO {FTS_TABLE}(rowid, productName) VALUES (new.id, new.productName);
+    END
+    """,
+]
+
+MAX_TERMS = 8
+
+# Best matches read per search and ranked
+CANDIDATES = 50
+
+_terms = re.compile(r'\w+')
+
+
+def create_search_index(connection):
+    """
+    Create the FTS index and its triggers, and index every product. The
+    products migration that added the index has its own copy of this SQL.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_FTS_TABLE)
+        for sql in CREATE_TRIGGERS:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def repair_search_index(connection):
+    """
+    Put back triggers lost when a migration rebuilt products_product, which
+    SQLite does for many schema changes, and reindex what they missed.
+    """
+    if not has_search_index(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'products_product' AND name LIKE %s",
+            [f'{FTS_TABLE}_%'],
+        )
+        if cursor.fetchone()[0] < len(CREATE_TRIGGERS):
+            create_search_index(connection)
+
+
+_indexed_aliases = set()
+
+
+def has_search_index(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _indexed_aliases:
+        if FTS_TABLE not in connection.introspection.table_names():
+            return False
+        _indexed_aliases.add(connection.alias)
+    return True
+
+
+def search_terms(text):
+    """Split text into lower-cased words without diacritics, as FTS5 does."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return _terms.findall(''.join(char for char in text if not unicodedata.combining(char)))
+
+
+def rank(terms, candidates):
+    """Order (id, name) candidates best match first; returns their ids."""
+    terms = set(terms)
+
+    def key(candidate):
+        pk, name = candidate
+        words = search_terms(name)
+        return (-len(terms.intersection(words)), len(words), pk)
+
+    return [pk for pk, _ in sorted(candidates, key=key)]
+
+
+def search_products(query, limit=20, using='default'):
+    """
+    Return up to `limit` product ids matching every word of `query`, best
+    match first. The last word also matches as a prefix, so results follow
+    the user's typing.
+    """
+    terms = search_terms(query)[:MAX_TERMS]
+    if not terms:
+        return []
+    connection = connections[using]
+    if has_search_index(connection):
+        # Quoted, so words like AND or NEAR are not FTS5 operators
+        match = ' '.join(f'"{term}"' for term in terms)
+        candidates = _match(connection, match)
+        # Prefixes longer than the indexed ones are expensive for common
+        # words, so only look for them when the exact words are not enough
+        if len(candidates) < CANDIDATES and len(terms[-1]) > 1:
+            candidates = _match(connection, match + '*')
+    else:
+        products = Product.objects.using(using)
+        for term in terms:
+            products = products.filter(productName__icontains=term)
+        candidates = list(products.order_by(Length('productName'), 'id').values_list('id', 'productName')[:CANDIDATES])
+    return rank(terms, candidates)[:limit]
+
+
+def _match(connection, match):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, productName FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s',
+            [match, CANDIDATES],
+        )
+        return cursor.fetchall()
@@ -1,8 +1,29 @@
-from rest_framework import serializers
+from django.db import transaction
+from vending_machine_api.serializers import DynamicFieldsModelSerializer
 from .models import Product
+from .stock import get_stock, set_stock
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'productName', 'amountAvailable', 'cost', 'sellerId']
 
+    # Lists are annotated with_stock()
+    values_lookups = {'amountAvailable': 'stock'}
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'amountAvailable' in data:
+            data['amountAvailable'] = get_stock(instance)
+        return data
+
+    def update(self, instance, validated_data):
+        if not instance.stockShards or 'amountAvailable' not in validated_data:
+            return super().update(instance, validated_data)
+        # Sharded stock is spread over the shards rather than saved on the row
+        total = validated_data.pop('amountAvailable')
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            set_stock(instance, total)
+        instance.stock = total
+        return instance
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import invalidate_product
+from .catalog import catalog_changed
+from .events import PRODUCT_CREATED, PRODUCT_DELETED, PRODUCT_UPDATED, publish_on_commit
+from .models import Product
+from .serializers import ProductSerializer
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_product(instance.pk)
+    catalog_changed()
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    # Serialized at commit, after ProductSerializer.update() has set any
+    # sharded stock
+    publish_on_commit(PRODUCT_CREATED if created else PRODUCT_UPDATED, lambda: ProductSerializer(instance).data)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    publish_on_commit(PRODUCT_DELETED, {'id': instance.pk})
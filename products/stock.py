@@ -0,0 +1,110 @@
+import random
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Product, ProductStockShard
+
+
+def with_stock(queryset):
+    """
+    Annotate Product rows with `stock`: amountAvailable plus whatever sits
+    in stock shards. For unsharded products that is just amountAvailable.
+    """
+    shards = (
+        ProductStockShard.objects.filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return queryset.annotate(stock=F('amountAvailable') + Coalesce(Subquery(shards), Value(0)))
+
+
+def get_stock(product):
+    """Return the total stock of a product instance."""
+    if getattr(product, 'stock', None) is not None:
+        return product.stock
+    if not product.stockShards:
+        return product.amountAvailable
+    shards = ProductStockShard.objects.filter(product=product).aggregate(total=Sum('amount'))['total']
+    return product.amountAvailable + (shards or 0)
+
+
+def take_stock(product_id, amount):
+    """
+    Remove `amount` units of a product with guarded UPDATEs; returns whether
+    there was enough stock.
+
+    Unsharded products are one UPDATE of amountAvailable. For sharded ones
+    that UPDATE matches nothing, and a randomly chosen shard holding enough
+    is decremented instead, falling back to the others when it runs dry
+    and finally to taking from several shards. Must run inside the
+    caller's transaction, which has to be rolled back on failure.
+    """
+    if Product.objects.filter(pk=product_id, amountAvailable__gte=amount).update(
+        amountAvailable=F('amountAvailable') - amount
+    ):
+        return True
+
+    for _ in range(3):
+        shards = list(ProductStockShard.objects.filter(product_id=product_id).values_list('shard', 'amount'))
+        if sum(available for _, available in shards) < amount:
+            return False
+        random.shuffle(shards)
+        candidates = [shard for shard, available in shards if available >= amount]
+        for shard in candidates:
+            if _take_from_shard(product_id, shard, amount):
+                return True
+
+        # No single shard holds enough: gather it from several
+        remaining = amount
+        with transaction.atomic():
+            for shard, available in shards:
+                take = min(available, remaining)
+                if take and _take_from_shard(product_id, shard, take):
+                    remaining -= take
+                if not remaining:
+                    return True
+            # Concurrent buyers drained the shards we read; undo and re-read
+            transaction.set_rollback(True)
+    return False
+
+
+def _take_from_shard(product_id, shard, amount):
+    return ProductStockShard.objects.filter(product_id=product_id, shard=shard, amount__gte=amount).update(
+        amount=F('amount') - amount
+    )
+
+
+def _split(total, shards):
+    return [total // shards + (1 if i < total % shards else 0) for i in range(shards)]
+
+
+def set_stock(product, total):
+    """Set a product's total stock, spread evenly over its shards if it has any."""
+    if not product.stockShards:
+        Product.objects.filter(pk=product.pk).update(amountAvailable=total)
+        return
+    with transaction.atomic():
+        Product.objects.filter(pk=product.pk).update(amountAvailable=0)
+        for shard, amount in enumerate(_split(total, product.stockShards)):
+            ProductStockShard.objects.update_or_create(product=product, shard=shard, defaults={'amount': amount})
+
+
+def shard_stock(product_id, shards):
+    """
+    Switch a product to `shards` stock shards, or back to a plain
+    amountAvailable counter with shards=0, keeping its total stock.
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        total = get_stock(product)
+        ProductStockShard.objects.filter(product=product).delete()
+        product.stockShards = shards
+        product.amountAvailable = 0 if shards else total
+        ProductStockShard.objects.bulk_create(
+            ProductStockShard(product=product, shard=shard, amount=amount)
+            for shard, amount in enumerate(_split(total, shards) if shards else [])
+        )
+        # Saving the product also bumps the catalog version and cache
+        product.save(update_fields=['stockShards', 'amountAvailable'])
+    return product
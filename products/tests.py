@@ -1,6 +1,35 @@
-from django.test import TestCase
-from .models import Product
+import asyncio
+import copy
+import csv
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from .models import Product, ProductStockShard
+from .serializers import ProductSerializer
+from .async_views import product_events
+from .cache import DjangoProductCache, LocalProductCache, get_product, get_product_cache
+from .events import Broadcaster, RELOAD, STOCK, PRODUCT_UPDATED, broadcaster
+from .imports import import_products, ndjson_rows
+from .search import CANDIDATES, repair_search_index
+from .stock import shard_stock, take_stock, with_stock
+from machines.models import CoinInventory, DEFAULT_MACHINE_ID
+from users import ledger
+from users.authentication import UserClaimsRefreshToken
 from users.models import CustomUser
+from users.purchase import purchase
+from vending_machine_api import metrics
+from vending_machine_api.renderers import FastJSONRenderer
+from vending_machine_api.routers import read_from_replica
 
 class ProductTestCase(TestCase):
     def setUp(self):
@@ -44,3 +73,610 @@ class ProductTestCase(TestCase):
         with self.assertRaises(Product.DoesNotExist):
             Product.objects.get(id=product_id)
 
+
+class ProductListTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        Product.objects.bulk_create(
+            Product(productName=f'Product {i}', amountAvailable=i, cost=5, sellerId=self.seller)
+            for i in range(25)
+        )
+        self.client = APIClient()
+
+    def test_cursor_pagination_walks_every_product_once(self):
+        seen = []
+        url = '/api/products/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 10)
+            seen.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(Product.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_sparse_fieldset(self):
+        response = self.client.get('/api/products/?fields=id,productName&page_size=1')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'productName'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/products/?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductFilterTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.other = CustomUser.objects.create_user(username='other', password='password123', role='seller')
+        Product.objects.bulk_create(
+            Product(productName=f'{name} {i}', amountAvailable=i % 3, cost=5 * (1 + i % 4), sellerId=seller)
+            for i, (name, seller) in enumerate([('Cola', self.seller), ('Chips', self.other), ('Candy', self.seller)] * 6)
+        )
+        self.client = APIClient()
+
+    def walk(self, query):
+        seen = []
+        url = f'/api/products/?page_size=4&{query}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_filters(self):
+        query = f'sellerId={self.seller.id}&min_cost=10&max_cost=15&in_stock=true&name=Co'
+        expected = Product.objects.filter(sellerId=self.seller, cost__range=(10, 15), amountAvailable__gt=0, productName__startswith='Co')
+        self.assertEqual(self.walk(query), list(expected.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(len(self.walk('in_stock=false')), 6)
+
+    def test_in_stock_counts_stock_shards(self):
+        product = Product.objects.filter(amountAvailable=2).first()
+        shard_stock(product.id, 2)
+        self.assertIn(product.id, self.walk('in_stock=true'))
+        ProductStockShard.objects.filter(product=product).update(amount=0)
+        self.assertNotIn(product.id, self.walk('in_stock=true'))
+
+    def test_orderings_walk_every_product_once(self):
+        for ordering, keys in [('-cost', ('-cost', '-id')), ('productName', ('productName', 'id')), ('-id', ('-id',))]:
+            expected = list(Product.objects.order_by(*keys).values_list('id', flat=True))
+            self.assertEqual(self.walk(f'ordering={ordering}'), expected)
+
+    def test_previous_page_with_ordering(self):
+        first = self.client.get('/api/products/?page_size=4&ordering=cost').data
+        second = self.client.get(first['next']).data
+        self.assertEqual(self.client.get(second['previous']).data['results'], first['results'])
+
+    def test_bad_parameters_are_rejected(self):
+        for query in ['ordering=secret', 'min_cost=cheap', 'in_stock=maybe', 'sellerId=me']:
+            self.assertEqual(self.client.get(f'/api/products/?{query}').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/?ordering=cost&cursor=garbage').status_code, 404)
+
+
+class ProductETagTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', deposit=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(productName='Cola', amountAvailable=10, cost=5, sellerId=self.seller)
+        self.client = APIClient()
+
+    def test_unchanged_catalog_is_not_modified(self):
+        url = f'/api/products/{self.product.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_and_detail_have_different_etags(self):
+        self.assertNotEqual(self.client.get('/api/products/')['ETag'], self.client.get(f'/api/products/{self.product.id}/')['ETag'])
+
+    def test_product_write_changes_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_purchase_changes_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+        self.client.force_authenticate(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/users/buy/', {'productId': self.product.id, 'amount': 1}, format='json')
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ProductCacheTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.product = Product.objects.create(productName='Cola', amountAvailable=10, cost=5, sellerId=self.seller)
+
+    def test_lru_eviction_and_counters(self):
+        cache = LocalProductCache(max_entries=2, timeout=60)
+        cache.set(1, 'v1', 'one')
+        cache.set(2, 'v1', 'two')
+        self.assertEqual(cache.get(1, 'v1'), 'one')
+        cache.set(3, 'v1', 'three')
+        self.assertIsNone(cache.get(2, 'v1'))
+        self.assertIsNone(cache.get(1, 'v2'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = LocalProductCache(timeout=-1)
+        cache.set(1, 'v1', 'one')
+        self.assertIsNone(cache.get(1, 'v1'))
+
+    def test_cached_lookup_skips_the_database(self):
+        get_product(self.product.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_product(self.product.id).productName, 'Cola')
+
+    def test_write_invalidates_entry(self):
+        get_product(self.product.id)
+        self.product.productName = 'Diet Cola'
+        self.product.save()
+        self.assertEqual(get_product(self.product.id).productName, 'Diet Cola')
+
+    def test_writes_to_other_products_keep_the_entry(self):
+        other = Product.objects.create(productName='Water', amountAvailable=10, cost=5, sellerId=self.seller)
+        get_product(self.product.id)
+        get_product(other.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            purchase(CustomUser.objects.create_user(username='buyer', password='password123', role='buyer', deposit=5).id, other.id, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_product(self.product.id).productName, 'Cola')
+        self.assertEqual(get_product(other.id).amountAvailable, 9)
+
+    def test_delete_is_a_single_lookup(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        response = client.delete(f'/api/products/{self.product.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Product.objects.filter(pk=self.product.id).exists())
+
+
+class AsyncProductViewsTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        Product.objects.bulk_create(
+            Product(productName=f'Product {i}', amountAvailable=i, cost=5, sellerId=self.seller)
+            for i in range(5)
+        )
+
+    async def test_async_list_matches_sync_list(self):
+        sync_page = await sync_to_async(self.client.get)('/api/products/?page_size=2&fields=id,productName')
+        async_page = await self.async_client.get('/api/products/?page_size=2&fields=id,productName'.replace('/api/', '/api/async/'))
+        self.assertEqual(async_page.status_code, 200)
+        self.assertEqual(async_page.json()['results'], sync_page.json()['results'])
+
+    async def test_async_list_follows_cursors(self):
+        seen = []
+        url = '/api/async/products/?page_size=2'
+        while url:
+            data = (await self.async_client.get(url)).json()
+            seen.extend(product['id'] for product in data['results'])
+            url = data['next']
+        self.assertEqual(seen, [pk async for pk in Product.objects.order_by('id').values_list('id', flat=True)])
+        previous = (await self.async_client.get(data['previous'])).json()
+        self.assertEqual([product['id'] for product in previous['results']], seen[-3:-1])
+
+    async def test_async_detail(self):
+        product = await Product.objects.afirst()
+        response = await self.async_client.get(f'/api/async/products/{product.id}/')
+        self.assertEqual(response.json()['productName'], product.productName)
+        response = await self.async_client.get(f'/api/async/products/{product.id}/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_async_views_never_wait_on_the_cache_in_the_event_loop(self):
+        product = await Product.objects.afirst()
+
+        def off_the_loop(method):
+            def wrapper(*args, **kwargs):
+                with self.assertRaises(RuntimeError):
+                    asyncio.get_running_loop()
+                return method(*args, **kwargs)
+            return wrapper
+
+        cache_class = type(caches['default'])
+        product_cache = patch('products.cache._product_cache', DjangoProductCache())
+        product_cache.start()
+        self.addCleanup(product_cache.stop)
+        with patch.object(cache_class, 'get', off_the_loop(cache_class.get)), patch.object(cache_class, 'add', off_the_loop(cache_class.add)), \
+                patch.object(cache_class, 'set', off_the_loop(cache_class.set)):
+            for _ in range(2):
+                response = await self.async_client.get(f'/api/async/products/{product.id}/')
+                self.assertEqual(response.json()['productName'], product.productName)
+            response = await self.async_client.get('/api/async/products/')
+            self.assertEqual(response.status_code, 200)
+            response = await self.async_client.get('/api/async/products/', headers={'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304)
+        self.assertEqual(get_product_cache().stats()['hits'], 1)
+
+
+class ShardedStockTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.product = Product.objects.create(productName='Cola', amountAvailable=10, cost=5, sellerId=self.seller)
+        shard_stock(self.product.id, 4)
+
+    def test_sharding_keeps_the_total(self):
+        self.assertEqual(sorted(ProductStockShard.objects.values_list('amount', flat=True)), [2, 2, 3, 3])
+        self.assertEqual(Product.objects.get(pk=self.product.id).amountAvailable, 0)
+        self.assertEqual(self.client.get(f'/api/products/{self.product.id}/').json()['amountAvailable'], 10)
+        product = shard_stock(self.product.id, 0)
+        self.assertEqual(product.amountAvailable, 10)
+        self.assertFalse(ProductStockShard.objects.exists())
+
+    def test_take_stock_from_one_or_several_shards(self):
+        self.assertTrue(take_stock(self.product.id, 2))
+        self.assertTrue(take_stock(self.product.id, 7))
+        self.assertFalse(take_stock(self.product.id, 2))
+        self.assertEqual(with_stock(Product.objects.all()).get(pk=self.product.id).stock, 1)
+
+    def test_update_spreads_stock_over_shards(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        response = client.put(f'/api/products/{self.product.id}/', {'productName': 'Cola', 'amountAvailable': 8, 'cost': 5}, format='json')
+        self.assertEqual(response.json()['amountAvailable'], 8)
+        self.assertEqual(sorted(ProductStockShard.objects.values_list('amount', flat=True)), [2, 2, 2, 2])
+
+
+class SeedDataTestCase(TestCase):
+    def test_seeds_users_products_and_coins(self):
+        call_command('seed_data', buyers=25, sellers=3, products=40, chunk_size=10, coins=5, stdout=StringIO())
+        self.assertEqual(CustomUser.objects.filter(role='seller').count(), 3)
+        self.assertEqual(CustomUser.objects.filter(role='buyer').count(), 25)
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(CoinInventory.objects.get(coin=100).count, 5)
+        response = self.client.post('/api/users/login/', {'username': 'bench-buyer-3', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_second_run_adds_new_users(self):
+        call_command('seed_data', buyers=5, sellers=1, products=0, stdout=StringIO())
+        call_command('seed_data', buyers=5, sellers=1, products=0, stdout=StringIO())
+        self.assertEqual(CustomUser.objects.filter(username__startswith='bench-').count(), 12)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.product = Product.objects.create(productName='Cola', amountAvailable=10, cost=5, sellerId=self.seller)
+        metrics.reset()
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/products/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries"$')
+
+    def test_metrics_are_aggregated_by_view(self):
+        self.client.get(f'/api/products/{self.product.id}/')
+        self.client.get(f'/api/products/{self.product.id}/')
+        self.client.get('/api/products/999/')
+        with override_settings(METRICS_TOKEN='scrape-token'):
+            response = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="product-detail",method="GET"} 3', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="product-detail",method="GET",le="+Inf"} 3', body)
+        self.assertIn('http_requests_total{view="product-detail",method="GET",status="2xx"} 2', body)
+        self.assertIn('http_requests_total{view="product-detail",method="GET",status="4xx"} 1', body)
+        # The second read is served from the product cache
+        self.assertIn('db_queries_total{view="product-detail",method="GET"} 2', body)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_metrics_need_staff_or_the_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer wrong-token').status_code, 403)
+        token = UserClaimsRefreshToken.for_user(self.seller).access_token
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 403)
+        self.seller.is_staff = True
+        token = UserClaimsRefreshToken.for_user(self.seller).access_token
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+
+    async def test_async_views_count_queries(self):
+        await self.async_client.get('/api/async/products/')
+        series = metrics.collect()[('async-product-list', 'GET')]
+        self.assertEqual(series.count, 1)
+        self.assertEqual(series.queries, 1)
+
+
+class ProductImportTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def test_csv_import_reports_bad_rows(self):
+        body = 'productName,amountAvailable,cost\nCola,10,5\nWater,lots,5\nChips,3,10\n'
+        response = self.client.post('/api/products/import/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(response.json()['failed'], 1)
+        self.assertEqual(response.json()['errors'][0]['line'], 3)
+        self.assertIn('amountAvailable', response.json()['errors'][0]['errors'])
+        self.assertEqual(list(Product.objects.order_by('id').values_list('productName', 'sellerId')), [('Cola', self.seller.id), ('Chips', self.seller.id)])
+
+    def test_ndjson_import_in_batches(self):
+        rows = [json.dumps({'productName': f'Product {i}', 'amountAvailable': i, 'cost': 5, 'sellerId': 999}) for i in range(7)]
+        stream = BytesIO(('\n'.join(rows[:3] + ['not json', ''] + rows[3:]) + '\n').encode())
+        with CaptureQueriesContext(connection) as queries:
+            report = import_products(ndjson_rows(stream), self.seller.id, batch_size=3)
+        # One INSERT per batch and no per-row lookups
+        self.assertEqual([query['sql'].split()[0] for query in queries].count('INSERT'), 3)
+        self.assertEqual(len(queries), 9)
+        self.assertEqual(report['created'], 7)
+        self.assertEqual(report['errors'][0]['line'], 4)
+        self.assertEqual(Product.objects.filter(sellerId=self.seller).count(), 7)
+
+    def test_csv_import_stops_at_a_line_that_is_not_utf8(self):
+        body = 'productName,amountAvailable,cost\nCola,10,5\nCaf\u00e9,3,10\nChips,3,10\n'.encode('latin-1')
+        response = self.client.post('/api/products/import/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['errors'][0]['line'], 3)
+        self.assertEqual(list(Product.objects.values_list('productName', flat=True)), ['Cola'])
+
+    def test_csv_parse_error_is_reported(self):
+        body = 'productName,amountAvailable,cost\nCola,10,5\n' + 'x' * (csv.field_size_limit() + 1) + ',3,10\n'
+        response = self.client.post('/api/products/import/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['errors'][0]['line'], 3)
+        self.assertIn('CSV parse error', response.json()['errors'][0]['errors']['non_field_errors'][0])
+
+    def test_ndjson_import_skips_lines_that_are_not_utf8(self):
+        body = b'{"productName": "Caf\xe9", "amountAvailable": 1, "cost": 5}\n{"productName": "Cola", "amountAvailable": 1, "cost": 5}\n'
+        response = self.client.post('/api/products/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['errors'][0]['line'], 1)
+
+    def test_nothing_imported_is_a_bad_request(self):
+        response = self.client.post('/api/products/import/', '{"productName": "Cola"}\n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['failed'], 1)
+
+    def test_unsupported_media_type(self):
+        response = self.client.post('/api/products/import/', {'productName': 'Cola'}, format='json')
+        self.assertEqual(response.status_code, 415)
+
+
+class ProductSearchTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        Product.objects.bulk_create(
+            Product(productName=name, amountAvailable=1, cost=5, sellerId=self.seller)
+            for name in ['Cola Zero', 'Cola', 'Cherry Cola Classic Edition', 'Chocolate Bar', 'Crème Brûlée']
+        )
+        self.client = APIClient()
+
+    def names(self, query):
+        response = self.client.get(f'/api/products/search/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [product['productName'] for product in response.data['results']]
+
+    def test_ranked_and_prefix_matching(self):
+        self.assertEqual(self.names('q=cola')[0], 'Cola')
+        self.assertEqual(set(self.names('q=cola')), {'Cola', 'Cola Zero', 'Cherry Cola Classic Edition'})
+        self.assertEqual(self.names('q=cola ze'), ['Cola Zero'])
+        self.assertEqual(self.names('q=choc'), ['Chocolate Bar'])
+        self.assertEqual(self.names('q=creme brulee'), ['Crème Brûlée'])
+        self.assertEqual(self.names('q=cola&limit=1'), ['Cola'])
+        self.assertEqual(self.names('q=AND OR "'), [])
+
+    def test_index_follows_writes(self):
+        product = Product.objects.get(productName='Cola')
+        product.productName = 'Lemonade'
+        product.save()
+        Product.objects.filter(productName='Cola Zero').delete()
+        self.assertEqual(self.names('q=lemon'), ['Lemonade'])
+        self.assertEqual(self.names('q=cola'), ['Cherry Cola Classic Edition'])
+
+    def test_substring_fallback(self):
+        with patch('products.search.has_search_index', return_value=False):
+            self.assertEqual(self.names('q=ola ze'), ['Cola Zero'])
+
+    def test_best_match_past_the_candidates(self):
+        Product.objects.bulk_create(
+            Product(productName=f'Tonic Water Batch {i}', amountAvailable=1, cost=5, sellerId=self.seller)
+            for i in range(CANDIDATES + 10)
+        )
+        Product.objects.create(productName='Tonic', amountAvailable=1, cost=5, sellerId=self.seller)
+        self.assertEqual(self.names('q=tonic')[0], 'Tonic')
+        self.assertEqual(self.names('q=toni')[0], 'Tonic')
+        with patch('products.search.has_search_index', return_value=False):
+            self.assertEqual(self.names('q=tonic')[0], 'Tonic')
+
+    def test_lost_triggers_are_restored(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER products_product_fts_insert')
+        Product.objects.create(productName='Water', amountAvailable=1, cost=5, sellerId=self.seller)
+        repair_search_index(connection)
+        self.assertEqual(self.names('q=water'), ['Water'])
+
+    def test_bad_limit(self):
+        self.assertEqual(self.client.get('/api/products/search/?q=cola&limit=0').status_code, 400)
+
+
+class ReplicaRoutingTestCase(TestCase):
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_reads_go_to_the_replica_until_a_write(self):
+        product = Product(productName='Cola')
+        product._state.db = 'replica1'
+        aliases = []
+
+        @read_from_replica
+        def view():
+            aliases.append(router.db_for_read(Product))
+            aliases.append(router.db_for_write(Product, instance=product))
+            aliases.append(router.db_for_read(Product))
+
+        view()
+        aliases.append(router.db_for_read(Product))
+        self.assertEqual(aliases, ['replica1', 'default', 'default', 'default'])
+
+    def test_reads_stay_on_the_primary_without_replicas(self):
+        self.assertEqual(read_from_replica(lambda: router.db_for_read(Product))(), 'default')
+
+    def test_connections_get_the_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@override_settings(DATABASE_REPLICAS=['lagging'])
+class LaggingReplicaTestCase(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite file, only as fresh as its last sync. It's added
+        # here, since the test runner checks the databases before this runs
+        cls.databases = {'default', 'lagging'}
+        cls.directory = tempfile.TemporaryDirectory()
+        settings_dict = copy.deepcopy(connections['default'].settings_dict)
+        settings_dict['NAME'] = os.path.join(cls.directory.name, 'replica.sqlite3')
+        connections.settings['lagging'] = settings_dict
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['lagging'].close()
+        del connections['lagging']
+        del connections.settings['lagging']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.product = Product.objects.create(productName='Cola', amountAvailable=5, cost=10, sellerId=self.seller)
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+
+    def test_catalog_reads_stay_current_while_the_replica_lags(self):
+        self.assertEqual(self.client.get(f'/api/products/{self.product.id}/').data['productName'], 'Cola')
+        etag = self.client.get('/api/products/').headers['ETag']
+        self.product.productName = 'Cherry Cola'
+        self.product.save()
+        CustomUser.objects.create_user(username='buyer', password='password123', role='buyer')
+
+        self.assertEqual(Product.objects.using('lagging').get(pk=self.product.id).productName, 'Cola')
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['productName'] for p in response.data['results']], ['Cherry Cola'])
+        self.assertEqual(self.client.get(f'/api/products/{self.product.id}/').data['productName'], 'Cherry Cola')
+        self.assertEqual(self.client.get(f'/api/machines/{DEFAULT_MACHINE_ID}/products/{self.product.id}/').data['productName'], 'Cherry Cola')
+        # The user list still reads from the replica, and hasn't seen the buyer yet
+        self.assertEqual([u['username'] for u in self.client.get('/api/users/').data['results']], ['seller'])
+
+
+class FastSerializationTestCase(TestCase):
+    def setUp(self):
+        sellers = [CustomUser.objects.create_user(username=f'seller{i}', password='password123', role='seller') for i in range(2)]
+        names = ['Cola', 'Café crème', 'Line\u2028separator', '"Quoted" \\ name', '水']
+        for i, name in enumerate(names):
+            Product.objects.create(productName=name, amountAvailable=i * 3, cost=f'{i}.{i}5', sellerId=sellers[i % 2])
+        shard_stock(Product.objects.get(productName='Cola').id, 4)
+        take_stock(Product.objects.get(productName='Cola').id, 1)
+
+    def test_values_rows_render_identically(self):
+        products = with_stock(Product.objects.order_by('-cost', 'id'))
+        for fields in (None, ['id'], ['cost', 'productName'], ['amountAvailable', 'sellerId']):
+            expected = JSONRenderer().render(ProductSerializer(products, many=True, fields=fields).data)
+            representation = ProductSerializer.values_representation(fields)
+            rows = [representation.to_dict(row) for row in representation.values(products)]
+            self.assertEqual(FastJSONRenderer().render(rows), expected)
+
+    def test_list_pages_match_the_serializer(self):
+        response = self.client.get('/api/products/?ordering=cost&page_size=2')
+        page = with_stock(Product.objects.order_by('cost', 'id'))[:2]
+        self.assertEqual(response.json()['results'], ProductSerializer(page, many=True).data)
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([product['id'] for product in response.json()['results']], list(
+            Product.objects.order_by('cost', 'id').values_list('id', flat=True)[2:4]
+        ))
+
+    def test_renderer_matches_drf(self):
+        from datetime import datetime, timezone
+        from decimal import Decimal
+        data = {
+            'text': 'Café \u2029 "quoted"', 'decimal': Decimal('1.50'), 'float': 0.1, 'none': None,
+            'when': datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc), 'nested': [{'a': (1, 2)}],
+            'huge': 2 ** 70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+
+class ProductEventsTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.product = Product.objects.create(productName='Cola', amountAvailable=5, cost=5, sellerId=self.seller)
+
+    def test_writes_publish_after_commit(self):
+        last_id = broadcaster.last_id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.cost = 10
+            self.product.save()
+            self.assertEqual(broadcaster.since(last_id), [])
+        buyer = CustomUser.objects.create_user(username='buyer', password='password123')
+        ledger.credit(buyer.id, 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            purchase(buyer.id, self.product.id, 2)
+        events = broadcaster.since(last_id)
+        self.assertEqual([kind for _, kind, _ in events], [PRODUCT_UPDATED, STOCK])
+        self.assertEqual(events[0][2]['cost'], '10.00')
+        self.assertEqual(events[1][2], {'id': self.product.id, 'machineId': DEFAULT_MACHINE_ID, 'amountAvailable': 3})
+        self.assertEqual([event_id for event_id, _, _ in events], [last_id + 1, last_id + 2])
+
+    def test_clients_too_far_behind_reload(self):
+        events = Broadcaster(size=2)
+        first = events.last_id
+        for n in range(3):
+            events.publish(STOCK, {'n': n})
+        self.assertIsNone(events.since(first))
+        self.assertEqual([data['n'] for _, _, data in events.since(first + 1)], [1, 2])
+        # An id from before a restart
+        self.assertIsNone(events.since(first - 1))
+
+    async def test_stream_resumes_from_last_event_id(self):
+        broadcaster.publish(STOCK, {'id': 1, 'amountAvailable': 4})
+        seen = broadcaster.last_id
+        broadcaster.publish(STOCK, {'id': 1, 'amountAvailable': 3})
+        request = AsyncRequestFactory().get('/api/async/products/events/', headers={'Last-Event-ID': str(seen)})
+        response = await product_events(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        self.assertEqual(await anext(stream), f'id: {seen + 1}\nevent: stock\ndata: {{"id":1,"amountAvailable":3}}\n\n'.encode())
+        # New events wake the stream
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        await sync_to_async(broadcaster.publish)(STOCK, {'id': 1, 'amountAvailable': 2})
+        self.assertIn(b'"amountAvailable":2', await asyncio.wait_for(pending, 5))
+        await stream.aclose()
+
+    async def test_stream_ends_cleanly_after_its_loop_was_forgotten(self):
+        events = Broadcaster()
+        stream = events.stream()
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        # What publish() does on finding the loop closed
+        with patch.object(asyncio.get_running_loop(), 'call_soon_threadsafe', side_effect=RuntimeError('Event loop is closed')):
+            events.publish(STOCK, {'id': 1})
+        self.assertEqual(events._subscribers, {})
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual((events._subscribers, events._wakeups), ({}, {}))
+
+    async def test_unknown_last_event_id_reloads(self):
+        request = AsyncRequestFactory().get('/api/async/products/events/', headers={'Last-Event-ID': '1'})
+        stream = aiter((await product_events(request)).streaming_content)
+        await anext(stream)
+        self.assertIn(f'event: {RELOAD}'.encode(), await anext(stream))
+        await stream.aclose()
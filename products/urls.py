@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import ProductList, ProductDetail
+from .views import ProductList, ProductDetail, ProductSearch, ProductImport, ProductCacheStats
 
 urlpatterns = [
     path('', ProductList.as_view(), name='product-list-create'),
     path('<int:pk>/', ProductDetail.as_view(), name='product-detail'),
+    path('search/', ProductSearch.as_view(), name='product-search'),
+    path('import/', ProductImport.as_view(), name='product-import'),
+    path('cache-stats/', ProductCacheStats.as_view(), name='product-cache-stats'),
 ]
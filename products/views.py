@@ -1,22 +1,34 @@
 # products/views.py
 from rest_framework import status
+from rest_framework.exceptions import UnsupportedMediaType
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from .models import Product
 from .serializers import ProductSerializer
-from rest_framework.permissions import IsAuthenticated
+from .catalog import catalog_etag
+from .cache import get_product, get_product_cache
+from .stock import with_stock
+from .filters import FILTER_PARAMETERS, filter_products
+from .search import search_products
+from .imports import csv_rows, ndjson_rows, import_products
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
+from vending_machine_api.pagination import IdCursorPagination, LIST_PARAMETERS
 class ProductList(APIView):
     @swagger_auto_schema(
+        manual_parameters=LIST_PARAMETERS + FILTER_PARAMETERS,
         responses={200: "products list"},
-        operation_description="Get all products"
+        operation_description="Get products, filtered and sorted, one page at a time"
     )
+    @method_decorator(condition(etag_func=catalog_etag))
     def get(self, request):
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        fields = ProductSerializer.get_requested_fields(request)
+        products, ordering = filter_products(with_stock(Product.objects.all()), request.GET)
+        return IdCursorPagination(ordering).paginate(products, request, self, ProductSerializer, fields)
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
@@ -56,8 +68,12 @@ class ProductDetail(APIView):
         responses={200: "Product details"},
         operation_description="Get a product by ID"
     )
+    @method_decorator(condition(etag_func=catalog_etag))
     def get(self, request, pk):
-        product = self.get_object(pk)
+        try:
+            product = get_product(pk)
+        except Product.DoesNotExist:
+            raise Http404
         serializer = ProductSerializer(product)
         return Response(serializer.data)
 
@@ -76,12 +92,12 @@ class ProductDetail(APIView):
     )
     def put(self, request, pk):
         product = self.get_object(pk)
-        sellerId = product.sellerId
+        sellerId = product.sellerId_id
 
-        if not request.user.is_authenticated or request.user.id != sellerId.id:
+        if not request.user.is_authenticated or request.user.id != sellerId:
             return Response({'error': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
         
-        request.data['sellerId'] = sellerId.id
+        request.data['sellerId'] = sellerId
         serializer = ProductSerializer(product, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -94,12 +110,83 @@ class ProductDetail(APIView):
         security= [{'Bearer': []}]
     )
     def delete(self, request, pk):
-        
-        sellerId = Product.objects.get(pk=pk).sellerId
-        if not request.user.is_authenticated or request.user.id != sellerId.id:
+        product = self.get_object(pk)
+        if not request.user.is_authenticated or request.user.id != product.sellerId_id:
             return Response({'error': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
         
-        product = self.get_object(pk)
         product.delete()
         message = {'message': 'Product deleted successfully!'}
         return Response( message , status=status.HTTP_204_NO_CONTENT)
+
+
+class ProductSearch(APIView):
+    max_limit = 100
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description='Words to find in productName; the last one may be a prefix'),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Results to return (max 100, default 20)'),
+            LIST_PARAMETERS[2],
+        ],
+        responses={200: "Matching products, best match first"},
+        operation_description="Search products by name"
+    )
+    @method_decorator(condition(etag_func=catalog_etag))
+    def get(self, request):
+        fields = ProductSerializer.get_requested_fields(request)
+        try:
+            limit = min(int(request.GET.get('limit', 20)), self.max_limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({'limit': f'Must be a number from 1 to {self.max_limit}.'}, status=status.HTTP_400_BAD_REQUEST)
+        product_ids = search_products(request.GET.get('q', ''), limit)
+        products = with_stock(Product.objects.all())
+        if fields is not None:
+            products = products.only(*fields)
+        found = products.in_bulk(product_ids)
+        # in_bulk() loses the ranking; products deleted since are skipped
+        page = [found[pk] for pk in product_ids if pk in found]
+        return Response({'results': ProductSerializer(page, many=True, fields=fields).data})
+
+
+class ProductImport(APIView):
+    permission_classes = [IsAuthenticated]
+    readers = {
+        'text/csv': csv_rows,
+        'application/x-ndjson': ndjson_rows,
+        'application/jsonl': ndjson_rows,
+    }
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Create many products from a CSV (text/csv, with a header row) or NDJSON "
+            "(application/x-ndjson) request body with productName, amountAvailable and cost. "
+            "Valid rows are created; invalid ones are reported by line number."
+        ),
+        responses={201: "Import report", 400: "No row could be imported"},
+        security= [{'Bearer': []}]
+    )
+    def post(self, request):
+        media_type = request.content_type.split(';')[0].strip()
+        read_rows = self.readers.get(media_type)
+        if read_rows is None:
+            raise UnsupportedMediaType(media_type)
+        # Read the body as a stream rather than through request.data, which
+        # would load all of it
+        stream = request.stream or []
+        report = import_products(read_rows(stream), request.user.id)
+        code = status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST
+        return Response(report, status=code)
+
+
+class ProductCacheStats(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        responses={200: "Product cache counters for this worker process"},
+        operation_description="Get product cache statistics",
+        security= [{'Bearer': []}]
+    )
+    def get(self, request):
+        return Response(get_product_cache().stats())
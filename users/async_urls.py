@@ -0,0 +1,9 @@
+from django.urls import path
+from .async_views import user_detail, user_login, deposit, buy
+
+urlpatterns = [
+    path('<int:pk>/', user_detail, name='async-user-detail'),
+    path('login/', user_login, name='async-user-login'),
+    path('deposit/', deposit, name='async-user-deposit'),
+    path('buy/', buy, name='async-user-buy'),
+]
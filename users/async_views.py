@@ -0,0 +1,111 @@
+# Async-native user views, served under /api/async/users/ by the ASGI app
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.views.decorators.http import require_POST, require_safe
+from machines.change import format_change
+from machines.models import COINS
+from vending_machine_api.asyncapi import api_view, json_response, read_json
+from vending_machine_api.throttling import throttle
+from .authentication import UserClaimsRefreshToken, aauthenticate, authenticated
+from .idempotency import aidempotent
+from .ledger import with_balance
+from .models import CustomUser
+from .passwords import LoginsOverloaded, acheck_credentials
+from .purchase import deposit_coin, purchase, PurchaseError
+from .serializers import UserSerializer
+from .views import PURCHASE_ERRORS, positive_int
+
+
+@api_view
+@require_safe
+async def user_detail(request, pk):
+    await aauthenticate(request)
+    try:
+        user = await with_balance(CustomUser.objects.all()).aget(pk=pk)
+    except CustomUser.DoesNotExist:
+        raise Http404
+    return json_response(UserSerializer(user).data)
+
+
+@api_view
+@require_POST
+async def user_login(request):
+    """
+    Log in for an access token. Unlike /api/users/login/ no session is
+    created, and the password is checked off the event loop.
+    """
+    data = read_json(request)
+    try:
+        user = await acheck_credentials(data.get('username'), data.get('password'))
+    except LoginsOverloaded:
+        response = json_response({'error': 'Too many logins in progress; retry shortly.'}, status=429)
+        response['Retry-After'] = '1'
+        return response
+    if user is None:
+        return json_response({'error': 'Invalid credentials'}, status=401)
+    refresh = UserClaimsRefreshToken.for_user(user)
+    return json_response({'access_token': str(refresh.access_token)})
+
+
+@api_view
+@require_POST
+@authenticated
+@throttle('deposit')
+@aidempotent
+async def deposit(request):
+    user = request.user
+    deposit_amount = read_json(request).get('deposit')
+    if deposit_amount is None:
+        return json_response({'error': 'Deposit amount is required.'}, status=400)
+    
+    if deposit_amount not in COINS:
+        return json_response({'error': 'Invalid deposit amount. Accepted values are 5, 10, 20, 50, and 100.'}, status=400)
+    
+    # The credit and the coin commit together, on a worker thread
+    try:
+        await sync_to_async(deposit_coin)(user.id, deposit_amount)
+    except PurchaseError as e:
+        error, code = PURCHASE_ERRORS[e.reason]
+        return json_response({'error': error, 'machineId': e.machine_id}, status=code)
+    user = await with_balance(CustomUser.objects.all()).aget(pk=user.id)
+    return json_response(UserSerializer(user).data)
+
+
+@api_view
+@require_POST
+@authenticated
+@throttle('buy')
+@aidempotent
+async def buy(request):
+    buyer = request.user
+    if buyer.role != 'buyer':
+        return json_response({'error': 'Only users with a "buyer" role can buy products.'}, status=403)
+    
+    data = read_json(request)
+    product_id = data.get('productId')
+    amount = data.get('amount')
+    if not product_id or not amount:
+        return json_response({'error': 'Both productId and amount are required.'}, status=400)
+    
+    product_id = positive_int(product_id)
+    if product_id is None:
+        return json_response({'error': 'Invalid productId. Please provide a positive integer.'}, status=400)
+    
+    amount = positive_int(amount)
+    if amount is None:
+        return json_response({'error': 'Invalid amount. Please provide a positive integer.'}, status=400)
+    
+    # Django has no async transactions, so the atomic purchase runs in the
+    # thread that owns this request's database connection.
+    try:
+        result = await sync_to_async(purchase)(buyer.id, product_id, amount)
+    except PurchaseError as e:
+        error, code = PURCHASE_ERRORS[e.reason]
+        return json_response({'error': error}, status=code)
+    
+    return json_response({
+        'total_spent': result.total_cost,
+        'products_purchased': f'{amount} units of {result.product_name}',
+        'change': format_change(result.change),
+        'remaining_deposit': result.deposit
+    })
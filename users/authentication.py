@@ -0,0 +1,68 @@
+from functools import wraps
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class UserClaimsRefreshToken(RefreshToken):
+    """A refresh token whose access tokens also carry the user's username and role."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['username'] = user.username
+        token['role'] = user.role
+        if user.is_staff:
+            token['is_staff'] = True
+        return token
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication that builds request.user from the token claims.
+
+    request.user is a rest_framework_simplejwt TokenUser exposing `id`,
+    `username`, `role` and `is_staff` without a database query. Views that
+    need the user row (balances, profile updates) load it by
+    request.user.id. Tokens issued before the role claim existed fall back
+    to loading the user.
+    """
+
+    def get_user(self, validated_token):
+        if 'role' not in validated_token:
+            return JWTAuthentication.get_user(self, validated_token)
+        return super().get_user(validated_token)
+
+
+async def aauthenticate(request):
+    """
+    Async counterpart of StatelessJWTAuthentication for plain Django views.
+
+    Returns the token user, raising NotAuthenticated when no token is sent
+    and InvalidToken when it does not validate. Only tokens without a role
+    claim touch the database.
+    """
+    authentication = StatelessJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise NotAuthenticated()
+    token = authentication.get_validated_token(raw_token)
+    if 'role' in token:
+        return api_settings.TOKEN_USER_CLASS(token)
+    return await sync_to_async(JWTAuthentication.get_user)(authentication, token)
+
+
+def authenticated(view_func):
+    """
+    Authenticate the request of an async-native view with aauthenticate(),
+    as DRF would before the handler, and set request.user.
+    """
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await aauthenticate(request)
+        return await view_func(request, *args, **kwargs)
+
+    return wrapper
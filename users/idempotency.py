@@ -0,0 +1,264 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client that retries a POST with the same Idempotency-Key gets the first
+response replayed instead of the write running again. A retry that arrives
+while the first request is still running waits for it. Keys are scoped to
+the user and the endpoint, and a key reused with a different body is
+refused.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.response import Response
+from vending_machine_api.asyncapi import json_response
+
+DEFAULT_IDEMPOTENCY_STORE = {
+    'BACKEND': 'users.idempotency.LocalIdempotencyStore',
+    'OPTIONS': {},
+}
+
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_PARAMETER = openapi.Parameter(
+    'Idempotency-Key', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+    description='Client chosen key; a retry with the same key replays the first response',
+)
+
+# What begin() tells the caller to do
+NEW = 'new'
+REPLAY = 'replay'
+MISMATCH = 'mismatch'
+BUSY = 'busy'
+
+INVALID_KEY = {'error': f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.'}
+
+# Responses to a begin() that doesn't run the request
+REFUSALS = {
+    MISMATCH: ({'error': 'This Idempotency-Key was already used with a different request.'}, status.HTTP_422_UNPROCESSABLE_ENTITY),
+    BUSY: ({'error': 'A request with this Idempotency-Key is still in progress.'}, status.HTTP_409_CONFLICT),
+}
+
+
+class _Entry:
+    __slots__ = ('fingerprint', 'record', 'expires', 'done')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.record = None
+        self.expires = None
+        self.done = threading.Event()
+
+
+class LocalIdempotencyStore:
+    """
+    Bounded in-process store of responses by idempotency key.
+
+    Finished entries expire `timeout` seconds after they were stored and
+    are dropped least recently used first once `max_entries` is reached.
+    Entries still in flight are never dropped. Duplicates wait up to
+    `wait_timeout` seconds for the request in flight.
+    """
+
+    def __init__(self, max_entries=10000, timeout=24 * 60 * 60, wait_timeout=30):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key, fingerprint):
+        """Claim `key`, or return (REPLAY, record), (MISMATCH, None) or (BUSY, None)."""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None or (entry.expires is not None and entry.expires < time.monotonic()):
+                    self._entries[key] = _Entry(fingerprint)
+                    self._entries.move_to_end(key)
+                    self._evict()
+                    return NEW, None
+                if entry.fingerprint != fingerprint:
+                    return MISMATCH, None
+                if entry.record is not None:
+                    self._entries.move_to_end(key)
+                    return REPLAY, entry.record
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not entry.done.wait(remaining):
+                return BUSY, None
+            # Finished or released; look again
+
+    def finish(self, key, record):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.record = record
+                entry.expires = time.monotonic() + self.timeout
+                entry.done.set()
+
+    def release(self, key):
+        """Forget an in-flight key whose request failed, so a retry runs it again."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.done.set()
+
+    def _evict(self):
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if self._entries[key].record is not None:
+                del self._entries[key]
+
+
+class DjangoIdempotencyStore:
+    """
+    Idempotency store kept in one of Django's CACHES aliases, shared by all
+    workers given a shared backend. Duplicates poll for the response of the
+    request in flight every `poll_interval` seconds.
+    """
+
+    def __init__(self, alias='default', timeout=24 * 60 * 60, wait_timeout=30, poll_interval=0.05, key_prefix='users:idempotency'):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+
+    def _key(self, key):
+        return f'{self.key_prefix}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+    def begin(self, key, fingerprint):
+        cache_key = self._key(key)
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            # The pending marker outlives the wait, so a crashed worker
+            # cannot hold a key for longer than that
+            if self.cache.add(cache_key, (fingerprint, None), self.wait_timeout * 2):
+                return NEW, None
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                if entry[0] != fingerprint:
+                    return MISMATCH, None
+                if entry[1] is not None:
+                    return REPLAY, entry[1]
+            if time.monotonic() >= deadline:
+                return BUSY, None
+            time.sleep(self.poll_interval)
+
+    def finish(self, key, record):
+        entry = self.cache.get(self._key(key))
+        if entry is not None:
+            self.cache.set(self._key(key), (entry[0], record), self.timeout)
+
+    def release(self, key):
+        self.cache.delete(self._key(key))
+
+
+_idempotency_store = None
+_idempotency_store_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    """Return the process-wide store configured by settings.IDEMPOTENCY_STORE."""
+    global _idempotency_store
+    if _idempotency_store is None:
+        with _idempotency_store_lock:
+            if _idempotency_store is None:
+                config = getattr(settings, 'IDEMPOTENCY_STORE', DEFAULT_IDEMPOTENCY_STORE)
+                _idempotency_store = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _idempotency_store
+
+
+def idempotent(view_method):
+    """
+    Honour an Idempotency-Key header on an APIView method.
+
+    Completed responses, including refusals, are stored and replayed with
+    an Idempotent-Replayed header. A request that raises is forgotten, so
+    its retry runs again. Must wrap any transaction.atomic, so a response
+    is only stored once its transaction has committed.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(INVALID_KEY, status=status.HTTP_400_BAD_REQUEST)
+
+        store = get_idempotency_store()
+        scoped_key = f'{request.user.id}:{request.path}:{key}'
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        outcome, record = store.begin(scoped_key, fingerprint)
+        if outcome == REPLAY:
+            code, data = record
+            return Response(data, status=code, headers={'Idempotent-Replayed': 'true'})
+        if outcome in REFUSALS:
+            data, code = REFUSALS[outcome]
+            return Response(data, status=code)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except BaseException:
+            store.release(scoped_key)
+            raise
+        if response.status_code >= 500:
+            store.release(scoped_key)
+        else:
+            store.finish(scoped_key, (response.status_code, response.data))
+        return response
+
+    return wrapper
+
+
+def aidempotent(view_func):
+    """
+    Async counterpart of idempotent() for the async-native views; must be
+    applied under users.authentication.authenticated. The store is called
+    off the event loop, and off the thread the views' database work runs
+    in, since begin() can wait there for the request in flight.
+    """
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return await view_func(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return json_response(INVALID_KEY, status=status.HTTP_400_BAD_REQUEST)
+
+        store = get_idempotency_store()
+        scoped_key = f'{request.user.id}:{request.path}:{key}'
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        outcome, record = await sync_to_async(store.begin, thread_sensitive=False)(scoped_key, fingerprint)
+        if outcome == REPLAY:
+            code, data = record
+            response = json_response(data, status=code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        if outcome in REFUSALS:
+            data, code = REFUSALS[outcome]
+            return json_response(data, status=code)
+
+        try:
+            response = await view_func(request, *args, **kwargs)
+        except BaseException:
+            await sync_to_async(store.release, thread_sensitive=False)(scoped_key)
+            raise
+        if response.status_code >= 500:
+            await sync_to_async(store.release, thread_sensitive=False)(scoped_key)
+        else:
+            record = (response.status_code, json.loads(response.content))
+            await sync_to_async(store.finish, thread_sensitive=False)(scoped_key, record)
+        return response
+
+    return wrapper
@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import CustomUser, DepositLedgerEntry
+
+# Ledger entry reasons
+OPENING = 'opening'
+DEPOSIT = 'deposit'
+PURCHASE = 'purchase'
+CHANGE = 'change'
+RESET = 'reset'
+
+
+def with_balance(queryset):
+    """
+    Annotate CustomUser rows with `balance`: the rolled-up deposit plus the
+    ledger entries not compacted yet, read through the partial tail index.
+    """
+    tail = (
+        DepositLedgerEntry.objects.filter(user=OuterRef('pk'), compacted=False)
+        .values('user')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return queryset.annotate(balance=F('deposit') + Coalesce(Subquery(tail), Value(0)))
+
+
+def get_balance(user):
+    """Return the live balance of a user, or of a user id."""
+    if getattr(user, 'balance', None) is not None:
+        return user.balance
+    user_id = getattr(user, 'pk', user)
+    return with_balance(CustomUser.objects.filter(pk=user_id)).values_list('balance', flat=True).get()
+
+
+def credit(user_id, amount, reason=DEPOSIT):
+    """Add money to a balance. This is a single INSERT that takes no locks."""
+    DepositLedgerEntry.objects.create(user_id=user_id, amount=amount, reason=reason)
+
+
+def lock_balance(user_id):
+    """
+    Lock the user row until the end of the transaction, and return the
+    balance. Must run inside a transaction.
+    """
+    CustomUser.objects.select_for_update().filter(pk=user_id).values_list('pk').get()
+    return get_balance(user_id)
+
+
+def debit(user_id, amount, reason):
+    """
+    Take `amount` from a balance if it covers it.
+
+    Debits of one user are serialized on the user row lock, so two of them
+    can never both spend the same money; credits are not held up by it.
+    Returns the new balance, or None when the balance is too low.
+    """
+    with transaction.atomic():
+        balance = lock_balance(user_id)
+        if balance < amount:
+            return None
+        if amount:
+            DepositLedgerEntry.objects.create(user_id=user_id, amount=-amount, reason=reason)
+        return balance - amount
+
+
+def compact(user_id, before):
+    """
+    Roll a user's ledger entries created before `before` into
+    CustomUser.deposit. Entries are kept for auditing, only flagged.
+
+    Entries still uncommitted when this runs are invisible to it and stay
+    in the tail, so no credit or debit can be skipped.
+    """
+    with transaction.atomic():
+        CustomUser.objects.select_for_update().filter(pk=user_id).values_list('pk').get()
+        entries = DepositLedgerEntry.objects.select_for_update().filter(
+            user_id=user_id, compacted=False, created__lt=before
+        )
+        rows = list(entries.values_list('id', 'amount'))
+        if not rows:
+            return 0
+        for start in range(0, len(rows), 500):
+            DepositLedgerEntry.objects.filter(pk__in=[pk for pk, _ in rows[start:start + 500]]).update(compacted=True)
+        CustomUser.objects.filter(pk=user_id).update(deposit=F('deposit') + sum(amount for _, amount in rows))
+        return len(rows)
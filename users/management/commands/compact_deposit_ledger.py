@@ -0,0 +1,28 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from users.ledger import compact
+from users.models import DepositLedgerEntry
+
+
+class Command(BaseCommand):
+    help = 'Roll old deposit ledger entries into each user\'s deposit snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=300,
+            help='Only compact entries at least this many seconds old (default: 300).',
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(seconds=options['older_than'])
+        user_ids = (
+            DepositLedgerEntry.objects.filter(compacted=False, created__lt=before)
+            .values_list('user_id', flat=True)
+            .distinct()
+        )
+        users = entries = 0
+        for user_id in list(user_ids):
+            entries += compact(user_id, before)
+            users += 1
+        self.stdout.write(self.style.SUCCESS(f'Compacted {entries} ledger entries for {users} users.'))
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.2 on 2026-10-18 19:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    # Existing deposits become compacted opening entries, so the ledger
+    # sums to every user's balance from the start
+    CustomUser = apps.get_model('users', 'CustomUser')
+    DepositLedgerEntry = apps.get_model('users', 'DepositLedgerEntry')
+    DepositLedgerEntry.objects.bulk_create(
+        (
+            DepositLedgerEntry(user_id=user_id, amount=deposit, reason='opening', compacted=True)
+            for user_id, deposit in CustomUser.objects.exclude(deposit=0).values_list('id', 'deposit').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_customuser_deposit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepositLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('deposit', 'Deposit'), ('purchase', 'Purchase'), ('change', 'Change'), ('reset', 'Reset')], max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('compacted', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('compacted', False)), fields=['user'], name='ledger_tail_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
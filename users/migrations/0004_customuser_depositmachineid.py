@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_deposit_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='depositMachineId',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -1,17 +1,50 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from machines.models import DEFAULT_MACHINE_ID
 
 class CustomUser(AbstractUser):
+    # Balance rolled up from compacted ledger entries; the live balance also
+    # counts the entries not compacted yet (see users.ledger)
     deposit = models.IntegerField(default=0)
     ROLE_CHOICES = [
         ('seller', 'Seller'),
         ('buyer', 'Buyer'),
     ]
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='buyer')
+    # The machine holding the coins behind the balance. Change and refunds
+    # are only paid out there, and another machine can take the deposit
+    # over only once the balance is spent (see users.purchase)
+    depositMachineId = models.PositiveIntegerField(default=DEFAULT_MACHINE_ID)
 
     # override the default fields
     groups = None  
     user_permissions = None
 
     class Meta:
-        app_label = 'users'
\ No newline at end of file
+        app_label = 'users'
+
+
+class DepositLedgerEntry(models.Model):
+    REASON_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('deposit', 'Deposit'),
+        ('purchase', 'Purchase'),
+        ('change', 'Change'),
+        ('reset', 'Reset'),
+    ]
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='ledger')
+    # Positive for credits, negative for debits
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    created = models.DateTimeField(auto_now_add=True)
+    # Set once the amount has been rolled into CustomUser.deposit
+    compacted = models.BooleanField(default=False)
+
+    class Meta:
+        app_label = 'users'
+        indexes = [
+            models.Index(fields=['user'], condition=models.Q(compacted=False), name='ledger_tail_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.reason} {self.amount:+d}'
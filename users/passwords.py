@@ -0,0 +1,95 @@
+"""
+Password checks for the async login.
+
+Verifying a password is a deliberately slow hash, which would stall the
+event loop, so it runs on a process-wide pool of PASSWORD_HASHING_WORKERS
+threads. hashlib releases the GIL while it hashes, so the threads hash in
+parallel, up to one per core. At most MAX_PENDING_LOGINS checks run or wait
+at once; in a login storm the rest are refused straight away rather than
+queued without bound.
+
+A password stored with a hasher other than the first in
+settings.PASSWORD_HASHERS, or at another cost, is rehashed with the current
+one on a successful login, so changing either upgrades users as they log in.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from vending_machine_api import metrics
+from .models import CustomUser
+
+DEFAULT_MAX_PENDING_LOGINS = 64
+
+
+class LoginsOverloaded(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    async def run(self, func, *args):
+        """Run func(*args) on the pool; raises LoginsOverloaded when it is full."""
+        admitted = self.slots.acquire(blocking=False)
+        metrics.count('admission_decisions_total', scope='login', decision='admitted' if admitted else 'shed')
+        if not admitted:
+            raise LoginsOverloaded()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    """Return the process-wide pool sized by settings.PASSWORD_HASHING_WORKERS."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    settings.PASSWORD_HASHING_WORKERS,
+                    getattr(settings, 'MAX_PENDING_LOGINS', DEFAULT_MAX_PENDING_LOGINS),
+                )
+    return _pool
+
+
+def verify(password, encoded):
+    """
+    Check `password` against the stored hash `encoded`. Returns (correct,
+    upgraded), where upgraded is a new hash to store if `encoded` is outdated.
+    """
+    upgraded = []
+    correct = check_password(password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return correct, upgraded[0] if upgraded else None
+
+
+async def acheck_credentials(username, password):
+    """
+    Return the active user with these credentials, or None. Raises
+    LoginsOverloaded when the hashing pool is full.
+    """
+    if not username or not password:
+        return None
+    pool = get_hashing_pool()
+    try:
+        user = await CustomUser.objects.aget(**{CustomUser.USERNAME_FIELD: username})
+    except CustomUser.DoesNotExist:
+        # Hash anyway, so unknown usernames take as long as wrong passwords
+        await pool.run(make_password, password)
+        return None
+    correct, upgraded = await pool.run(verify, password, user.password)
+    if not correct or not user.is_active:
+        return None
+    if upgraded:
+        # Guarded, so a password changed meanwhile is not overwritten
+        await CustomUser.objects.filter(pk=user.pk, password=user.password).aupdate(password=upgraded)
+        user.password = upgraded
+    return user
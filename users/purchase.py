@@ -0,0 +1,192 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from machines import partitions
+from machines.change import add_coin, dispense_change
+from machines.models import COINS, DEFAULT_MACHINE_ID
+from machines.stock import take_machine_stock, values_with_stock
+from orders.sales import record_order
+from products.cache import invalidate_product
+from products.catalog import catalog_changed
+from products.events import STOCK, publish_on_commit
+from products.models import Product
+from . import ledger
+from .models import CustomUser
+
+# Reasons a purchase can be refused
+PRODUCT_NOT_FOUND = 'product_not_found'
+INSUFFICIENT_STOCK = 'insufficient_stock'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+DEPOSIT_ELSEWHERE = 'deposit_elsewhere'
+
+
+class PurchaseError(Exception):
+    def __init__(self, reason, product_id=None, machine_id=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.product_id = product_id
+        self.machine_id = machine_id
+
+
+class RefundResult:
+    def __init__(self, change, deposit):
+        self.change = change
+        self.deposit = deposit
+
+
+def _lock_deposit_machine(buyer_id):
+    """Lock the buyer's row; returns the id of the machine holding their deposit."""
+    return CustomUser.objects.select_for_update().filter(pk=buyer_id).values_list('depositMachineId', flat=True).get()
+
+
+class PurchaseLine:
+    def __init__(self, product_id, product_name, seller_id, amount, cost):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.seller_id = seller_id
+        self.amount = amount
+        self.cost = cost
+        self.total_cost = cost * amount
+
+
+class CheckoutResult:
+    def __init__(self, order_id, lines, total_cost, change, deposit):
+        self.order_id = order_id
+        self.lines = lines
+        self.total_cost = total_cost
+        self.change = change
+        self.deposit = deposit
+
+
+class PurchaseResult:
+    def __init__(self, order_id, product_id, product_name, amount, total_cost, change, deposit):
+        self.order_id = order_id
+        self.product_id = product_id
+        self.product_name = product_name
+        self.amount = amount
+        self.total_cost = total_cost
+        self.change = change
+        self.deposit = deposit
+
+
+def checkout(buyer_id, items, machine_id=DEFAULT_MACHINE_ID):
+    """
+    Buy every (product_id, amount) pair in `items` from the machine
+    `machine_id` in one atomic unit.
+
+    Stock is taken with guarded conditional UPDATEs (`amountAvailable >=
+    amount`, or the same on a stock shard or the machine's stock row, see
+    machines.stock) and the deposit is debited
+    through the ledger, which checks the balance under the buyer's row
+    lock, so concurrent buyers can never oversell a product or overdraw a
+    deposit. Products are updated in ascending id order so that overlapping
+    carts always take row locks in the same order, and the deposit is
+    debited once for the whole cart. The remaining balance is then paid out
+    as change from the machine's coins; whatever they cannot cover stays as
+    deposit. Change is only paid at the machine holding the buyer's
+    deposit, since the coins they paid in are there; elsewhere the whole
+    balance stays as deposit. The sale is recorded as an Order, and added to the daily
+    sales rollups, in the same transaction. For a machine whose partition
+    is in another database, its stock and coins are updated in a second
+    transaction there (see machines.partitions). Raises PurchaseError with
+    the failure reason; nothing is written in that case.
+    """
+    amounts = {}
+    for product_id, amount in items:
+        # Keyed like the rows read back, whatever type the caller passed
+        try:
+            product_id = Product._meta.pk.to_python(product_id)
+        except ValidationError:
+            raise PurchaseError(PRODUCT_NOT_FOUND, product_id)
+        amounts[product_id] = amounts.get(product_id, 0) + amount
+    product_ids = sorted(amounts)
+
+    with transaction.atomic(), partitions.atomic(machine_id):
+        # An unsharded product row is write-locked from its UPDATE until
+        # commit, so its cost read below cannot change under us.
+        for product_id in product_ids:
+            if not take_machine_stock(machine_id, product_id, amounts[product_id]):
+                # Only the failure path pays for finding out why
+                if Product.objects.filter(pk=product_id).exists():
+                    raise PurchaseError(INSUFFICIENT_STOCK, product_id)
+                raise PurchaseError(PRODUCT_NOT_FOUND, product_id)
+
+        rows = values_with_stock(machine_id, Product.objects.filter(pk__in=product_ids), 'id', 'productName', 'sellerId', 'cost')
+        if len(rows) < len(product_ids):
+            # Deleted since its stock was taken
+            raise PurchaseError(PRODUCT_NOT_FOUND, min(set(product_ids) - {row[0] for row in rows}))
+        lines = [PurchaseLine(pk, name, seller_id, amounts[pk], cost) for pk, name, seller_id, cost, _ in rows]
+        stock = {pk: stock for pk, _, _, _, stock in rows}
+        lines.sort(key=lambda line: line.product_id)
+        total_cost = sum(line.total_cost for line in lines)
+
+        balance = ledger.debit(buyer_id, total_cost, ledger.PURCHASE)
+        if balance is None:
+            # Raising rolls back the stock decrements above
+            raise PurchaseError(INSUFFICIENT_FUNDS)
+
+        if _lock_deposit_machine(buyer_id) == machine_id:
+            change = dispense_change(machine_id, balance)
+        else:
+            change = dict.fromkeys(COINS, 0)
+        paid_out = sum(coin * count for coin, count in change.items())
+        if paid_out:
+            ledger.debit(buyer_id, paid_out, ledger.CHANGE)
+        order = record_order(buyer_id, machine_id, lines, total_cost)
+        # Queryset updates bypass the Product signals
+        for product_id in product_ids:
+            if machine_id == DEFAULT_MACHINE_ID:
+                invalidate_product(product_id)
+            publish_on_commit(STOCK, {'id': product_id, 'machineId': machine_id, 'amountAvailable': stock[product_id]})
+        catalog_changed()
+
+    return CheckoutResult(order.pk, lines, total_cost, change, balance - paid_out)
+
+
+def purchase(buyer_id, product_id, amount, machine_id=DEFAULT_MACHINE_ID):
+    """Buy `amount` units of a single product; see checkout()."""
+    result = checkout(buyer_id, [(product_id, amount)], machine_id)
+    line = result.lines[0]
+    return PurchaseResult(result.order_id, line.product_id, line.product_name, line.amount, result.total_cost, result.change, result.deposit)
+
+
+def deposit_coin(buyer_id, coin, machine_id=DEFAULT_MACHINE_ID):
+    """
+    Credit a coin to the buyer's balance and put it into the machine, in
+    one atomic unit, so the coin can be paid out as change from then on.
+
+    A deposit is held by one machine at a time. Another machine takes it
+    over only when the balance is spent; otherwise raises PurchaseError
+    with DEPOSIT_ELSEWHERE and the holding machine.
+    """
+    with transaction.atomic(), partitions.atomic(machine_id):
+        holder = _lock_deposit_machine(buyer_id)
+        if holder != machine_id:
+            if ledger.get_balance(buyer_id):
+                raise PurchaseError(DEPOSIT_ELSEWHERE, machine_id=holder)
+            CustomUser.objects.filter(pk=buyer_id).update(depositMachineId=machine_id)
+        ledger.credit(buyer_id, coin)
+        add_coin(machine_id, coin)
+
+
+def refund(buyer_id, machine_id=DEFAULT_MACHINE_ID):
+    """
+    Pay the buyer's balance back from the machine's coins.
+
+    Like the change of a checkout, only what the coins can pay is debited;
+    the rest stays as deposit. Returns a RefundResult. A balance held by
+    another machine is not refunded here: raises PurchaseError with
+    DEPOSIT_ELSEWHERE and the holding machine.
+    """
+    with transaction.atomic(), partitions.atomic(machine_id):
+        holder = _lock_deposit_machine(buyer_id)
+        balance = ledger.get_balance(buyer_id)
+        if balance and holder != machine_id:
+            raise PurchaseError(DEPOSIT_ELSEWHERE, machine_id=holder)
+        if holder == machine_id:
+            change = dispense_change(machine_id, balance)
+        else:
+            change = dict.fromkeys(COINS, 0)
+        paid_out = sum(coin * count for coin, count in change.items())
+        if paid_out:
+            ledger.debit(buyer_id, paid_out, ledger.RESET)
+    return RefundResult(change, balance - paid_out)
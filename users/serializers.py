@@ -1,15 +1,37 @@
-from rest_framework import serializers
+from vending_machine_api.serializers import DynamicFieldsModelSerializer
+from .ledger import get_balance
 from .models import CustomUser
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'password', 'deposit', 'role']
+        fields = ['id', 'username', 'password', 'deposit', 'depositMachineId', 'role']
         extra_kwargs = {
             'password': {'write_only': True},
+            # Balances only change through the deposit ledger
+            'deposit': {'read_only': True},
+            'depositMachineId': {'read_only': True},
         }
 
+    # Lists are annotated with_balance()
+    values_lookups = {'deposit': 'balance'}
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'deposit' in data:
+            data['deposit'] = get_balance(instance)
+        return data
+
     def create(self, validated_data):
         user = CustomUser.objects.create_user(**validated_data)
         return user
 
+    def update(self, instance, validated_data):
+        # Only the fields sent are saved: writing the whole row would put
+        # back the deposit read with the instance, undoing a ledger
+        # compaction that committed in the meantime
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
@@ -1,5 +1,32 @@
-from django.test import TestCase
-from .models import CustomUser
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from products.models import Product
+from machines.change import add_coin
+from machines.models import CoinInventory, DEFAULT_MACHINE_ID
+from vending_machine_api import docs, metrics
+from vending_machine_api.throttling import LocalTokenBuckets, WriteConcurrencyMiddleware
+from . import ledger
+from .authentication import UserClaimsRefreshToken
+from .idempotency import LocalIdempotencyStore, NEW, REPLAY, BUSY
+from .models import CustomUser, DepositLedgerEntry
+from .passwords import HashingPool
+from .serializers import UserSerializer
+from .views import UserDetail
+from .purchase import checkout, purchase, PurchaseError, PRODUCT_NOT_FOUND, INSUFFICIENT_STOCK, INSUFFICIENT_FUNDS
 
 class CustomUserTestCase(TestCase):
     def setUp(self):
@@ -42,4 +69,505 @@ class CustomUserTestCase(TestCase):
         self.assertEqual(self.user.deposit, 0)
 
 
+class PurchaseTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', role='buyer', deposit=100)
+        self.product = Product.objects.create(productName='Cola', amountAvailable=5, cost=20, sellerId=self.seller)
+
+    def test_purchase_decrements_stock_and_deposit(self):
+        result = purchase(self.buyer.id, self.product.id, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(result.total_cost, 40)
+        self.assertEqual(result.deposit, 60)
+        self.assertEqual(self.product.amountAvailable, 3)
+        self.assertEqual(ledger.get_balance(self.buyer.id), 60)
+
+    def test_purchase_insufficient_stock(self):
+        with self.assertRaises(PurchaseError) as ctx:
+            purchase(self.buyer.id, self.product.id, 6)
+        self.assertEqual(ctx.exception.reason, INSUFFICIENT_STOCK)
+
+    def test_purchase_insufficient_funds_rolls_back_stock(self):
+        self.product.cost = 60
+        self.product.save()
+        with self.assertRaises(PurchaseError) as ctx:
+            purchase(self.buyer.id, self.product.id, 2)
+        self.assertEqual(ctx.exception.reason, INSUFFICIENT_FUNDS)
+        self.product.refresh_from_db()
+        self.buyer.refresh_from_db()
+        self.assertEqual(self.product.amountAvailable, 5)
+        self.assertEqual(self.buyer.deposit, 100)
+
+    def test_purchase_missing_product(self):
+        with self.assertRaises(PurchaseError) as ctx:
+            purchase(self.buyer.id, self.product.id + 1, 1)
+        self.assertEqual(ctx.exception.reason, PRODUCT_NOT_FOUND)
+
+    def test_buy_view(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        response = client.post('/api/users/buy/', {'productId': self.product.id, 'amount': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['products_purchased'], '2 units of Cola')
+        response = client.post('/api/users/buy/', {'productId': self.product.id, 'amount': 4}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data['error'], 'Insufficient stock.')
+
+    def test_buy_view_takes_ids_as_strings(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        response = client.post('/api/users/buy/', {'productId': str(self.product.id), 'amount': '1'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['products_purchased'], '1 units of Cola')
+        for body in ({'productId': 'cola', 'amount': 1}, {'productId': self.product.id, 'amount': '1.5'}, {'productId': self.product.id, 'amount': -1}):
+            response = client.post('/api/users/buy/', body, format='json')
+            self.assertEqual(response.status_code, 400)
+        # checkout() itself keys the cart by the product ids it reads back
+        result = checkout(self.buyer.id, [(str(self.product.id), 1), (self.product.id, 1)])
+        self.assertEqual([line.amount for line in result.lines], [2])
+        with self.assertRaises(PurchaseError) as ctx:
+            checkout(self.buyer.id, [('cola', 1)])
+        self.assertEqual(ctx.exception.reason, PRODUCT_NOT_FOUND)
+
+
+    def test_checkout_view(self):
+        other = Product.objects.create(productName='Chips', amountAvailable=5, cost=10, sellerId=self.seller)
+        add_coin(DEFAULT_MACHINE_ID, 20, 2)
+        add_coin(DEFAULT_MACHINE_ID, 10, 2)
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        items = [
+            {'productId': other.id, 'amount': 1},
+            {'productId': self.product.id, 'amount': 2},
+            {'productId': other.id, 'amount': 2},
+        ]
+        response = client.post('/api/users/checkout/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_spent'], 70)
+        self.assertEqual(response.data['products_purchased'], ['2 units of Cola', '3 units of Chips'])
+        self.assertEqual(response.data['change'], [{'20 cent coins': 1}, {'10 cent coins': 1}])
+        self.assertEqual(response.data['remaining_deposit'], 0)
+        other.refresh_from_db()
+        self.assertEqual(other.amountAvailable, 2)
+
+    def test_checkout_is_all_or_nothing(self):
+        other = Product.objects.create(productName='Chips', amountAvailable=1, cost=10, sellerId=self.seller)
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        items = [{'productId': self.product.id, 'amount': 1}, {'productId': other.id, 'amount': 2}]
+        response = client.post('/api/users/checkout/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data['productId'], other.id)
+        self.product.refresh_from_db()
+        self.buyer.refresh_from_db()
+        self.assertEqual(self.product.amountAvailable, 5)
+        self.assertEqual(self.buyer.deposit, 100)
+
+
+
+class DepositLedgerTestCase(TestCase):
+    def setUp(self):
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', role='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_deposits_are_ledger_credits(self):
+        self.client.post('/api/users/deposit/', {'deposit': 50}, format='json')
+        response = self.client.post('/api/users/deposit/', {'deposit': 20}, format='json')
+        self.assertEqual(response.data['deposit'], 70)
+        self.assertEqual(list(self.buyer.ledger.values_list('amount', flat=True)), [50, 20])
+        self.buyer.refresh_from_db()
+        self.assertEqual(self.buyer.deposit, 0)
+
+    def test_debit_refuses_overdraft(self):
+        ledger.credit(self.buyer.id, 10)
+        self.assertIsNone(ledger.debit(self.buyer.id, 20, ledger.PURCHASE))
+        self.assertEqual(ledger.debit(self.buyer.id, 5, ledger.PURCHASE), 5)
+
+    def test_reset_deposit_is_a_debit(self):
+        ledger.credit(self.buyer.id, 20)
+        add_coin(DEFAULT_MACHINE_ID, 20, 1)
+        response = self.client.post('/api/users/reset-deposit/')
+        self.assertEqual(response.data['deposit'], 0)
+        self.assertEqual(response.data['change'], [{'20 cent coins': 1}])
+        self.assertEqual(self.buyer.ledger.last().reason, ledger.RESET)
+        self.assertEqual(CoinInventory.objects.get(machineId=DEFAULT_MACHINE_ID, coin=20).count, 0)
+
+    def test_reset_deposit_keeps_what_the_coins_cannot_pay(self):
+        ledger.credit(self.buyer.id, 100)
+        add_coin(DEFAULT_MACHINE_ID, 50, 1)
+        response = self.client.post('/api/users/reset-deposit/')
+        self.assertEqual(response.data['deposit'], 50)
+        self.assertEqual(response.data['change'], [{'50 cent coins': 1}])
+        self.assertEqual(list(self.buyer.ledger.values_list('amount', 'reason')), [(100, ledger.DEPOSIT), (-50, ledger.RESET)])
+
+    def test_profile_update_keeps_a_concurrent_compaction(self):
+        ledger.credit(self.buyer.id, 50)
+        read = UserDetail.get_object
+
+        def get_object(view, pk):
+            user = read(view, pk)
+            # Compacted after the view read the row, before it saves it
+            ledger.compact(self.buyer.id, timezone.now() + timedelta(seconds=1))
+            return user
+
+        with patch.object(UserDetail, 'get_object', get_object):
+            response = self.client.put(f'/api/users/{self.buyer.id}/', {'username': 'renamed', 'password': 'password456', 'role': 'buyer'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.buyer.refresh_from_db()
+        self.assertEqual((self.buyer.username, self.buyer.deposit), ('renamed', 50))
+        self.assertEqual(ledger.get_balance(self.buyer.id), 50)
+
+    def test_compaction_keeps_the_balance(self):
+        ledger.credit(self.buyer.id, 50)
+        ledger.debit(self.buyer.id, 15, ledger.PURCHASE)
+        call_command('compact_deposit_ledger', older_than=-60, stdout=StringIO())
+        self.buyer.refresh_from_db()
+        self.assertEqual(self.buyer.deposit, 35)
+        self.assertFalse(self.buyer.ledger.filter(compacted=False).exists())
+        ledger.credit(self.buyer.id, 5)
+        self.assertEqual(ledger.get_balance(self.buyer.id), 40)
+
+    def test_user_list_rows_match_the_serializer(self):
+        ledger.credit(self.buyer.id, 50)
+        CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        response = self.client.get('/api/users/')
+        users = ledger.with_balance(CustomUser.objects.order_by('id'))
+        self.assertEqual(response.json()['results'], UserSerializer(users, many=True).data)
+
+    def test_deposit_cannot_be_set_directly(self):
+        response = self.client.put(f'/api/users/{self.buyer.id}/', {'username': 'buyer', 'password': 'password123', 'deposit': 1000}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ledger.get_balance(self.buyer.id), 0)
+
+class IdempotencyTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', role='buyer')
+        self.product = Product.objects.create(productName='Cola', amountAvailable=5, cost=20, sellerId=self.seller)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        store = patch('users.idempotency._idempotency_store', LocalIdempotencyStore())
+        store.start()
+        self.addCleanup(store.stop)
+
+    def test_retried_deposit_is_credited_once(self):
+        for _ in range(2):
+            response = self.client.post('/api/users/deposit/', {'deposit': 50}, format='json', HTTP_IDEMPOTENCY_KEY='deposit-1')
+            self.assertEqual(response.data['deposit'], 50)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(ledger.get_balance(self.buyer.id), 50)
+        response = self.client.post('/api/users/deposit/', {'deposit': 50}, format='json', HTTP_IDEMPOTENCY_KEY='deposit-2')
+        self.assertEqual(response.data['deposit'], 100)
+
+    def test_retried_buy_is_charged_once(self):
+        ledger.credit(self.buyer.id, 100)
+        for _ in range(2):
+            response = self.client.post('/api/users/buy/', {'productId': self.product.id, 'amount': 2}, format='json', HTTP_IDEMPOTENCY_KEY='buy-1')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['total_spent'], 40)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.amountAvailable, 3)
+
+    def test_key_reused_with_another_body_is_refused(self):
+        self.client.post('/api/users/deposit/', {'deposit': 50}, format='json', HTTP_IDEMPOTENCY_KEY='deposit-1')
+        response = self.client.post('/api/users/deposit/', {'deposit': 20}, format='json', HTTP_IDEMPOTENCY_KEY='deposit-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(ledger.get_balance(self.buyer.id), 50)
+
+    async def test_async_retries_are_applied_once(self):
+        await sync_to_async(ledger.credit)(self.buyer.id, 100)
+        token = UserClaimsRefreshToken.for_user(self.buyer).access_token
+        headers = {'Authorization': f'Bearer {token}', 'Idempotency-Key': 'async-1'}
+        for _ in range(2):
+            response = await self.async_client.post('/api/async/users/deposit/', {'deposit': 50}, content_type='application/json', headers=headers)
+            self.assertEqual(response.json()['deposit'], 150)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        for _ in range(2):
+            response = await self.async_client.post('/api/async/users/buy/', {'productId': self.product.id, 'amount': 2}, content_type='application/json', headers=headers)
+            # The deposited 50 cent coin comes back as change
+            self.assertEqual(response.json()['remaining_deposit'], 60)
+        self.assertEqual(await sync_to_async(ledger.get_balance)(self.buyer.id), 60)
+        response = await self.async_client.post('/api/async/users/deposit/', {'deposit': 20}, content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 422)
+
+    def test_keys_are_scoped_to_the_user(self):
+        other = CustomUser.objects.create_user(username='other', password='password123', role='buyer')
+        self.client.post('/api/users/deposit/', {'deposit': 50}, format='json', HTTP_IDEMPOTENCY_KEY='deposit-1')
+        self.client.force_authenticate(other)
+        self.client.post('/api/users/deposit/', {'deposit': 50}, format='json', HTTP_IDEMPOTENCY_KEY='deposit-1')
+        self.assertEqual(ledger.get_balance(other.id), 50)
+
+    def test_entries_expire_and_stay_bounded(self):
+        store = LocalIdempotencyStore(max_entries=2, timeout=-1)
+        store.begin('a', 'x')
+        store.finish('a', (200, {}))
+        self.assertEqual(store.begin('a', 'x'), (NEW, None))
+        store.finish('a', (200, {}))
+        for key in 'bc':
+            store.begin(key, 'x')
+            store.finish(key, (200, {}))
+        self.assertEqual(list(store._entries), ['b', 'c'])
+
+    def test_duplicate_waits_for_the_request_in_flight(self):
+        store = LocalIdempotencyStore(wait_timeout=5)
+        self.assertEqual(store.begin('a', 'x'), (NEW, None))
+        outcomes = []
+        waiter = threading.Thread(target=lambda: outcomes.append(store.begin('a', 'x')))
+        waiter.start()
+        time.sleep(0.05)
+        store.finish('a', (200, {'deposit': 50}))
+        waiter.join()
+        self.assertEqual(outcomes, [(REPLAY, (200, {'deposit': 50}))])
+        store.begin('b', 'x')
+        store.wait_timeout = 0.01
+        self.assertEqual(store.begin('b', 'x'), (BUSY, None))
+        # A failed request lets its retry run again
+        store.release('b')
+        self.assertEqual(store.begin('b', 'x'), (NEW, None))
+
+
+class AdmissionControlTestCase(TestCase):
+    def setUp(self):
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', role='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        buckets = patch('vending_machine_api.throttling._buckets', LocalTokenBuckets())
+        buckets.start()
+        self.addCleanup(buckets.stop)
+        metrics.reset()
+
+    @override_settings(THROTTLE_RATES={'deposit': {'rate': 0.1, 'burst': 2}})
+    def test_deposits_beyond_the_burst_are_refused(self):
+        for _ in range(2):
+            response = self.client.post('/api/users/deposit/', {'deposit': 5}, format='json')
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/users/deposit/', {'deposit': 5}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(ledger.get_balance(self.buyer.id), 10)
+        # Buckets are per endpoint
+        response = self.client.post('/api/users/buy/', {'productId': 1, 'amount': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+        counters = metrics.collect_counters()
+        self.assertEqual(counters[('admission_decisions_total', (('scope', 'deposit'), ('decision', 'admitted')))], 2)
+        self.assertEqual(counters[('admission_decisions_total', (('scope', 'deposit'), ('decision', 'rate_limited')))], 1)
+
+    @override_settings(THROTTLE_RATES={'deposit': {'rate': 0.1, 'burst': 2}})
+    async def test_async_deposits_share_the_bucket(self):
+        await sync_to_async(self.client.post)('/api/users/deposit/', {'deposit': 5}, format='json')
+        headers = {'Authorization': f'Bearer {UserClaimsRefreshToken.for_user(self.buyer).access_token}'}
+        response = await self.async_client.post('/api/async/users/deposit/', {'deposit': 5}, content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.post('/api/async/users/deposit/', {'deposit': 5}, content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(await sync_to_async(ledger.get_balance)(self.buyer.id), 10)
+
+    def test_buckets_refill(self):
+        buckets = LocalTokenBuckets()
+        self.assertEqual(buckets.take('a', 1000, 1), 0)
+        self.assertGreater(buckets.take('a', 1000, 1), 0)
+        time.sleep(0.002)
+        self.assertEqual(buckets.take('a', 1000, 1), 0)
+
+    @override_settings(MAX_CONCURRENT_WRITES=1)
+    def test_writes_beyond_the_cap_are_shed(self):
+        middleware = WriteConcurrencyMiddleware(lambda request: 'handled')
+        middleware.slots.acquire()
+        response = middleware(RequestFactory().post('/api/users/deposit/'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        # Reads are never shed
+        self.assertEqual(middleware(RequestFactory().get('/api/products/')), 'handled')
+        middleware.slots.release()
+        self.assertEqual(middleware(RequestFactory().post('/api/users/deposit/')), 'handled')
+        self.assertIn('admission_decisions_total{scope="writes",decision="shed"} 1', metrics.render())
+
+
+class ApiDocsTestCase(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'openapi.json')
+        settings = override_settings(OPENAPI_SCHEMA_FILE=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        docs.get_schema.cache_clear()
+        self.addCleanup(docs.get_schema.cache_clear)
+
+    def test_schema_is_served_from_the_generated_file(self):
+        call_command('generate_openapi_schema', stdout=StringIO())
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        self.assertIn('/users/buy/', json.loads(content)['paths'])
+        # The UI can still send a JWT
+        self.assertEqual(json.loads(content)['securityDefinitions']['Bearer'], {'type': 'apiKey', 'name': 'Authorization', 'in': 'header'})
+        with patch.object(docs, 'generate_schema') as generate:
+            response = self.client.get('/api/openapi.json')
+        generate.assert_not_called()
+        self.assertEqual(response.content, content)
+        self.assertEqual(response['Cache-Control'], f'public, max-age={docs.SCHEMA_MAX_AGE}')
+        response = self.client.get('/api/openapi.json', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        # The UI's default spec URL serves the same file
+        self.assertEqual(self.client.get('/api/docs/', {'format': 'openapi'}).content, content)
+
+    def test_schema_is_generated_once_without_the_file(self):
+        with patch.object(docs, 'generate_schema', wraps=docs.generate_schema) as generate:
+            first = self.client.get('/api/openapi.json')
+            second = self.client.get('/api/openapi.json')
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.content, second.content)
+
+    def test_ui_points_at_the_generated_schema(self):
+        response = self.client.get('/api/docs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '/api/openapi.json')
+
+
+class StatelessAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', role='buyer', deposit=100)
+        self.client = APIClient()
+        response = self.client.post('/api/users/login/', {'username': 'buyer', 'password': 'password123'}, format='json')
+        self.token = response.data['access_token']
+
+    def test_token_carries_role_claims(self):
+        token = AccessToken(self.token)
+        self.assertEqual(token['role'], 'buyer')
+        self.assertEqual(token['username'], 'buyer')
+
+    def test_role_check_needs_no_user_query(self):
+        CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        client = APIClient()
+        token = client.post('/api/users/login/', {'username': 'seller', 'password': 'password123'}, format='json').data['access_token']
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with self.assertNumQueries(0):
+            response = client.post('/api/users/reset-deposit/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_reset_deposit_updates_the_row(self):
+        add_coin(DEFAULT_MACHINE_ID, 100, 1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = self.client.post('/api/users/reset-deposit/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deposit'], 0)
+
+    def test_cannot_delete_other_users(self):
+        other = CustomUser.objects.create_user(username='other', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = self.client.delete(f'/api/users/{other.id}/')
+        self.assertEqual(response.status_code, 403)
+
+
+class AsyncUserViewsTestCase(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', role='buyer')
+        self.product = Product.objects.create(productName='Cola', amountAvailable=5, cost=20, sellerId=self.seller)
+        add_coin(DEFAULT_MACHINE_ID, 5, 1)
+        token = UserClaimsRefreshToken.for_user(self.buyer).access_token
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    async def test_async_deposit_and_buy(self):
+        response = await self.async_client.post('/api/async/users/deposit/', {'deposit': 50}, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.json()['deposit'], 50)
+        response = await self.async_client.post('/api/async/users/buy/', {'productId': self.product.id, 'amount': 2}, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        # The machine holds the deposited 50 and one 5, so only 5 of the 10 comes back
+        self.assertEqual(response.json()['change'], [{'5 cent coins': 1}])
+        self.assertEqual(response.json()['remaining_deposit'], 5)
+        response = await self.async_client.post('/api/async/users/buy/', {'productId': self.product.id, 'amount': 1}, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.json(), {'error': 'Insufficient funds.'})
+        response = await self.async_client.post('/api/async/users/buy/', {'productId': 'cola', 'amount': 1}, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_deposit_credit_and_coin_commit_together(self):
+        with patch('users.purchase.add_coin', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                await self.async_client.post('/api/async/users/deposit/', {'deposit': 50}, content_type='application/json', headers=self.headers)
+        self.assertFalse(await DepositLedgerEntry.objects.filter(user=self.buyer).aexists())
+
+    async def test_async_user_detail_requires_token(self):
+        response = await self.async_client.get(f'/api/async/users/{self.buyer.id}/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(f'/api/async/users/{self.buyer.id}/', headers=self.headers)
+        self.assertEqual(response.json()['username'], 'buyer')
+
+class AsyncLoginTestCase(TestCase):
+    def setUp(self):
+        self.buyer = CustomUser.objects.create_user(username='buyer', password='password123', role='buyer')
+
+    async def login(self, password='password123', username='buyer'):
+        return await self.async_client.post(
+            '/api/async/users/login/', {'username': username, 'password': password}, content_type='application/json',
+        )
+
+    async def test_login_returns_a_token_without_a_session(self):
+        response = await self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.json()['access_token'])['role'], 'buyer')
+        self.assertFalse(await Session.objects.aexists())
+        self.assertEqual((await self.login('wrong')).status_code, 401)
+        self.assertEqual((await self.login(username='nobody')).status_code, 401)
+
+    async def test_outdated_hashes_are_upgraded_on_login(self):
+        with override_settings(PASSWORD_HASHER_ITERATIONS=1000):
+            self.assertEqual((await self.login()).status_code, 200)
+            await self.buyer.arefresh_from_db()
+            self.assertTrue(self.buyer.password.startswith('pbkdf2_sha256$1000$'))
+            # A wrong password never rewrites the hash
+            with override_settings(PASSWORD_HASHER_ITERATIONS=2000):
+                await self.login('wrong')
+                await self.buyer.arefresh_from_db()
+                self.assertTrue(self.buyer.password.startswith('pbkdf2_sha256$1000$'))
+            self.assertEqual((await self.login()).status_code, 200)
+
+    async def test_logins_are_shed_when_the_pool_is_full(self):
+        with patch('users.passwords._pool', HashingPool(1, 0)):
+            response = await self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class ConcurrentPurchaseTestCase(TransactionTestCase):
+    def test_no_oversell_under_concurrent_buys(self):
+        # 8 buyers each try to buy 3 units of a product with only 10 in stock
+        seller = CustomUser.objects.create_user(username='seller', password='password123', role='seller')
+        product = Product.objects.create(productName='Cola', amountAvailable=10, cost=5, sellerId=seller)
+        buyers = [
+            CustomUser.objects.create_user(username=f'buyer{i}', password='password123', deposit=100)
+            for i in range(8)
+        ]
+        sold = []
+        barrier = threading.Barrier(len(buyers))
+
+        def buy(buyer):
+            barrier.wait()
+            try:
+                for _ in range(50):
+                    try:
+                        purchase(buyer.id, product.id, 3)
+                        sold.append(3)
+                        return
+                    except OperationalError:
+                        # SQLite reports writer contention as "locked"; retry
+                        time.sleep(0.01)
+            except PurchaseError:
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(buyer,)) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
+        product.refresh_from_db()
+        self.assertEqual(sum(sold), 9)
+        self.assertEqual(product.amountAvailable, 1)
+        spent = sum(100 - ledger.get_balance(buyer.id) for buyer in buyers)
+        self.assertEqual(spent, sum(sold) * 5)
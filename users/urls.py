@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import UserListCreate, UserDetail, UserLogin, UserLogout , DepositView , BuyView, ResetDeposit
+from .views import UserListCreate, UserDetail, UserLogin, UserLogout , DepositView , BuyView, CheckoutView, ResetDeposit
 
 urlpatterns = [
     path('', UserListCreate.as_view(), name='user-list'),
@@ -9,4 +9,5 @@ urlpatterns = [
     path('deposit/', DepositView.as_view(), name='user-deposit'),
     path('reset-deposit/', ResetDeposit.as_view(), name='user-reset-deposit'),
     path('buy/', BuyView.as_view(), name='user-withdraw'),
+    path('checkout/', CheckoutView.as_view(), name='user-checkout'),
 ]
@@ -5,22 +5,31 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly , IsAuthenticat
 from .models import CustomUser 
 from .serializers import UserSerializer
 from django.http import Http404
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import UserClaimsRefreshToken
 from django.contrib.auth import authenticate, login, logout
 from products.models import Product , CustomUser
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from django.db import transaction
+from machines.change import format_change
+from machines.models import COINS
+from machines.views import for_machine
+from vending_machine_api.pagination import IdCursorPagination, LIST_PARAMETERS
+from vending_machine_api.routers import read_from_replica
+from . import ledger
+from .idempotency import idempotent, IDEMPOTENCY_PARAMETER
+from .purchase import purchase, checkout, deposit_coin, refund, PurchaseError, PRODUCT_NOT_FOUND, INSUFFICIENT_STOCK, INSUFFICIENT_FUNDS, DEPOSIT_ELSEWHERE
 class UserListCreate(APIView):
 
     @swagger_auto_schema(
+        manual_parameters=LIST_PARAMETERS,
         responses={200: "users list"},
-        operation_description="Get all users"
+        operation_description="Get all users, one page at a time"
     )
+    @read_from_replica
     def get(self, request):
-        users = CustomUser.objects.all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        fields = UserSerializer.get_requested_fields(request)
+        return IdCursorPagination().paginate(ledger.with_balance(CustomUser.objects.all()), request, self, UserSerializer, fields)
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
@@ -47,7 +56,7 @@ class UserDetail(APIView):
 
     def get_object(self, pk):
         try:
-            return CustomUser.objects.get(pk=pk)
+            return ledger.with_balance(CustomUser.objects.all()).get(pk=pk)
         except CustomUser.DoesNotExist:
             raise Http404
 
@@ -56,6 +65,7 @@ class UserDetail(APIView):
         operation_description="Get a user by ID",
         security=[{'Bearer': []}]
     )
+    @read_from_replica
     def get(self, request, pk):
         user = self.get_object(pk)
         serializer = UserSerializer(user)
@@ -76,7 +86,7 @@ class UserDetail(APIView):
     )
     def put(self, request, pk):
         user = self.get_object(pk)
-        if request.user != user:
+        if request.user.id != user.id:
             return Response({'error': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
         serializer = UserSerializer(user, data=request.data)
         if serializer.is_valid():
@@ -91,7 +101,7 @@ class UserDetail(APIView):
     )
     def delete(self, request, pk):
         user = self.get_object(pk)
-        if request.user != user:
+        if request.user.id != user.id:
             return Response({'error': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
         user.delete()
         message = {'message': 'User was deleted successfully!'}
@@ -124,7 +134,7 @@ class UserLogin(APIView):
 
         if user is not None:
             login(request, user)
-            refresh = RefreshToken.for_user(user)
+            refresh = UserClaimsRefreshToken.for_user(user)
             return Response({
                 'access_token': str(refresh.access_token),
             })
@@ -144,6 +154,8 @@ class UserLogout(APIView):
 
 # Deposit coins
 class DepositView(APIView):
+    throttle_scope = 'deposit'
+
     @swagger_auto_schema(
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
@@ -153,10 +165,13 @@ class DepositView(APIView):
         ),
         responses={200: "User details with updated deposit amount"},
         operation_description="Deposit coins",
+        manual_parameters=[IDEMPOTENCY_PARAMETER],
         security=[{'Bearer': []}]
     )
+    @for_machine
+    @idempotent
     @transaction.atomic
-    def post(self, request):
+    def post(self, request, machine_id):
         if not request.user.is_authenticated:
             return Response({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
         
@@ -164,19 +179,47 @@ class DepositView(APIView):
         if deposit_amount is None:
             return Response({'error': 'Deposit amount is required.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if deposit_amount not in [5, 10, 20, 50, 100]:
+        if deposit_amount not in COINS:
             return Response({'error': 'Invalid deposit amount. Accepted values are 5, 10, 20, 50, and 100.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        user = CustomUser.objects.select_for_update().get(pk=request.user.id)
-        user.deposit += deposit_amount
-        user.save()
+        try:
+            deposit_coin(request.user.id, deposit_amount, machine_id)
+        except PurchaseError as e:
+            error, code = PURCHASE_ERRORS[e.reason]
+            return Response({'error': error, 'machineId': e.machine_id}, status=code)
         
+        user = ledger.with_balance(CustomUser.objects.all()).get(pk=request.user.id)
         serializer = UserSerializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
 
+# Largest cart accepted by CheckoutView
+MAX_CHECKOUT_ITEMS = 50
+
+# Error message and status code for each purchase failure reason
+PURCHASE_ERRORS = {
+    PRODUCT_NOT_FOUND: ('Product does not exist.', status.HTTP_404_NOT_FOUND),
+    INSUFFICIENT_STOCK: ('Insufficient stock.', status.HTTP_403_FORBIDDEN),
+    INSUFFICIENT_FUNDS: ('Insufficient funds.', status.HTTP_403_FORBIDDEN),
+    DEPOSIT_ELSEWHERE: ('Your deposit is held by another machine. Spend it or reset it there first.', status.HTTP_409_CONFLICT),
+}
+
+def positive_int(value):
+    """
+    Return `value` as a positive int, also taking digit strings as form
+    posts send them, or None when it is not one.
+    """
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        return None
+    return value
+
+
 # Buy products
 class BuyView(APIView):
+    throttle_scope = 'buy'
+
     @swagger_auto_schema(
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
@@ -190,13 +233,17 @@ class BuyView(APIView):
             properties={
                 'total_spent': openapi.Schema(type=openapi.TYPE_INTEGER),
                 'products_purchased': openapi.Schema(type=openapi.TYPE_STRING),
-                'change': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))
+                'change': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                'remaining_deposit': openapi.Schema(type=openapi.TYPE_INTEGER)
             }
         )},
         operation_description="Buy products",   
+        manual_parameters=[IDEMPOTENCY_PARAMETER],
         security=[{'Bearer': []}]
     )
-    def post(self, request):
+    @for_machine
+    @idempotent
+    def post(self, request, machine_id):
         if not request.user.is_authenticated:
             return Response({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
         
@@ -209,44 +256,102 @@ class BuyView(APIView):
         if not product_id or not amount:
             return Response({'error': 'Both productId and amount are required.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            product = Product.objects.get(pk=product_id)
-        except Product.DoesNotExist:
-            return Response({'error': 'Product does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+        product_id = positive_int(product_id)
+        if product_id is None:
+            return Response({'error': 'Invalid productId. Please provide a positive integer.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if amount <= 0:
+        amount = positive_int(amount)
+        if amount is None:
             return Response({'error': 'Invalid amount. Please provide a positive integer.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if amount > product.amountAvailable:
-            return Response({'error': 'Insufficient stock.'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            result = purchase(buyer.id, product_id, amount, machine_id)
+        except PurchaseError as e:
+            error, code = PURCHASE_ERRORS[e.reason]
+            return Response({'error': error}, status=code)
+        
+        response_data = {
+            'total_spent': result.total_cost,
+            'products_purchased': f'{amount} units of {result.product_name}',
+            'change': format_change(result.change),
+            'remaining_deposit': result.deposit
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+# Buy several products in one transaction
+class CheckoutView(APIView):
+    throttle_scope = 'checkout'
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['items'],
+            properties={
+                'items': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        properties={
+                            'productId': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            'amount': openapi.Schema(type=openapi.TYPE_INTEGER)
+                        }
+                    )
+                )
+            }
+        ),
+        responses={200: openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'total_spent': openapi.Schema(type=openapi.TYPE_INTEGER),
+                'products_purchased': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+                'change': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                'remaining_deposit': openapi.Schema(type=openapi.TYPE_INTEGER)
+            }
+        )},
+        operation_description="Buy several products at once",
+        manual_parameters=[IDEMPOTENCY_PARAMETER],
+        security=[{'Bearer': []}]
+    )
+    @for_machine
+    @idempotent
+    def post(self, request, machine_id):
+        if not request.user.is_authenticated:
+            return Response({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+        
+        buyer = request.user
+        if buyer.role != 'buyer':
+            return Response({'error': 'Only users with a "buyer" role can buy products.'}, status=status.HTTP_403_FORBIDDEN)
         
-        total_cost = product.cost * amount
-        if buyer.deposit < total_cost:
-            return Response({'error': 'Insufficient funds.'}, status=status.HTTP_403_FORBIDDEN)
+        items = request.data.get('items')
+        if not items or not isinstance(items, list):
+            return Response({'error': 'A non-empty list of items is required.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        buyer.deposit -= total_cost
-        buyer.save()
+        if len(items) > MAX_CHECKOUT_ITEMS:
+            return Response({'error': f'A checkout can contain at most {MAX_CHECKOUT_ITEMS} items.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        product.amountAvailable -= amount
-        if product.amountAvailable <= 0:
-            product.amountAvailable = 0
-            
-        product.save()
+        cart = []
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('productId'), int) or not isinstance(item.get('amount'), int):
+                return Response({'error': 'Every item needs an integer productId and amount.'}, status=status.HTTP_400_BAD_REQUEST)
+            if item['amount'] <= 0:
+                return Response({'error': 'Invalid amount. Please provide a positive integer.'}, status=status.HTTP_400_BAD_REQUEST)
+            cart.append((item['productId'], item['amount']))
         
-        change = buyer.deposit
-        change_coins = []
-        coins = [100, 50, 20, 10, 5]
-        for coin in coins:
-            num_coins = change // coin
-            if num_coins > 0:
-                change_coins.append({f'{coin} cent coins': num_coins})
-                change -= num_coins * coin
+        try:
+            result = checkout(buyer.id, cart, machine_id)
+        except PurchaseError as e:
+            error, code = PURCHASE_ERRORS[e.reason]
+            response_data = {'error': error}
+            if e.product_id is not None:
+                response_data['productId'] = e.product_id
+            return Response(response_data, status=code)
         
-        serializer = UserSerializer(buyer)
         response_data = {
-            'total_spent': total_cost,
-            'products_purchased': f'{amount} units of {product.productName}',
-            'change': change_coins
+            'total_spent': result.total_cost,
+            'products_purchased': [f'{line.amount} units of {line.product_name}' for line in result.lines],
+            'change': format_change(result.change),
+            'remaining_deposit': result.deposit
         }
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -254,11 +359,12 @@ class BuyView(APIView):
 # Reset deposit
 class ResetDeposit(APIView):
     @swagger_auto_schema(
-        responses={200: "User details with reset deposit amount"},
+        responses={200: "User details with the deposit left after the refund, and the change paid out"},
         operation_description="Reset deposit",
         security=[{'Bearer': []}]
     )
-    def post(self, request):
+    @for_machine
+    def post(self, request, machine_id):
         if not request.user.is_authenticated:
             return Response({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
         
@@ -266,8 +372,13 @@ class ResetDeposit(APIView):
         if buyer.role != 'buyer':
             return Response({'error': 'Only users with a "buyer" role can reset their deposit.'}, status=status.HTTP_403_FORBIDDEN)
         
-        buyer.deposit = 0
-        buyer.save()
+        try:
+            result = refund(buyer.id, machine_id)
+        except PurchaseError as e:
+            error, code = PURCHASE_ERRORS[e.reason]
+            return Response({'error': error, 'machineId': e.machine_id}, status=code)
+        user = ledger.with_balance(CustomUser.objects.all()).get(pk=buyer.id)
         
-        serializer = UserSerializer(buyer)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        response_data = UserSerializer(user).data
+        response_data['change'] = format_change(result.change)
+        return Response(response_data, status=status.HTTP_200_OK)
\ No newline at end of file
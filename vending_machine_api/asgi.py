@@ -2,6 +2,8 @@
 ASGI config for vending_machine_api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Besides the async views, it serves the product event stream at
+/api/async/products/events/, which needs a long-lived connection per client.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
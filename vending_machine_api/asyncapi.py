@@ -0,0 +1,71 @@
+"""
+Helpers for the async-native views.
+
+DRF's APIView is synchronous, so the async views are plain Django views.
+These helpers keep their requests and responses in line with the DRF ones.
+"""
+import json
+from functools import wraps
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.settings import api_settings
+
+
+def json_response(data, status=200):
+    # Rendered like the DRF views' JSON responses
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
+
+
+def read_json(request):
+    """Return the decoded JSON request body, or an empty dict for an empty body."""
+    if not request.body:
+        return {}
+    try:
+        return json.loads(request.body)
+    except ValueError as e:
+        raise ParseError(f'JSON parse error - {e}')
+
+
+def api_view(view_func):
+    """
+    Turn DRF exceptions raised by an async view into JSON error responses.
+
+    Views are CSRF exempt like DRF's APIView, since they authenticate with
+    a bearer token rather than a session.
+    """
+    @csrf_exempt
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view_func(request, *args, **kwargs)
+        except APIException as e:
+            detail = e.detail if isinstance(e.detail, (dict, list)) else {'detail': e.detail}
+            return json_response(detail, status=e.status_code)
+
+    return wrapper
+
+
+def acondition(etag_func):
+    """
+    django.views.decorators.http.condition(etag_func=...) for async views,
+    with an async `etag_func`, so that working out the ETag (a cache read,
+    say) does not block the event loop.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            etag = quote_etag(await etag_func(request, *args, **kwargs))
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view_func(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+
+        return wrapper
+
+    return decorator
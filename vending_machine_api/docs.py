@@ -0,0 +1,63 @@
+"""
+API docs served from an OpenAPI schema generated ahead of time.
+
+Generating the schema introspects every view and serializer, so it is done
+once, at build or deploy time, with `manage.py generate_openapi_schema`,
+which writes OPENAPI_SCHEMA_FILE. openapi_schema serves that file with a
+strong ETag and a long max-age. Without the file, the schema is generated
+on the first request and kept for the life of the process.
+
+drf_yasg's schema view and generators are only imported when a docs page is
+first requested, so workers that never serve the docs don't load them.
+"""
+import hashlib
+from functools import lru_cache
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+
+# Seconds browsers and proxies keep the schema before revalidating its ETag
+SCHEMA_MAX_AGE = 60 * 60
+
+
+def generate_schema():
+    """Generate the OpenAPI schema of every endpoint, as JSON bytes."""
+    from drf_yasg.codecs import OpenAPICodecJson
+    from .swagger import info, schema_view
+    schema = schema_view.generator_class(info).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+@lru_cache(maxsize=None)
+def get_schema():
+    """The schema as (JSON bytes, ETag), read from OPENAPI_SCHEMA_FILE or generated."""
+    try:
+        with open(settings.OPENAPI_SCHEMA_FILE, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        content = generate_schema()
+    return content, '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+
+
+@require_safe
+@cache_control(public=True, max_age=SCHEMA_MAX_AGE)
+@condition(etag_func=lambda request: get_schema()[1])
+def openapi_schema(request):
+    return HttpResponse(get_schema()[0], content_type='application/json')
+
+
+def docs_view(renderer):
+    """The `renderer` docs UI ('swagger' or 'redoc'), building drf_yasg's view on first use."""
+    view = None
+
+    def docs(request, *args, **kwargs):
+        nonlocal view
+        if request.GET.get('format') == 'openapi':
+            # The UI's default spec URL; serve the generated schema there too
+            return openapi_schema(request)
+        if view is None:
+            from .swagger import schema_view
+            view = schema_view.with_ui(renderer, cache_timeout=0)
+        return view(request, *args, **kwargs)
+    return docs
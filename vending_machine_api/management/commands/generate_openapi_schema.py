@@ -0,0 +1,21 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from vending_machine_api.docs import generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema served by the API docs; run it at build or deploy time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='File to write (default: the OPENAPI_SCHEMA_FILE setting).')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.OPENAPI_SCHEMA_FILE
+        content = generate_schema()
+        # Replaced in one step, so running workers never read half a file
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+        self.stdout.write(self.style.SUCCESS(f'Wrote the OpenAPI schema to {path} ({len(content)} bytes).'))
@@ -0,0 +1,282 @@
+"""
+Per-view request metrics, exported in the Prometheus text format.
+
+MetricsMiddleware times every request and counts the SQL queries it runs
+and their duration. Each thread aggregates into its own series, so the
+request path takes no locks; /api/metrics sums the threads' series when
+it is scraped. A scrape can therefore see a request half recorded, which
+the next scrape corrects. Counts are per process, like the product cache
+stats, so scrape every worker. Only staff and holders of
+settings.METRICS_TOKEN may read them.
+"""
+import bisect
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Series:
+    __slots__ = ('buckets', 'count', 'sum', 'queries', 'query_time', 'statuses')
+
+    def __init__(self):
+        # Non-cumulative; the last slot is +Inf
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.statuses = {}
+
+
+# Plain counters recorded with count(), by name, with their help text
+COUNTERS = {
+    'admission_decisions_total': 'Write requests admitted or rejected by rate limits and the concurrency cap.',
+}
+
+_shards = []
+_counter_shards = []
+_local = threading.local()
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        # list.append is atomic, and shards are never removed, so counters
+        # from threads that have exited stay in the totals
+        _shards.append(shard)
+        return shard
+
+
+def _counter_shard():
+    try:
+        return _local.counters
+    except AttributeError:
+        shard = _local.counters = {}
+        _counter_shards.append(shard)
+        return shard
+
+
+def count(name, value=1, **labels):
+    """Add `value` to the counter `name` with these labels."""
+    shard = _counter_shard()
+    key = (name, tuple(labels.items()))
+    shard[key] = shard.get(key, 0) + value
+
+
+def collect_counters():
+    """Return {(name, labels): value} summed over every thread."""
+    totals = {}
+    for shard in list(_counter_shards):
+        for key, value in list(shard.items()):
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def observe(view, method, status, duration, queries=0, query_time=0.0):
+    """Record one request in the calling thread's series."""
+    shard = _shard()
+    series = shard.get((view, method))
+    if series is None:
+        series = shard[(view, method)] = Series()
+    series.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+    series.count += 1
+    series.sum += duration
+    series.queries += queries
+    series.query_time += query_time
+    status_class = f'{status // 100}xx'
+    series.statuses[status_class] = series.statuses.get(status_class, 0) + 1
+
+
+def collect():
+    """Return {(view, method): Series} summed over every thread."""
+    totals = {}
+    for shard in list(_shards):
+        for key, series in list(shard.items()):
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = Series()
+            for i, count in enumerate(series.buckets):
+                total.buckets[i] += count
+            total.count += series.count
+            total.sum += series.sum
+            total.queries += series.queries
+            total.query_time += series.query_time
+            for status, count in list(series.statuses.items()):
+                total.statuses[status] = total.statuses.get(status, 0) + count
+    return totals
+
+
+def reset():
+    """Forget every recorded request."""
+    for shard in list(_shards) + list(_counter_shards):
+        shard.clear()
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render():
+    """Render the collected metrics in the Prometheus text exposition format."""
+    totals = sorted(collect().items())
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by view.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (view, method), series in totals:
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), series.buckets):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{_labels(view=view, method=method, le=bound)} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{_labels(view=view, method=method)} {series.sum}')
+        lines.append(f'http_request_duration_seconds_count{_labels(view=view, method=method)} {series.count}')
+
+    lines += ['# HELP http_requests_total Requests by view and status class.', '# TYPE http_requests_total counter']
+    for (view, method), series in totals:
+        for status, count in sorted(series.statuses.items()):
+            lines.append(f'http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+    lines += ['# HELP db_queries_total SQL queries run by view.', '# TYPE db_queries_total counter']
+    for (view, method), series in totals:
+        lines.append(f'db_queries_total{_labels(view=view, method=method)} {series.queries}')
+
+    lines += [
+        '# HELP db_query_duration_seconds_total Time spent in SQL queries by view.',
+        '# TYPE db_query_duration_seconds_total counter',
+    ]
+    for (view, method), series in totals:
+        lines.append(f'db_query_duration_seconds_total{_labels(view=view, method=method)} {series.query_time}')
+
+    counters = sorted(collect_counters().items())
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for (counter, labels), value in counters:
+            if counter == name:
+                lines.append(f'{name}{_labels(**dict(labels))} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryStats:
+    __slots__ = ('count', 'time')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+
+# The stats of the request being handled. Context variables follow the
+# request into sync_to_async threads, so async views are counted too.
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.time += time.perf_counter() - started
+        stats.count += 1
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Installed once per connection rather than per request; reconnects
+    # fire the signal again on the same wrapper. Inserted first, since
+    # connection.execute_wrapper() pops the last wrapper when it exits.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+class MetricsMiddleware:
+    """
+    Record each request's latency, SQL query count and query time against
+    its view, and report them to the client in a Server-Timing header.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(None, connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        stats = QueryStats()
+        token = _request_queries.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        return self.finish(request, response, started, stats)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        stats = QueryStats()
+        token = _request_queries.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        return self.finish(request, response, started, stats)
+
+    def finish(self, request, response, started, stats):
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = (match.view_name or match.route) if match else 'unmatched'
+        observe(view, request.method, response.status_code, duration, stats.count, stats.time)
+        response['Server-Timing'] = (
+            f'app;dur={duration * 1000:.2f}, db;dur={stats.time * 1000:.2f};desc="{stats.count} queries"'
+        )
+        return response
+
+
+def may_scrape(request):
+    """
+    Whether the request sends settings.METRICS_TOKEN as a bearer token, or
+    authenticates as a staff user the way the API views do.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return True
+    request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return bool(request.user.is_staff)
+    except APIException:
+        return False
+
+
+@require_safe
+def metrics_view(request):
+    if not may_scrape(request):
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(render(), content_type=PROMETHEUS_CONTENT_TYPE)
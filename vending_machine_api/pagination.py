@@ -0,0 +1,129 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from drf_yasg import openapi
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.response import Response
+
+# Query parameters accepted by list endpoints paginated with IdCursorPagination
+LIST_PARAMETERS = [
+    openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Opaque cursor from a previous page'),
+    openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Results per page (max 1000)'),
+    openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Comma separated fields to return'),
+]
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key, or on another field with the
+    primary key breaking ties.
+
+    Each page is a `(field, id) > cursor` range scan, so deep pages cost the
+    same as the first one given an index on (field, id). Cursors are opaque
+    and stay valid while rows are added.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def paginate(self, queryset, request, view, serializer_class, fields=None):
+        """Return the paginated response for one page of `queryset`."""
+        queryset = self._window(queryset, request, fields)
+        representation = serializer_class.values_representation(fields)
+        if representation is None:
+            page, next_link, previous_link = self._page(list(queryset))
+            results = serializer_class(page, many=True, fields=fields).data
+        else:
+            page, next_link, previous_link = self._page(list(representation.values(queryset, self.field, 'id')))
+            results = [representation.to_dict(row) for row in page]
+        return Response({'next': next_link, 'previous': previous_link, 'results': results})
+
+    async def apaginate(self, queryset, request, serializer_class, fields=None):
+        """
+        Async counterpart of paginate() built on the async ORM.
+
+        `request` must be a DRF Request. Returns the page as a dict in the
+        same shape, with cursors that are interchangeable with paginate()'s.
+        """
+        queryset = self._window(queryset, request, fields)
+        representation = serializer_class.values_representation(fields)
+        if representation is None:
+            page, next_link, previous_link = self._page([obj async for obj in queryset])
+            results = serializer_class(page, many=True, fields=fields).data
+        else:
+            page, next_link, previous_link = self._page([row async for row in representation.values(queryset, self.field, 'id')])
+            results = [representation.to_dict(row) for row in page]
+        return {'next': next_link, 'previous': previous_link, 'results': results}
+
+    def page(self, queryset, request, *fields):
+        """
+        One page of values_list(*fields) rows of `queryset`, for views that
+        build their results themselves, with its next and previous links.
+        Each row ends with the ordering field and id.
+        """
+        queryset = self._window(queryset, request, None)
+        return self._page(list(queryset.values_list(*fields, self.field, 'id')))
+
+    def _window(self, queryset, request, fields):
+        """Order `queryset` and cut it down to the rows of the requested page."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        self.field = self.ordering.lstrip('-')
+        reverse = self.cursor is not None and self.cursor.reverse
+        descending = self.ordering.startswith('-') != reverse
+
+        if fields is not None:
+            queryset = queryset.only(*fields, self.field)
+        keys = ['id'] if self.field == 'id' else [self.field, 'id']
+        queryset = queryset.order_by(*(f'-{key}' if descending else key for key in keys))
+        if self.cursor is not None and self.cursor.position is not None:
+            value, pk = self._parse_position(queryset.model, self.cursor.position)
+            after = 'lt' if descending else 'gt'
+            if self.field == 'id':
+                queryset = queryset.filter(**{f'id__{after}': pk})
+            else:
+                # The leading inclusive bound is what makes it a range scan
+                queryset = queryset.filter(**{f'{self.field}__{after}e': value}).filter(
+                    Q(**{f'{self.field}__{after}': value}) | Q(**{f'id__{after}': pk})
+                )
+        return queryset[:self.page_size + 1]
+
+    def _page(self, rows):
+        reverse = self.cursor is not None and self.cursor.reverse
+        has_more = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        if reverse:
+            page.reverse()
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else self.cursor is not None
+
+        next_link = previous_link = None
+        if page and has_next:
+            next_link = self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(page[-1])))
+        if page and has_previous:
+            previous_link = self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(page[0])))
+        return page, next_link, previous_link
+
+    def _position(self, row):
+        # Rows are model instances, or values_list() rows ending in the
+        # ordering field and id
+        value, pk = (row[-2], row[-1]) if isinstance(row, tuple) else (getattr(row, self.field), row.id)
+        if self.field == 'id':
+            return pk
+        return f'{value}|{pk}'
+
+    def _parse_position(self, model, position):
+        try:
+            if self.field == 'id':
+                return None, int(position)
+            value, pk = position.rsplit('|', 1)
+            return model._meta.get_field(self.field).to_python(value), int(pk)
+        except (ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
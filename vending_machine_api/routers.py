@@ -0,0 +1,69 @@
+"""
+Send the reads of read-only views to a replica database.
+
+Views opt in with @read_from_replica. The reads they run go to one of the
+aliases in settings.DATABASE_REPLICAS, picked at random per request. If
+the request writes anything, its later reads go back to the primary, so it
+always sees its own writes. Everything else, and all writes, use the
+primary ('default').
+
+Views that answer with a catalog ETag or go through the product cache
+don't opt in: the versions behind those are bumped on the primary, and a
+lagging replica would pair a current version with old rows.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+class _ReplicaRead:
+    __slots__ = ('alias', 'wrote')
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.wrote = False
+
+
+_replica_read = ContextVar('replica_read', default=None)
+
+
+def read_from_replica(view_method):
+    """Route the reads of this view method to a replica, when there is one."""
+    @wraps(view_method)
+    def wrapper(*args, **kwargs):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            return view_method(*args, **kwargs)
+        token = _replica_read.set(_ReplicaRead(random.choice(replicas)))
+        try:
+            return view_method(*args, **kwargs)
+        finally:
+            _replica_read.reset(token)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _replica_read.get()
+        if state is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _replica_read.get()
+        if state is not None:
+            state.wrote = True
+        # Explicitly, or saving an object read from a replica would write
+        # to the replica it came from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
@@ -0,0 +1,87 @@
+from functools import lru_cache
+from rest_framework import serializers
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an extra `fields` argument naming the
+    subset of fields to serialize.
+    """
+
+    # Set to {field name: values() lookup} to let list endpoints serialize
+    # values_list() rows instead of model instances (see ValuesRepresentation).
+    # Fields not listed are read from their own source.
+    values_lookups = None
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        """
+        Parse the comma separated `fields` query parameter.
+
+        Returns None when the parameter is absent, so every field is used.
+        """
+        raw = request.GET.get('fields')
+        if not raw:
+            return None
+        requested = [name.strip() for name in raw.split(',') if name.strip()]
+        readable = [name for name, field in cls().fields.items() if not field.write_only]
+        unknown = [name for name in requested if name not in readable]
+        if unknown or not requested:
+            raise serializers.ValidationError({'fields': f'Choose from: {", ".join(readable)}.'})
+        return requested
+
+    @classmethod
+    def values_representation(cls, fields=None):
+        """Return the ValuesRepresentation of these fields, or None if the serializer has none."""
+        if cls.values_lookups is None:
+            return None
+        return _values_representation(cls, None if fields is None else tuple(fields))
+
+
+@lru_cache(maxsize=128)
+def _values_representation(serializer_class, fields):
+    return ValuesRepresentation(serializer_class(fields=fields))
+
+
+class ValuesRepresentation:
+    """
+    Turns values_list() rows into the dicts a serializer's to_representation()
+    would return for the same rows, skipping model instances and the
+    serializer's per-field attribute lookups.
+
+    Fields whose to_representation() returns database values unchanged are
+    copied as they are; the rest, such as decimals, still go through their
+    serializer field.
+    """
+    # Fields that represent the values the database returns for them as is
+    PASSTHROUGH = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+    def __init__(self, serializer):
+        readable = [(name, field) for name, field in serializer.fields.items() if not field.write_only]
+        self.names = [name for name, _ in readable]
+        self.lookups = [serializer.values_lookups.get(name, field.source) for name, field in readable]
+        self.converters = [(name, self._converter(field)) for name, field in readable if self._converter(field)]
+
+    def _converter(self, field):
+        # values_list() already gives a related object's primary key
+        if isinstance(field, serializers.RelatedField) or type(field) in self.PASSTHROUGH:
+            return None
+        return field.to_representation
+
+    def values(self, queryset, *extra):
+        """values_list() of `queryset` with these fields, then any `extra` lookups."""
+        return queryset.values_list(*self.lookups, *extra)
+
+    def to_dict(self, row):
+        data = dict(zip(self.names, row))
+        for name, converter in self.converters:
+            if data[name] is not None:
+                data[name] = converter(data[name])
+        return data
@@ -41,15 +41,50 @@ INSTALLED_APPS = [
     'rest_framework',
     'users',
     'products',
+    'machines',
+    'orders',
+    'jobs',
+    # Project-wide management commands: sync_sqlite_replicas, generate_openapi_schema
+    'vending_machine_api',
     'drf_yasg',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Trusts the role and username claims until the token expires
+        'users.authentication.StatelessJWTAuthentication',
+    ],
+    # Same bytes as DRF's JSONRenderer, encoded with orjson when installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'vending_machine_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Only limits views with a throttle_scope listed in THROTTLE_RATES
+    'DEFAULT_THROTTLE_CLASSES': [
+        'vending_machine_api.throttling.TokenBucketThrottle',
     ],
 }
 
+# Per user token buckets for the write endpoints: `burst` requests at once,
+# refilled at `rate` per second. Swap the BACKEND for
+# 'vending_machine_api.throttling.DjangoTokenBuckets' (OPTIONS: alias) to
+# share the buckets between worker processes.
+THROTTLE_BACKEND = {
+    'BACKEND': 'vending_machine_api.throttling.LocalTokenBuckets',
+    'OPTIONS': {
+        'max_entries': 100000,
+    },
+}
+THROTTLE_RATES = {
+    'deposit': {'rate': 5, 'burst': 20},
+    'buy': {'rate': 5, 'burst': 20},
+    'checkout': {'rate': 2, 'burst': 10},
+}
+
+# Write requests (anything but GET, HEAD, OPTIONS and TRACE) each process
+# handles at once; more are refused with 429 rather than queued
+MAX_CONCURRENT_WRITES = 32
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),  #Expires after 60 minutes
 }
@@ -62,11 +97,17 @@ SWAGGER_SETTINGS = {
             "in": "header"
         }
     },
+    # The schema the docs load; see API_DOCS below
+    'SPEC_URL': 'openapi-schema',
 }
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    'vending_machine_api.metrics.MetricsMiddleware',
+    # Before anything else does work for a request it is about to refuse
+    'vending_machine_api.throttling.WriteConcurrencyMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -101,13 +142,118 @@ WSGI_APPLICATION = 'vending_machine_api.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# SQLite with WAL, so readers do not block the writer, and a busy timeout
+# instead of immediate "database is locked" errors. Connections are kept
+# open for DB_CONN_MAX_AGE seconds (0 closes them after every request).
+SQLITE_OPTIONS = {
+    'timeout': 5,
+    'pragmas': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+    },
+}
+CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'vending_machine_api.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas for the read-only views (see vending_machine_api.routers),
+# one alias per comma separated file in REPLICA_DATABASES. Locally,
+# `manage.py sync_sqlite_replicas` copies the primary over them.
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.getenv('REPLICA_DATABASES', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+# Machine partitions (see machines.partitions): comma separated
+# <machine id>=<file> pairs in MACHINE_DATABASES keep those machines' coins
+# and stock in their own database, one alias per file. Other machines stay
+# in default. Create the tables with `manage.py migrate --database <alias>`.
+MACHINE_DATABASES = {}
+_partition_aliases = {}
+for pair in filter(None, os.getenv('MACHINE_DATABASES', '').split(',')):
+    machine_id, name = pair.split('=', 1)
+    if name not in _partition_aliases:
+        _partition_aliases[name] = f'machines{len(_partition_aliases) + 1}'
+        DATABASES[_partition_aliases[name]] = {**DATABASES['default'], 'NAME': name}
+    MACHINE_DATABASES[int(machine_id)] = _partition_aliases[name]
+
+DATABASE_ROUTERS = [
+    'machines.partitions.MachinePartitionRouter',
+    'vending_machine_api.routers.ReplicaRouter',
+]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The product catalog version behind ETags lives here; use a shared backend
+# such as Redis or Memcached when running more than one worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Product lookup cache used by the product detail view. Swap BACKEND for
+# 'products.cache.DjangoProductCache' (OPTIONS: alias, timeout) to keep
+# entries in the cache above instead of in each worker process.
+PRODUCT_CACHE = {
+    'BACKEND': 'products.cache.LocalProductCache',
+    'OPTIONS': {
+        'max_entries': 10000,
+        'timeout': 30,
+    },
+}
+
+# Responses kept for Idempotency-Key retries of deposit, buy and checkout.
+# Use 'users.idempotency.DjangoIdempotencyStore' (OPTIONS: alias, timeout,
+# wait_timeout) to share them between worker processes.
+IDEMPOTENCY_STORE = {
+    'BACKEND': 'users.idempotency.LocalIdempotencyStore',
+    'OPTIONS': {
+        'max_entries': 10000,
+        'timeout': 24 * 60 * 60,
+        'wait_timeout': 30,
+    },
+}
+
+# Largest amount, in cents, the change table precomputes; a larger balance
+# is paid out up to this and the rest stays as deposit.
+CHANGE_TABLE_MAX_AMOUNT = 10000
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+# New passwords are hashed with the first hasher. Passwords stored with
+# another one, or with another PASSWORD_HASHER_ITERATIONS, are rehashed on
+# login. Unset, the iterations are Django's default for its version.
+
+PASSWORD_HASHERS = [
+    'users.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASHER_ITERATIONS = int(os.getenv('PASSWORD_HASHER_ITERATIONS', 0)) or None
+
+# Threads checking passwords for /api/async/users/login/, and how many
+# logins may be checked or waiting at once before the rest get a 429
+PASSWORD_HASHING_WORKERS = int(os.getenv('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+MAX_PENDING_LOGINS = 64
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -145,6 +291,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# API docs. The schema they serve is generated ahead of time with
+# `manage.py generate_openapi_schema`; set API_DOCS=false to turn them off
+API_DOCS = os.getenv('API_DOCS', 'true').lower() in ('1', 'true', 'yes')
+OPENAPI_SCHEMA_FILE = BASE_DIR / 'openapi.json'
+REDOC_SETTINGS = {'SPEC_URL': 'openapi-schema'}
+
+# /api/metrics is served to staff users' access tokens, and to scrapers
+# sending this as a bearer token; unset, only staff can read it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -0,0 +1,21 @@
+"""
+SQLite backend that sets PRAGMAs on every new connection.
+
+OPTIONS['pragmas'] maps PRAGMA names to values, e.g. {'journal_mode':
+'WAL'}; the rest of OPTIONS goes to sqlite3.connect() as usual, so the
+busy timeout is OPTIONS['timeout'], in seconds.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
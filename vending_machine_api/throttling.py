@@ -0,0 +1,217 @@
+"""
+Admission control for the write endpoints.
+
+SQLite runs one write at a time, so a burst of deposits and purchases
+queues behind it and slows every client down. Two limits keep the queue
+short:
+
+- TokenBucketThrottle, a DRF throttle, gives each user a bucket of
+  requests per endpoint (the view's `throttle_scope`) that refills at a
+  steady rate.
+- The @throttle decorator applies the same buckets to the async-native
+  views, which DRF's throttling never sees.
+- WriteConcurrencyMiddleware caps the write requests a process handles at
+  once, and refuses the rest straight away rather than queueing them.
+
+Both refuse with 429 and a Retry-After header, and count their decisions
+in the admission_decisions_total metric.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from types import SimpleNamespace
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+from . import metrics
+from .asyncapi import json_response
+
+DEFAULT_THROTTLE_BACKEND = {
+    'BACKEND': 'vending_machine_api.throttling.LocalTokenBuckets',
+    'OPTIONS': {},
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class LocalTokenBuckets:
+    """
+    In-process token buckets, at most `max_entries` of them.
+
+    Each bucket is kept as the time it will next be full (GCRA), so taking
+    a token is one comparison. Buckets dropped least recently used first
+    once the limit is reached are full again when next used.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._full_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take a token; returns 0, or the seconds until one is available."""
+        interval = 1 / rate
+        with self._lock:
+            now = time.monotonic()
+            full_at = max(self._full_at.get(key, now), now)
+            wait = full_at - now - (burst - 1) * interval
+            if wait > 0:
+                return wait
+            self._full_at[key] = full_at + interval
+            self._full_at.move_to_end(key)
+            while len(self._full_at) > self.max_entries:
+                self._full_at.popitem(last=False)
+            return 0
+
+
+class DjangoTokenBuckets:
+    """
+    Token buckets kept in one of Django's CACHES aliases, shared by all
+    workers given a shared backend.
+
+    Django's cache API has no compare-and-set, so workers taking a token
+    from the same bucket at the same moment can both succeed; a bucket may
+    let a few more requests through than its burst under such races.
+    """
+
+    def __init__(self, alias='default', key_prefix='throttle'):
+        self.cache = caches[alias]
+        self.key_prefix = key_prefix
+
+    def take(self, key, rate, burst):
+        interval = 1 / rate
+        cache_key = f'{self.key_prefix}:{hashlib.sha256(key.encode()).hexdigest()}'
+        now = time.time()
+        full_at = max(self.cache.get(cache_key, now), now)
+        wait = full_at - now - (burst - 1) * interval
+        if wait > 0:
+            return wait
+        self.cache.set(cache_key, full_at + interval, math.ceil(full_at + interval - now) + 1)
+        return 0
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_token_buckets():
+    """Return the process-wide buckets configured by settings.THROTTLE_BACKEND."""
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                config = getattr(settings, 'THROTTLE_BACKEND', DEFAULT_THROTTLE_BACKEND)
+                _buckets = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Limit each user, or each client address when anonymous, to the rate in
+    settings.THROTTLE_RATES for the view's `throttle_scope`: a
+    {'rate': requests per second, 'burst': bucket size} dict. Scopes with
+    no rate, and safe methods, are not limited.
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        limit = getattr(settings, 'THROTTLE_RATES', {}).get(scope)
+        if limit is None or request.method in SAFE_METHODS:
+            return True
+        ident = request.user.id if request.user and request.user.is_authenticated else self.get_ident(request)
+        self.retry_after = get_token_buckets().take(f'{scope}:{ident}', limit['rate'], limit['burst'])
+        decision = 'rate_limited' if self.retry_after else 'admitted'
+        metrics.count('admission_decisions_total', scope=scope, decision=decision)
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+def throttle(scope):
+    """
+    Apply TokenBucketThrottle under `scope` to an async-native view, with
+    the same response as DRF's. The buckets are shared with the DRF views
+    of that scope. request.user must be set by then for the user's bucket
+    to be used. The buckets may be in a cache, so they're taken off the
+    event loop.
+    """
+    def decorator(view_func):
+        view = SimpleNamespace(throttle_scope=scope)
+
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            bucket = TokenBucketThrottle()
+            if not await sync_to_async(bucket.allow_request, thread_sensitive=False)(request, view):
+                error = Throttled(bucket.wait())
+                response = json_response({'detail': error.detail}, status=error.status_code)
+                response['Retry-After'] = str(error.wait)
+                return response
+            return await view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class WriteConcurrencyMiddleware:
+    """
+    Refuse write requests beyond settings.MAX_CONCURRENT_WRITES in flight
+    in this process with 429, instead of letting them queue for the
+    database. None disables the cap.
+    """
+    sync_capable = True
+    async_capable = True
+
+    # Seconds a refused client is told to wait; slots free up quickly
+    retry_after = 1
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        limit = getattr(settings, 'MAX_CONCURRENT_WRITES', None)
+        self.slots = threading.BoundedSemaphore(limit) if limit else None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.limits(request):
+            return self.get_response(request)
+        if not self.admit():
+            return self.refuse()
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
+
+    async def __acall__(self, request):
+        if not self.limits(request):
+            return await self.get_response(request)
+        if not self.admit():
+            return self.refuse()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.slots.release()
+
+    def limits(self, request):
+        return self.slots is not None and request.method not in SAFE_METHODS
+
+    def admit(self):
+        admitted = self.slots.acquire(blocking=False)
+        metrics.count('admission_decisions_total', scope='writes', decision='admitted' if admitted else 'shed')
+        return admitted
+
+    def refuse(self):
+        response = JsonResponse({'detail': 'Too many requests in progress, try again shortly.'}, status=429)
+        response['Retry-After'] = str(self.retry_after)
+        return response
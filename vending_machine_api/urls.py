@@ -14,14 +14,27 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path , include , re_path
-from .swagger import schema_view
+from .metrics import metrics_view
+from .docs import docs_view, openapi_schema
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/' , include('users.urls')),
     path('api/products/' , include('products.urls')),
-    path('api/docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    re_path('api/redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('api/orders/' , include('orders.urls')),
+    path('api/machines/' , include('machines.urls')),
+    # Async-native variants, best served by the ASGI application
+    path('api/async/users/' , include('users.async_urls')),
+    path('api/async/products/' , include('products.async_urls')),
+    path('api/metrics', metrics_view, name='metrics'),
 ]
+
+if settings.API_DOCS:
+    urlpatterns += [
+        path('api/openapi.json', openapi_schema, name='openapi-schema'),
+        path('api/docs/', docs_view('swagger'), name='schema-swagger-ui'),
+        re_path('api/redoc/', docs_view('redoc'), name='schema-redoc'),
+    ]